@@ -0,0 +1,16 @@
+{#
+  WHERE clause for incremental models in the fact_telegram chain.
+
+  On incremental runs only rows past the target's high-water mark are selected: rows
+  with a higher raw id (new messages, including backfilled history), plus rows posted
+  in the last incremental_lookback_days days before the newest loaded timestamp, so
+  view counts refreshed by the loaders are merged again. Full refreshes select all.
+#}
+{% macro incremental_watermark(id_column='id', timestamp_column='timestamp') %}
+  {% if is_incremental() %}
+  WHERE {{ id_column }} > (SELECT COALESCE(MAX({{ id_column }}), 0) FROM {{ this }})
+     OR {{ timestamp_column }} >= (
+          SELECT COALESCE(MAX({{ timestamp_column }}), CAST('1970-01-01' AS TIMESTAMP)) FROM {{ this }}
+        ) - INTERVAL '{{ var("incremental_lookback_days", 3) }} days'
+  {% endif %}
+{% endmacro %}
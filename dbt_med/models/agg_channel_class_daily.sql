@@ -0,0 +1,31 @@
+{{
+  config(
+    materialized='incremental',
+    unique_key=['channel', 'class_label', 'day'],
+    incremental_strategy='delete+insert',
+    indexes=[
+      {'columns': ['channel', 'class_label', 'day'], 'unique': True}
+    ]
+  )
+}}
+
+-- Detected class counts per channel and load day (detected_at). Incremental runs
+-- recompute whole (channel, class_label, day) groups from the last
+-- rollup_lookback_days days before the newest day aggregated. Loaders commit
+-- concurrently, so ids do not become visible in order; a detection committed late
+-- still falls inside the window and its group is rebuilt with it.
+
+SELECT
+  COALESCE(channel, 'unknown') AS channel,
+  class_label,
+  CAST(detected_at AS DATE) AS day,
+  COUNT(*) AS detections,
+  SUM(confidence) AS confidence_sum,
+  MAX(id) AS max_detection_id
+FROM {{ var('raw_schema', 'public') }}.yolo_detection_results
+{% if is_incremental() %}
+WHERE detected_at >= (
+  SELECT COALESCE(MAX(day), DATE '1970-01-01') - {{ var('rollup_lookback_days', 1) }} FROM {{ this }}
+)
+{% endif %}
+GROUP BY 1, 2, 3
@@ -0,0 +1,20 @@
+{{
+  config(
+    materialized='table',
+    indexes=[
+      {'columns': ['channel', 'class_label'], 'unique': True}
+    ]
+  )
+}}
+
+-- Detected class histogram per channel, summed from the incremental daily rollup
+-- agg_channel_class_daily, which is small enough to rebuild this table every run.
+
+SELECT
+  channel,
+  class_label,
+  SUM(detections) AS detections,
+  SUM(confidence_sum) AS confidence_sum,
+  MAX(max_detection_id) AS max_detection_id
+FROM {{ ref('agg_channel_class_daily') }}
+GROUP BY channel, class_label
@@ -1,12 +1,18 @@
 {{ 
   config(
-    materialized='table',
+    materialized='incremental',
+    incremental_strategy='merge',
     schema='analysis',
     partition_by={
       "field": "timestamp",
       "data_type": "timestamp"
     },
-    unique_key='id'
+    unique_key=['channel', 'message_id'],
+    indexes=[
+      {'columns': ['channel', 'message_id'], 'unique': True},
+      {'columns': ['id']},
+      {'columns': ['timestamp']}
+    ]
   ) 
 }}
 
@@ -21,6 +27,7 @@ WITH source_data AS (
     message_link,
     LENGTH(content) AS message_length
   FROM {{ ref('standardize_formats') }}
+  {{ incremental_watermark() }}
 )
 
 SELECT
@@ -33,13 +40,3 @@ SELECT
   message_link,
   message_length
 FROM source_data
-
-{% if is_incremental() %}
-
--- Remove duplicates for incremental load
-WHERE id NOT IN (
-    SELECT id
-    FROM {{ this }}
-)
-
-{% endif %}
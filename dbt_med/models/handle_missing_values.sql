@@ -1,3 +1,13 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key=['channel', 'message_id'],
+    indexes=[
+      {'columns': ['channel', 'message_id'], 'unique': True},
+      {'columns': ['id']},
+      {'columns': ['timestamp']}
+    ]
+) }}
 
 WITH filled_content AS (
     SELECT
@@ -9,6 +19,7 @@ WITH filled_content AS (
         timestamp,
         views
     FROM {{ ref('remove_duplicates') }}
+    {{ incremental_watermark() }}
 ),
 
 cleaned_data AS (
@@ -1,18 +1,17 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key=['channel', 'message_id'],
+    indexes=[
+      {'columns': ['channel', 'message_id'], 'unique': True},
+      {'columns': ['id']},
+      {'columns': ['timestamp']}
+    ]
+) }}
 
-WITH ranked_messages AS (
-    SELECT
-        id,
-        channel,
-        message_id,
-        content,
-        message_link,
-        timestamp,
-        views,
-        ROW_NUMBER() OVER (PARTITION BY message_id ORDER BY timestamp DESC) AS row_num
-    FROM {{ ref('telegram_messages') }}
-)
-
-SELECT
+-- Keep the latest row per (channel, message_id). DISTINCT ON sorts or hashes only
+-- the rows selected by the watermark, instead of numbering every row of a window.
+SELECT DISTINCT ON (channel, message_id)
     id,
     channel,
     message_id,
@@ -20,5 +19,6 @@ SELECT
     message_link,
     timestamp,
     views
-FROM ranked_messages
-WHERE row_num = 1
+FROM {{ ref('telegram_messages') }}
+{{ incremental_watermark() }}
+ORDER BY channel, message_id, timestamp DESC
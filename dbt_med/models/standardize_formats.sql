@@ -1,3 +1,13 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key=['channel', 'message_id'],
+    indexes=[
+      {'columns': ['channel', 'message_id'], 'unique': True},
+      {'columns': ['id']},
+      {'columns': ['timestamp']}
+    ]
+) }}
 
 SELECT
   id,
@@ -8,4 +18,5 @@ SELECT
   COALESCE(message_link, 'n/a') AS message_link,
   COALESCE(views, 0) AS views
 FROM
-  {{ ref('handle_missing_values') }}
\ No newline at end of file
+  {{ ref('handle_missing_values') }}
+{{ incremental_watermark() }}
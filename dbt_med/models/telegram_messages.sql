@@ -1,11 +1,17 @@
 {{ config(
-    materialized='table',
+    materialized='incremental',
+    incremental_strategy='merge',
     schema='analysis',
     partition_by={
       "field": "timestamp",
       "data_type": "timestamp"
     },
-    unique_key='id'
+    unique_key='id',
+    indexes=[
+      {'columns': ['id'], 'unique': True},
+      {'columns': ['channel', 'message_id', 'timestamp']},
+      {'columns': ['timestamp']}
+    ]
 ) }}
 
 SELECT
@@ -17,4 +23,5 @@ SELECT
   views,
   message_link
 FROM
-  public.telegram_messages
+  {{ var('raw_schema', 'public') }}.telegram_messages
+{{ incremental_watermark() }}
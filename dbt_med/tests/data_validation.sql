@@ -3,20 +3,14 @@
     materialized='test'
 ) }}
 
-WITH source_data AS (
-  SELECT
-    id,
-    channel,
-    message_id,
-    content,
-    timestamp,
-    views,
-    message_link,
-    message_length
-  FROM {{ ref('fact_telegram') }}
-),
+-- Single pass over fact_telegram: one regex per row for unexpected characters or
+-- upper case, a window count for duplicate ids and plain NULL checks. Set the
+-- validate_from_id var to check only rows loaded after that id. The duplicate check
+-- stays complete under that filter: it is on id itself, so every row sharing an id
+-- falls on the same side of the boundary and is counted. Rows at or below the
+-- boundary are not checked at all; run without the var to validate the whole table.
 
-validation_checks AS (
+WITH source_data AS (
   SELECT
     id,
     channel,
@@ -26,26 +20,21 @@ validation_checks AS (
     views,
     message_link,
     message_length,
-    REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(content, '!', ''), '@', ''), '#', ''), '$', ''), '%', ''), '^', '') AS cleaned_content,
-    LOWER(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(content, '!', ''), '@', ''), '#', ''), '$', ''), '%', ''), '^', '')) AS lowercased_content
-  FROM source_data
+    COUNT(*) OVER (PARTITION BY id) AS id_count
+  FROM {{ ref('fact_telegram') }}
+  {% if var('validate_from_id', none) is not none %}
+  WHERE id > {{ var('validate_from_id') }}
+  {% endif %}
 )
 
 SELECT
   *
-FROM validation_checks
+FROM source_data
 WHERE
-  -- Check for emojis or unexpected characters in content column
-  cleaned_content <> content
-  -- Check for lowercase content
-  OR lowercased_content <> content
+  -- Check for emojis or unexpected characters, and for upper case, in content
+  content ~ '[!@#$%^[:upper:]]'
   -- Check for unique row IDs
-  OR id IN (
-    SELECT id
-    FROM validation_checks
-    GROUP BY id
-    HAVING COUNT(*) > 1
-  )
+  OR id_count > 1
   -- Check for NULL values
   OR id IS NULL
   OR channel IS NULL
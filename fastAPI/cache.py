@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+from fastapi import Request, Response
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps an LRU in each API process, "redis" shares entries and invalidations
+# across processes through REDIS_URL, "none" disables caching (ETags are still sent)
+CACHE_BACKEND = os.getenv("API_CACHE_BACKEND", "memory")
+# Seconds a cached response stays valid; writes through the API invalidate it sooner
+CACHE_TTL = int(os.getenv("API_CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "1024"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryBackend:
+    """In-process LRU with a TTL per entry."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+
+class RedisBackend:
+    """
+    Backend for any Redis-compatible client (redis-py, fakeredis, a Valkey or KeyDB server).
+
+    Generations live in Redis too, so a write handled by one API process invalidates
+    the entries cached by every other process.
+    """
+
+    def __init__(self, client, prefix="api-cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def generation(self, namespace):
+        return int(self.client.get(f"{self.prefix}generation:{namespace}") or 0)
+
+    def bump(self, namespace):
+        self.client.incr(f"{self.prefix}generation:{namespace}")
+
+
+class ResponseCache:
+    """
+    Cache serialized JSON responses of read endpoints, keyed by path and query string.
+
+    Keys include a per-namespace generation number; invalidate() bumps it, so every
+    entry cached for that namespace is skipped at once without scanning the backend.
+    Responses carry an ETag, and a matching If-None-Match gets 304 Not Modified.
+    """
+
+    def __init__(self, backend=None, ttl=CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, request: Request, namespace: str):
+        if self.backend is None:
+            return None
+        try:
+            generation = self.backend.generation(namespace)
+        except Exception as e:
+            logger.warning(f"Cache unavailable, serving {namespace} uncached: {e}")
+            return None
+        query = urlencode(sorted(request.query_params.multi_items()))
+        return f"{namespace}:{generation}:{request.url.path}?{query}"
+
+    def lookup(self, request: Request, namespace: str):
+        """Return (key, cached Response or None) for a read request."""
+        key = self.key(request, namespace)
+        if key is None:
+            return None, None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return key, None
+        if value is None:
+            return key, None
+        entry = json.loads(value)
+        return key, self._response(request, entry["body"].encode(), entry["etag"], entry["headers"], "HIT")
+
+    def respond(self, request: Request, key, payload, headers=None):
+        """Serialize payload, store it under key and return the response."""
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        headers = {name: value for name, value in (headers or {}).items() if value is not None}
+        if key is not None:
+            try:
+                self.backend.set(key, json.dumps({"body": body.decode(), "etag": etag, "headers": headers}), self.ttl)
+            except Exception as e:
+                logger.warning(f"Cache write failed for {key}: {e}")
+        return self._response(request, body, etag, headers, "MISS")
+
+    def invalidate(self, *namespaces):
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            try:
+                self.backend.bump(namespace)
+            except Exception as e:
+                logger.error(f"Cache invalidation failed for {namespace}: {e}")
+
+    @staticmethod
+    def _response(request, body, etag, headers, status):
+        # no-cache: clients may keep the body but must revalidate it with If-None-Match
+        headers = dict(headers, ETag=etag, **{"Cache-Control": "no-cache", "X-Cache": status})
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+def build_cache(backend_name=CACHE_BACKEND):
+    if backend_name == "none":
+        return ResponseCache(None)
+    if backend_name == "redis":
+        import redis
+
+        return ResponseCache(RedisBackend(redis.Redis.from_url(REDIS_URL)))
+    return ResponseCache(MemoryBackend())
+
+
+response_cache = build_cache()
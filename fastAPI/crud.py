@@ -1,8 +1,38 @@
+import os
+import base64
+from datetime import date, datetime
+from sqlalchemy import Float, and_, cast, column, desc, func, insert, literal, literal_column, null, select, table, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from models import DetectionResult, TelegramMessage
+from models import ChannelClassCounts, ChannelDailyStats, DetectionResult, TelegramMessage
 from schemas import DetectionResultCreate, TelegramMessageCreate, TelegramMessageUpdate
 
+# Search ranks the newest matches up to this many; a common word on millions of messages
+# would otherwise rank every matching row on each request
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "10000"))
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page as an opaque cursor string."""
+    raw = "|".join(value.isoformat() if isinstance(value, datetime) else str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str, order_by: str = "id"):
+    """Decode a cursor produced by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        if order_by == "timestamp":
+            timestamp, last_id = parts
+            return datetime.fromisoformat(timestamp), int(last_id)
+        if order_by == "rank":
+            rank, last_id = parts
+            return float(rank), int(last_id)
+        (last_id,) = parts
+        return (int(last_id),)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
 def get_all_telegram_messages(db: Session):
     try:
         return db.query(TelegramMessage).all()
@@ -17,6 +47,205 @@ def get_all_detection_results(db: Session):
         print(f"Error fetching detection results: {e}")
         return []
 
+def messages_with_detections(class_label: int = None, min_confidence: float = None):
+    """
+    Select the distinct (channel, message_id) pairs that have a matching detection.
+
+    Served from the covering (class_label, confidence) INCLUDE (channel, message_id)
+    index without touching the detection rows themselves.
+    """
+    query = select(DetectionResult.channel, DetectionResult.message_id).where(DetectionResult.message_id.isnot(None))
+    if class_label is not None:
+        query = query.where(DetectionResult.class_label == class_label)
+    if min_confidence is not None:
+        query = query.where(DetectionResult.confidence >= min_confidence)
+    return query.distinct()
+
+def telegram_messages_page_query(limit: int = 100, cursor: str = None, channel: str = None,
+                                 start_time: datetime = None, end_time: datetime = None, order_by: str = "id",
+                                 class_label: int = None, min_confidence: float = None):
+    """
+    Build the keyset page select shared by the sync and async readers (fetches limit + 1 rows).
+
+    When class_label or min_confidence is given, only messages whose image has a
+    detection of that class at or above that confidence are returned.
+    """
+    if order_by not in ("id", "timestamp"):
+        raise ValueError(f"Unsupported order_by: {order_by}")
+    query = select(TelegramMessage)
+    if class_label is not None or min_confidence is not None:
+        matching = messages_with_detections(class_label, min_confidence).subquery()
+        query = query.join(matching, and_(TelegramMessage.channel == matching.c.channel,
+                                          TelegramMessage.message_id == matching.c.message_id))
+    if channel is not None:
+        query = query.where(TelegramMessage.channel == channel)
+    if start_time is not None:
+        query = query.where(TelegramMessage.timestamp >= start_time)
+    if end_time is not None:
+        query = query.where(TelegramMessage.timestamp < end_time)
+
+    if order_by == "timestamp":
+        query = query.where(TelegramMessage.timestamp.isnot(None))
+        if cursor:
+            query = query.where(tuple_(TelegramMessage.timestamp, TelegramMessage.id) > decode_cursor(cursor, order_by))
+        query = query.order_by(TelegramMessage.timestamp, TelegramMessage.id)
+    else:
+        if cursor:
+            query = query.where(TelegramMessage.id > decode_cursor(cursor)[0])
+        query = query.order_by(TelegramMessage.id)
+
+    # One extra row tells us whether another page exists
+    return query.limit(limit + 1)
+
+def telegram_messages_page(rows, limit: int, order_by: str = "id"):
+    """Split limit + 1 fetched rows into (items, next_cursor)."""
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.timestamp, last.id) if order_by == "timestamp" else encode_cursor(last.id)
+    return items, next_cursor
+
+def get_telegram_messages(db: Session, limit: int = 100, cursor: str = None, channel: str = None,
+                          start_time: datetime = None, end_time: datetime = None, order_by: str = "id",
+                          class_label: int = None, min_confidence: float = None):
+    """
+    Return one keyset-paginated page of telegram messages and the cursor of the next page.
+
+    Pages are ordered by id, or by (timestamp, id) when order_by is "timestamp"; rows
+    without a timestamp are skipped in that order. Each page seeks past the previous
+    cursor through the matching index instead of counting an OFFSET, so latency does
+    not grow with the page number. The next cursor is None on the last page.
+    """
+    query = telegram_messages_page_query(limit, cursor, channel, start_time, end_time, order_by,
+                                         class_label, min_confidence)
+    rows = db.execute(query).scalars().all()
+    return telegram_messages_page(rows, limit, order_by)
+
+def detection_results_page_query(limit: int = 100, cursor: str = None, class_label: int = None,
+                                 min_confidence: float = None, channel: str = None, message_id: int = None):
+    """Build the keyset page select for detection results (fetches limit + 1 rows)."""
+    query = select(DetectionResult)
+    if channel is not None:
+        query = query.where(DetectionResult.channel == channel)
+    if message_id is not None:
+        query = query.where(DetectionResult.message_id == message_id)
+    if class_label is not None:
+        query = query.where(DetectionResult.class_label == class_label)
+    if min_confidence is not None:
+        query = query.where(DetectionResult.confidence >= min_confidence)
+    if cursor:
+        query = query.where(DetectionResult.id > decode_cursor(cursor)[0])
+    return query.order_by(DetectionResult.id).limit(limit + 1)
+
+def detection_results_page(rows, limit: int):
+    """Split limit + 1 fetched rows into (items, next_cursor)."""
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1].id) if len(rows) > limit else None
+    return items, next_cursor
+
+def get_detection_results(db: Session, limit: int = 100, cursor: str = None, class_label: int = None,
+                          min_confidence: float = None, channel: str = None, message_id: int = None):
+    """Return one page of detection results ordered by id and the cursor of the next page."""
+    query = detection_results_page_query(limit, cursor, class_label, min_confidence, channel, message_id)
+    rows = db.execute(query).scalars().all()
+    return detection_results_page(rows, limit)
+
+def fts5_query(q: str, mode: str = "fts"):
+    """Quote user input as FTS5 phrases: every word for "fts", the whole text for "trigram"."""
+    phrases = q.split() if mode == "fts" else [q]
+    return " ".join('"' + phrase.replace('"', '""') + '"' for phrase in phrases)
+
+def search_candidates_query(dialect: str, q: str, mode: str = "fts", channel: str = None):
+    """
+    Select (id, rank) for the newest SEARCH_MAX_CANDIDATES messages matching q.
+
+    PostgreSQL matches the content_tsv GIN index with websearch syntax ("fts") or the
+    pg_trgm index by word similarity ("trigram"). SQLite uses the FTS5 word or trigram
+    table and ranks by bm25.
+    """
+    if mode not in ("fts", "trigram"):
+        raise ValueError(f"Unsupported search mode: {mode}")
+    if dialect == "sqlite":
+        name = "telegram_messages_fts" if mode == "fts" else "telegram_messages_trigram"
+        fts = table(name, column("rowid"))
+        query = (select(fts.c.rowid.label("id"), (-func.bm25(literal_column(name))).label("rank"))
+                 .where(literal_column(name).op("MATCH")(fts5_query(q, mode))))
+        if channel is not None:
+            query = query.join(TelegramMessage, TelegramMessage.id == fts.c.rowid).where(TelegramMessage.channel == channel)
+        return query.order_by(fts.c.rowid.desc()).limit(SEARCH_MAX_CANDIDATES)
+
+    if mode == "fts":
+        match = literal_column("content_tsv").op("@@")(func.websearch_to_tsquery("simple", q))
+    else:
+        match = literal(q).op("<%")(TelegramMessage.content)
+    candidates = select(TelegramMessage.id).where(match)
+    if channel is not None:
+        candidates = candidates.where(TelegramMessage.channel == channel)
+    candidates = candidates.order_by(TelegramMessage.id.desc()).limit(SEARCH_MAX_CANDIDATES).subquery()
+    # Ranked after the limit, so only the candidates' vectors are read
+    if mode == "fts":
+        rank = func.ts_rank_cd(literal_column("telegram_messages.content_tsv"), func.websearch_to_tsquery("simple", q))
+    else:
+        rank = func.word_similarity(q, TelegramMessage.content)
+    return select(TelegramMessage.id, cast(rank, Float).label("rank")).join(candidates, TelegramMessage.id == candidates.c.id)
+
+def search_telegram_messages(db: Session, q: str, mode: str = "fts", limit: int = 20, cursor: str = None,
+                             channel: str = None):
+    """
+    Return one page of (message, rank) pairs matching q, best rank first, and the
+    cursor of the next page.
+
+    Pages are keyset-paginated on (rank, id) like the list endpoints, so later pages
+    cost the same as the first.
+    """
+    ranked = search_candidates_query(db.bind.dialect.name, q, mode, channel).subquery()
+    query = select(TelegramMessage, ranked.c.rank).join(ranked, TelegramMessage.id == ranked.c.id)
+    if cursor:
+        query = query.where(tuple_(ranked.c.rank, ranked.c.id) < decode_cursor(cursor, "rank"))
+    query = query.order_by(ranked.c.rank.desc(), ranked.c.id.desc()).limit(limit + 1)
+    rows = db.execute(query).all()
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1].rank, items[-1][0].id) if len(rows) > limit else None
+    return items, next_cursor
+
+def stream_telegram_messages(connection, batch_size: int = 5000, channel: str = None,
+                             start_time: datetime = None, end_time: datetime = None):
+    """
+    Yield batches of raw telegram message rows ordered by id.
+
+    Runs a Core select on a server-side cursor, so rows are fetched batch_size at a
+    time and never hydrated into ORM objects.
+    """
+    table = TelegramMessage.__table__
+    query = select(table).order_by(table.c.id)
+    if channel is not None:
+        query = query.where(table.c.channel == channel)
+    if start_time is not None:
+        query = query.where(table.c.timestamp >= start_time)
+    if end_time is not None:
+        query = query.where(table.c.timestamp < end_time)
+    result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+    for rows in result.partitions():
+        yield rows
+
+def stream_detection_results(connection, batch_size: int = 5000, class_label: int = None,
+                             min_confidence: float = None, channel: str = None, message_id: int = None):
+    """Yield batches of raw detection result rows ordered by id from a server-side cursor."""
+    table = DetectionResult.__table__
+    query = select(table).order_by(table.c.id)
+    if channel is not None:
+        query = query.where(table.c.channel == channel)
+    if message_id is not None:
+        query = query.where(table.c.message_id == message_id)
+    if class_label is not None:
+        query = query.where(table.c.class_label == class_label)
+    if min_confidence is not None:
+        query = query.where(table.c.confidence >= min_confidence)
+    result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+    for rows in result.partitions():
+        yield rows
+
 def create_detection_result(db: Session, detection_result: DetectionResultCreate):
     try:
         db_detection_result = DetectionResult(**detection_result.dict(exclude_unset=True))
@@ -41,6 +270,69 @@ def create_telegram_message(db: Session, telegram_message: TelegramMessageCreate
         print(f"Error creating telegram message: {e}")
         return None
 
+def create_detection_results(db: Session, detection_results: list[DetectionResultCreate]):
+    """
+    Insert detection results with one multi-row INSERT in a single transaction.
+
+    Returns the new ids in input order, or None if the transaction failed.
+    """
+    if not detection_results:
+        return []
+    table = DetectionResult.__table__
+    try:
+        result = db.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            [detection_result.dict() for detection_result in detection_results],
+        )
+        ids = list(result.scalars())
+        db.commit()
+        return ids
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Error creating detection results: {e}")
+        return None
+
+def _dialect_insert(db: Session):
+    """Return the dialect-specific insert construct that supports ON CONFLICT."""
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+def create_telegram_messages(db: Session, telegram_messages: list[TelegramMessageCreate]):
+    """
+    Insert telegram messages with one multi-row INSERT in a single transaction.
+
+    Messages whose (channel, message_id) already exists, in the table or earlier in
+    the same batch, are skipped. Returns ids aligned with the input, None for skipped
+    messages, or None overall if the transaction failed.
+    """
+    if not telegram_messages:
+        return []
+    table = TelegramMessage.__table__
+    # No conflict target: a partitioned PostgreSQL table and the model enforce the natural
+    # key as (channel, message_id, timestamp), a table created before partitioning as
+    # (channel, message_id). Repeats within the batch are dropped here by (channel,
+    # message_id), so a repeat with another timestamp is skipped too.
+    unique = {}
+    for telegram_message in telegram_messages:
+        unique.setdefault((telegram_message.channel, telegram_message.message_id), telegram_message)
+    statement = (
+        _dialect_insert(db)(table)
+        .on_conflict_do_nothing()
+        .returning(table.c.id, table.c.channel, table.c.message_id)
+    )
+    try:
+        result = db.execute(statement, [telegram_message.dict() for telegram_message in unique.values()])
+        created = {(row.channel, row.message_id): row.id for row in result}
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Error creating telegram messages: {e}")
+        return None
+    ids = []
+    for telegram_message in telegram_messages:
+        # pop so a repeated key inside the batch is reported as skipped
+        ids.append(created.pop((telegram_message.channel, telegram_message.message_id), None))
+    return ids
+
 def update_telegram_message(db: Session, message_id: int, telegram_message_update: TelegramMessageUpdate):
     try:
         db_message = db.query(TelegramMessage).filter(TelegramMessage.id == message_id).first()
@@ -67,3 +359,113 @@ def delete_telegram_message(db: Session, message_id: int):
         db.rollback()
         print(f"Error deleting telegram message: {e}")
         return False
+
+def get_channel_daily_stats(db: Session, channel: str = None, start_date: date = None, end_date: date = None,
+                            limit: int = 366):
+    """
+    Read daily message counts and view sums from the agg_channel_daily rollup.
+
+    The rollup holds one row per channel and day, so the cost depends on the date
+    range asked for, not on the size of fact_telegram.
+    """
+    query = select(ChannelDailyStats)
+    if channel is not None:
+        query = query.where(ChannelDailyStats.channel == channel)
+    if start_date is not None:
+        query = query.where(ChannelDailyStats.day >= start_date)
+    if end_date is not None:
+        query = query.where(ChannelDailyStats.day <= end_date)
+    query = query.order_by(ChannelDailyStats.channel, ChannelDailyStats.day).limit(limit)
+    return db.execute(query).scalars().all()
+
+def get_class_histogram(db: Session, channel: str = None, limit: int = 100):
+    """
+    Read detection counts per class from the agg_channel_classes rollup, most
+    frequent first. Without a channel, counts are summed over all channels.
+    """
+    if channel is not None:
+        query = (
+            select(ChannelClassCounts.channel, ChannelClassCounts.class_label,
+                   ChannelClassCounts.detections, ChannelClassCounts.confidence_sum)
+            .where(ChannelClassCounts.channel == channel)
+        )
+    else:
+        query = (
+            select(null().label("channel"), ChannelClassCounts.class_label,
+                   func.sum(ChannelClassCounts.detections).label("detections"),
+                   func.sum(ChannelClassCounts.confidence_sum).label("confidence_sum"))
+            .group_by(ChannelClassCounts.class_label)
+        )
+    query = query.order_by(desc("detections"), "class_label").limit(limit)
+    return [
+        {"channel": row.channel, "class_label": row.class_label, "detections": row.detections,
+         "mean_confidence": row.confidence_sum / row.detections if row.detections else None}
+        for row in db.execute(query)
+    ]
+
+# Async counterparts used by the routes when API_DB_MODE=async
+
+async def get_telegram_messages_async(db: AsyncSession, limit: int = 100, cursor: str = None, channel: str = None,
+                                      start_time: datetime = None, end_time: datetime = None, order_by: str = "id",
+                                      class_label: int = None, min_confidence: float = None):
+    query = telegram_messages_page_query(limit, cursor, channel, start_time, end_time, order_by,
+                                         class_label, min_confidence)
+    rows = (await db.execute(query)).scalars().all()
+    return telegram_messages_page(rows, limit, order_by)
+
+async def get_detection_results_async(db: AsyncSession, limit: int = 100, cursor: str = None, class_label: int = None,
+                                      min_confidence: float = None, channel: str = None, message_id: int = None):
+    query = detection_results_page_query(limit, cursor, class_label, min_confidence, channel, message_id)
+    rows = (await db.execute(query)).scalars().all()
+    return detection_results_page(rows, limit)
+
+async def create_detection_result_async(db: AsyncSession, detection_result: DetectionResultCreate):
+    try:
+        db_detection_result = DetectionResult(**detection_result.dict(exclude_unset=True))
+        db.add(db_detection_result)
+        await db.commit()
+        await db.refresh(db_detection_result)
+        return db_detection_result
+    except SQLAlchemyError as e:
+        await db.rollback()
+        print(f"Error creating detection result: {e}")
+        return None
+
+async def create_telegram_message_async(db: AsyncSession, telegram_message: TelegramMessageCreate):
+    try:
+        db_telegram_message = TelegramMessage(**telegram_message.dict(exclude_unset=True))
+        db.add(db_telegram_message)
+        await db.commit()
+        await db.refresh(db_telegram_message)
+        return db_telegram_message
+    except SQLAlchemyError as e:
+        await db.rollback()
+        print(f"Error creating telegram message: {e}")
+        return None
+
+async def update_telegram_message_async(db: AsyncSession, message_id: int, telegram_message_update: TelegramMessageUpdate):
+    try:
+        db_message = await db.get(TelegramMessage, message_id)
+        if db_message:
+            for field, value in telegram_message_update.dict(exclude_unset=True).items():
+                setattr(db_message, field, value)
+            await db.commit()
+            return db_message
+        return None
+    except SQLAlchemyError as e:
+        await db.rollback()
+        print(f"Error updating telegram message: {e}")
+        return None
+
+async def delete_telegram_message_async(db: AsyncSession, message_id: int):
+    try:
+        telegram_message = await db.get(TelegramMessage, message_id)
+        if telegram_message:
+            await db.delete(telegram_message)
+            await db.commit()
+            return True
+        return False
+    except SQLAlchemyError as e:
+        await db.rollback()
+        print(f"Error deleting telegram message: {e}")
+        return False
@@ -1,9 +1,17 @@
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import sys
 from dotenv import load_dotenv
 
+# Pool settings are shared with the pipeline scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from db_pool import engine_options
+from profiling import log_slow_queries
+
 
 load_dotenv()
 
@@ -13,14 +21,62 @@ db_password = os.getenv('DB_PASSWORD')
 db_host = os.getenv('DB_HOST')
 db_name = os.getenv('DB_NAME')
 
-# Database URL for SQLAlchemy
-SQLALCHEMY_DATABASE_URL = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
+# Database URL for SQLAlchemy; DATABASE_URL overrides it, e.g. with a local SQLite file
+SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL', f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}")
+
+# Async driver URL for the same database (asyncpg for PostgreSQL, aiosqlite for SQLite)
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv(
+    'ASYNC_DATABASE_URL',
+    SQLALCHEMY_DATABASE_URL
+    .replace('postgresql://', 'postgresql+asyncpg://', 1)
+    .replace('sqlite://', 'sqlite+aiosqlite://', 1)
+)
+
 
+def _engine_kwargs(url):
+    # SQLite stand-ins use SQLAlchemy's default pool; the shared pool sizing applies to PostgreSQL
+    if url.startswith('sqlite'):
+        return {'connect_args': {'check_same_thread': False}}
+    return engine_options()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs(SQLALCHEMY_DATABASE_URL))
+# Statements slower than SLOW_QUERY_MS are logged with their plan
+log_slow_queries(engine)
+
+def pool_status(bound_engine):
+    """Connection counts of an engine's pool, in the terms of db_pool.pool_status."""
+    pool = bound_engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    options = engine_options()
+    return {
+        'min_size': options['pool_size'],
+        'max_size': options['pool_size'] + options['max_overflow'],
+        'in_use': pool.checkedout(),
+        'idle': pool.checkedin(),
+    }
 
 # database sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async engine is created on first use so the sync path works without an async driver installed
+_async_engine = None
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **_engine_kwargs(ASYNC_SQLALCHEMY_DATABASE_URL))
+        log_slow_queries(_async_engine.sync_engine)
+    return _async_engine
+
+
+# async database sessions, bound to get_async_engine() when opened
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 
 Base = declarative_base()
+
+# Rollup tables built by the dbt project; the API reads them but never creates them
+AnalyticsBase = declarative_base()
@@ -1,13 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException
+import os
+import csv
+import io
+import json
+import time
+from datetime import date, datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request
+from fastapi.routing import APIRoute
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.routing import Match
 import crud, models, schemas
-from database import SessionLocal, engine
+import metrics
+import profiling
+from cache import response_cache
+from database import AsyncSessionLocal, SessionLocal, engine, get_async_engine, pool_status
 from sqlalchemy.exc import SQLAlchemyError
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
+class ProfiledRoute(APIRoute):
+    """With PROFILE=1, every call to the route's endpoint is profiled into PROFILE_DIR/api/."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        # include_router copies routes with their (already wrapped) endpoint
+        if profiling.profile_enabled and not getattr(endpoint, "profiled", False):
+            name = f"{','.join(sorted(kwargs.get('methods') or ['GET']))} {path}"
+            endpoint = profiling.profile_endpoint(endpoint, name)
+            endpoint.profiled = True
+        super().__init__(path, endpoint, **kwargs)
+
 app = FastAPI()
+app.router.route_class = ProfiledRoute
+
+# Core CRUD routes run on blocking sessions in the threadpool ("sync") or on
+# async driver sessions in the event loop ("async")
+API_DB_MODE = os.getenv("API_DB_MODE", "sync")
+
+sync_router = APIRouter(route_class=ProfiledRoute)
+async_router = APIRouter(route_class=ProfiledRoute)
 
 def get_db():
     db = SessionLocal()
@@ -16,52 +52,452 @@ def get_db():
     finally:
         db.close()
 
-# GET all Telegram messages
-@app.get("/telegram_messages/", response_model=list[schemas.TelegramMessage])
-def read_all_telegram_messages(db: Session = Depends(get_db)):
+async def get_async_db():
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        yield db
+
+metrics.register_pool("api", lambda: pool_status(engine))
+if API_DB_MODE == "async":
+    metrics.register_pool("api_async", lambda: pool_status(get_async_engine().sync_engine))
+
+def route_template(request: Request):
+    """The path template of the route a request matches, so metrics are labelled per route, not per URL."""
+    partial = "unmatched"
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+        # Path matches but the method does not (a 405)
+        if match == Match.PARTIAL and partial == "unmatched":
+            partial = route.path
+    return partial
+
+# Latency is measured until the response starts, so for streaming exports it excludes the body
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    method, route = request.method, route_template(request)
+    in_progress = metrics.http_requests_in_progress.labels(method, route)
+    in_progress.inc()
+    started = time.perf_counter()
+    status = 500
     try:
-        return crud.get_all_telegram_messages(db)
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        in_progress.dec()
+        metrics.http_request_seconds.labels(method, route, str(status)).observe(time.perf_counter() - started)
+
+# Prometheus metrics of this process (one registry per worker process)
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Maximum page size for list endpoints
+MAX_PAGE_SIZE = 1000
+
+# Cached read namespaces each kind of write invalidates; message lists filtered by
+# class_label depend on detections too
+MESSAGE_CACHE_NAMESPACES = ("telegram_messages",)
+DETECTION_CACHE_NAMESPACES = ("detection_results", "telegram_messages")
+
+# GET Telegram messages, one keyset page at a time; the next page's cursor is in X-Next-Cursor
+@sync_router.get("/telegram_messages/", response_model=list[schemas.TelegramMessage])
+def read_all_telegram_messages(
+    request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    channel: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    order_by: Literal["id", "timestamp"] = "id",
+    class_label: Optional[int] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    db: Session = Depends(get_db),
+):
+    key, cached = response_cache.lookup(request, "telegram_messages")
+    if cached is not None:
+        return cached
+    try:
+        items, next_cursor = crud.get_telegram_messages(
+            db, limit=limit, cursor=cursor, channel=channel,
+            start_time=start_time, end_time=end_time, order_by=order_by,
+            class_label=class_label, min_confidence=min_confidence
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching telegram messages: {e}")
+    payload = [schemas.TelegramMessage.model_validate(item, from_attributes=True).model_dump(mode="json") for item in items]
+    return response_cache.respond(request, key, payload, {"X-Next-Cursor": next_cursor})
+
+# Search message content, best match first; the next page's cursor is in X-Next-Cursor.
+# mode=fts matches words (websearch syntax on PostgreSQL), mode=trigram matches similar
+# spellings and word fragments, which suits mixed Amharic/English text.
+@app.get("/telegram_messages/search", response_model=list[schemas.TelegramMessageSearchResult])
+def search_telegram_messages(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    mode: Literal["fts", "trigram"] = "fts",
+    channel: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    key, cached = response_cache.lookup(request, "telegram_messages")
+    if cached is not None:
+        return cached
+    try:
+        items, next_cursor = crud.search_telegram_messages(db, q, mode=mode, limit=limit, cursor=cursor, channel=channel)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error searching telegram messages: {e}")
+    payload = [
+        dict(schemas.TelegramMessage.model_validate(item, from_attributes=True).model_dump(mode="json"), rank=rank)
+        for item, rank in items
+    ]
+    return response_cache.respond(request, key, payload, {"X-Next-Cursor": next_cursor})
 
-# GET all detection results
-@app.get("/detection_results/", response_model=list[schemas.DetectionResult])
-def read_all_detection_results(db: Session = Depends(get_db)):
+# GET detection results, one keyset page at a time; the next page's cursor is in X-Next-Cursor
+@sync_router.get("/detection_results/", response_model=list[schemas.DetectionResult])
+def read_all_detection_results(
+    request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    class_label: Optional[int] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    channel: Optional[str] = None,
+    message_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    key, cached = response_cache.lookup(request, "detection_results")
+    if cached is not None:
+        return cached
     try:
-        return crud.get_all_detection_results(db)
+        items, next_cursor = crud.get_detection_results(
+            db, limit=limit, cursor=cursor, class_label=class_label, min_confidence=min_confidence,
+            channel=channel, message_id=message_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching detection results: {e}")
+    payload = [schemas.DetectionResult.model_validate(item, from_attributes=True).model_dump(mode="json") for item in items]
+    return response_cache.respond(request, key, payload, {"X-Next-Cursor": next_cursor})
+
+# Rows fetched per server-side cursor round trip in export endpoints
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def export_response(stream_rows, columns, export_format, filename):
+    """
+    Stream rows from stream_rows(connection) as NDJSON or CSV.
+
+    The generator owns its connection, so it stays open for as long as the client
+    is reading and is released as soon as the last batch is sent.
+    """
+    def generate():
+        with engine.connect() as connection:
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield buffer.getvalue()
+            for rows in stream_rows(connection):
+                if export_format == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows)
+
+    return StreamingResponse(
+        generate(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
+# Export all matching Telegram messages as NDJSON or CSV
+@app.get("/telegram_messages/export")
+def export_telegram_messages(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    channel: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+):
+    columns = [column.name for column in models.TelegramMessage.__table__.columns]
+    stream_rows = lambda connection: crud.stream_telegram_messages(
+        connection, EXPORT_BATCH_SIZE, channel=channel, start_time=start_time, end_time=end_time
+    )
+    return export_response(stream_rows, columns, export_format, "telegram_messages")
+
+# Export all matching detection results as NDJSON or CSV
+@app.get("/detection_results/export")
+def export_detection_results(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    class_label: Optional[int] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    channel: Optional[str] = None,
+    message_id: Optional[int] = None,
+):
+    columns = [column.name for column in models.DetectionResult.__table__.columns]
+    stream_rows = lambda connection: crud.stream_detection_results(
+        connection, EXPORT_BATCH_SIZE, class_label=class_label, min_confidence=min_confidence,
+        channel=channel, message_id=message_id
+    )
+    return export_response(stream_rows, columns, export_format, "detection_results")
+
+# Analytics read the dbt rollups, so their cost does not grow with the fact tables.
+# The rollups change only when dbt runs, so cached entries expire by TTL.
+
+@app.get("/analytics/channels/daily", response_model=list[schemas.ChannelDailyStats])
+def read_channel_daily_stats(
+    request: Request,
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(366, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    key, cached = response_cache.lookup(request, "analytics")
+    if cached is not None:
+        return cached
+    try:
+        rows = crud.get_channel_daily_stats(db, channel=channel, start_date=start_date, end_date=end_date, limit=limit)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching channel daily stats: {e}")
+    payload = [schemas.ChannelDailyStats.model_validate(row, from_attributes=True).model_dump(mode="json") for row in rows]
+    return response_cache.respond(request, key, payload)
+
+@app.get("/analytics/classes", response_model=list[schemas.ClassCount])
+def read_class_histogram(
+    request: Request,
+    channel: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    key, cached = response_cache.lookup(request, "analytics")
+    if cached is not None:
+        return cached
+    try:
+        rows = crud.get_class_histogram(db, channel=channel, limit=limit)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching class histogram: {e}")
+    payload = [schemas.ClassCount(**row).model_dump(mode="json") for row in rows]
+    return response_cache.respond(request, key, payload)
 
 # Create a detection result
-@app.post("/detection_results/", response_model=schemas.DetectionResult)
+@sync_router.post("/detection_results/", response_model=schemas.DetectionResult)
 def create_detection_result(detection_result: schemas.DetectionResultCreate, db: Session = Depends(get_db)):
     result = crud.create_detection_result(db=db, detection_result=detection_result)
     if result is None:
         raise HTTPException(status_code=500, detail="Error creating detection result")
+    response_cache.invalidate(*DETECTION_CACHE_NAMESPACES)
     return result
 
+# Maximum number of items accepted by a batch ingestion request
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+
+async def read_batch_items(request: Request):
+    """
+    Parse a batch body sent as a JSON array or as NDJSON (application/x-ndjson).
+
+    Returns a list of decoded items; an NDJSON line that is not valid JSON is
+    returned as its ValueError so it can be reported per item.
+    """
+    body = await request.body()
+    if "ndjson" in request.headers.get("content-type", ""):
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(e)
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Batch body must be a JSON array")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(items)} items exceeds the maximum of {MAX_BATCH_SIZE}")
+    return items
+
+def validate_batch_items(items, schema):
+    """Validate raw items against schema, returning (valid [(index, model)], invalid statuses)."""
+    valid, invalid = [], []
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            if not isinstance(item, dict):
+                raise ValueError("Batch item must be a JSON object")
+            valid.append((index, schema(**item)))
+        except (ValidationError, ValueError) as e:
+            invalid.append(schemas.BatchItemStatus(index=index, status="invalid", error=str(e)))
+    return valid, invalid
+
+def batch_result(valid, invalid, ids, skipped_status):
+    statuses = list(invalid)
+    for (index, _), new_id in zip(valid, ids):
+        if new_id is None:
+            statuses.append(schemas.BatchItemStatus(index=index, status=skipped_status))
+        else:
+            statuses.append(schemas.BatchItemStatus(index=index, status="created", id=new_id))
+    statuses.sort(key=lambda status: status.index)
+    created = sum(1 for status in statuses if status.status == "created")
+    return schemas.BatchResult(created=created, skipped=len(valid) - created, invalid=len(invalid), items=statuses)
+
+# Create detection results in bulk from a JSON array or NDJSON body
+@app.post("/detection_results/batch", response_model=schemas.BatchResult)
+async def create_detection_results(request: Request, db: Session = Depends(get_db)):
+    valid, invalid = validate_batch_items(await read_batch_items(request), schemas.DetectionResultCreate)
+    ids = await run_in_threadpool(crud.create_detection_results, db, [item for _, item in valid])
+    if ids is None:
+        raise HTTPException(status_code=500, detail="Error creating detection results")
+    response_cache.invalidate(*DETECTION_CACHE_NAMESPACES)
+    return batch_result(valid, invalid, ids, "skipped")
+
+# Create telegram messages in bulk from a JSON array or NDJSON body; existing (channel, message_id) pairs are skipped
+@app.post("/telegram_messages/batch", response_model=schemas.BatchResult)
+async def create_telegram_messages(request: Request, db: Session = Depends(get_db)):
+    valid, invalid = validate_batch_items(await read_batch_items(request), schemas.TelegramMessageCreate)
+    ids = await run_in_threadpool(crud.create_telegram_messages, db, [item for _, item in valid])
+    if ids is None:
+        raise HTTPException(status_code=500, detail="Error creating telegram messages")
+    response_cache.invalidate(*MESSAGE_CACHE_NAMESPACES)
+    return batch_result(valid, invalid, ids, "duplicate")
+
 # Create a telegram message
-@app.post("/telegram_messages/", response_model=schemas.TelegramMessage)
+@sync_router.post("/telegram_messages/", response_model=schemas.TelegramMessage)
 def create_telegram_message(telegram_message: schemas.TelegramMessageCreate, db: Session = Depends(get_db)):
     result = crud.create_telegram_message(db=db, telegram_message=telegram_message)
     if result is None:
         raise HTTPException(status_code=500, detail="Error creating telegram message")
+    response_cache.invalidate(*MESSAGE_CACHE_NAMESPACES)
     return result
 
-@app.put("/telegram_messages/{message_id}", response_model=schemas.TelegramMessage)
+@sync_router.put("/telegram_messages/{message_id}", response_model=schemas.TelegramMessage)
 def update_telegram_message(message_id: int, telegram_message_update: schemas.TelegramMessageUpdate, db: Session = Depends(get_db)):
     updated_message = crud.update_telegram_message(db, message_id, telegram_message_update)
     if updated_message is None:
         raise HTTPException(status_code=404, detail=f"Telegram message with id {message_id} not found or update failed")
+    response_cache.invalidate(*MESSAGE_CACHE_NAMESPACES)
     return updated_message
 
 # Delete telegram message
-@app.delete("/telegram_messages/{message_id}")
+@sync_router.delete("/telegram_messages/{message_id}")
 def delete_telegram_message(message_id: int, db: Session = Depends(get_db)):
     try:
         deleted = crud.delete_telegram_message(db, message_id)
         if not deleted:
             raise HTTPException(status_code=404, detail=f"Telegram message with id {message_id} not found")
+        response_cache.invalidate(*MESSAGE_CACHE_NAMESPACES)
+        return {"message": f"Telegram message with id {message_id} deleted successfully"}
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting telegram message: {e}")
+
+# Async counterparts of the core CRUD routes
+
+@async_router.get("/telegram_messages/", response_model=list[schemas.TelegramMessage])
+async def read_all_telegram_messages_async(
+    request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    channel: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    order_by: Literal["id", "timestamp"] = "id",
+    class_label: Optional[int] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    db: AsyncSession = Depends(get_async_db),
+):
+    key, cached = response_cache.lookup(request, "telegram_messages")
+    if cached is not None:
+        return cached
+    try:
+        items, next_cursor = await crud.get_telegram_messages_async(
+            db, limit=limit, cursor=cursor, channel=channel,
+            start_time=start_time, end_time=end_time, order_by=order_by,
+            class_label=class_label, min_confidence=min_confidence
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching telegram messages: {e}")
+    payload = [schemas.TelegramMessage.model_validate(item, from_attributes=True).model_dump(mode="json") for item in items]
+    return response_cache.respond(request, key, payload, {"X-Next-Cursor": next_cursor})
+
+@async_router.get("/detection_results/", response_model=list[schemas.DetectionResult])
+async def read_all_detection_results_async(
+    request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    class_label: Optional[int] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    channel: Optional[str] = None,
+    message_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    key, cached = response_cache.lookup(request, "detection_results")
+    if cached is not None:
+        return cached
+    try:
+        items, next_cursor = await crud.get_detection_results_async(
+            db, limit=limit, cursor=cursor, class_label=class_label, min_confidence=min_confidence,
+            channel=channel, message_id=message_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching detection results: {e}")
+    payload = [schemas.DetectionResult.model_validate(item, from_attributes=True).model_dump(mode="json") for item in items]
+    return response_cache.respond(request, key, payload, {"X-Next-Cursor": next_cursor})
+
+@async_router.post("/detection_results/", response_model=schemas.DetectionResult)
+async def create_detection_result_async(detection_result: schemas.DetectionResultCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await crud.create_detection_result_async(db=db, detection_result=detection_result)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Error creating detection result")
+    response_cache.invalidate(*DETECTION_CACHE_NAMESPACES)
+    return result
+
+@async_router.post("/telegram_messages/", response_model=schemas.TelegramMessage)
+async def create_telegram_message_async(telegram_message: schemas.TelegramMessageCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await crud.create_telegram_message_async(db=db, telegram_message=telegram_message)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Error creating telegram message")
+    response_cache.invalidate(*MESSAGE_CACHE_NAMESPACES)
+    return result
+
+@async_router.put("/telegram_messages/{message_id}", response_model=schemas.TelegramMessage)
+async def update_telegram_message_async(message_id: int, telegram_message_update: schemas.TelegramMessageUpdate, db: AsyncSession = Depends(get_async_db)):
+    updated_message = await crud.update_telegram_message_async(db, message_id, telegram_message_update)
+    if updated_message is None:
+        raise HTTPException(status_code=404, detail=f"Telegram message with id {message_id} not found or update failed")
+    response_cache.invalidate(*MESSAGE_CACHE_NAMESPACES)
+    return updated_message
+
+@async_router.delete("/telegram_messages/{message_id}")
+async def delete_telegram_message_async(message_id: int, db: AsyncSession = Depends(get_async_db)):
+    try:
+        deleted = await crud.delete_telegram_message_async(db, message_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail=f"Telegram message with id {message_id} not found")
+        response_cache.invalidate(*MESSAGE_CACHE_NAMESPACES)
         return {"message": f"Telegram message with id {message_id} deleted successfully"}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Error deleting telegram message: {e}")
+
+app.include_router(async_router if API_DB_MODE == "async" else sync_router)
@@ -1,8 +1,23 @@
-from sqlalchemy import Column, Integer, Float, String, TIMESTAMP, Text
-from database import Base
+import os
+from sqlalchemy import DDL, Column, Integer, BigInteger, Float, String, Date, TIMESTAMP, Text, Index, event
+from database import AnalyticsBase, Base
 
+# Schema dbt builds the rollup models in (the profile's target schema); empty for SQLite
+ANALYTICS_SCHEMA = os.getenv("ANALYTICS_SCHEMA", "analysis")
+
+# On PostgreSQL the loaders create telegram_messages and yolo_detection_results
+# partitioned by month (scripts/partitions.py); create_all leaves existing tables alone
 class DetectionResult(Base):
     __tablename__ = "yolo_detection_results"
+    __table_args__ = (
+        # Keyset pagination by id within a class, and confidence thresholds
+        Index("ix_yolo_detection_results_class_label_id", "class_label", "id"),
+        # Messages containing a class above a confidence, answered from the index alone
+        Index("ix_yolo_detection_results_class_label_confidence_message", "class_label", "confidence",
+              postgresql_include=["channel", "message_id"]),
+        # Detections for one Telegram message
+        Index("ix_yolo_detection_results_channel_message_id", "channel", "message_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     class_label = Column(Integer)
@@ -11,14 +26,91 @@ class DetectionResult(Base):
     width = Column(Float)
     height = Column(Float)
     confidence = Column(Float)
+    # Source image: the Telegram message it was posted in, its file name and the YOLO run
+    channel = Column(String)
+    message_id = Column(Integer)
+    image_name = Column(String)
+    run_id = Column(String)
 
 class TelegramMessage(Base):
     __tablename__ = "telegram_messages"
+    __table_args__ = (
+        # Natural key used by the loaders and batch ingestion for ON CONFLICT handling
+        Index("telegram_messages_channel_message_id_key", "channel", "message_id", "timestamp", unique=True),
+        # Keyset pagination by id or (timestamp, id), optionally within one channel
+        Index("ix_telegram_messages_channel_id", "channel", "id"),
+        Index("ix_telegram_messages_timestamp_id", "timestamp", "id"),
+        Index("ix_telegram_messages_channel_timestamp_id", "channel", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     channel = Column(String)
     message_id = Column(Integer)
     content = Column(Text)
-    timestamp = Column(TIMESTAMP(timezone=True))
+    timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
     views = Column(Float)
     message_link = Column(String)
+
+# Search over content. On PostgreSQL a generated tsvector column (the 'simple' config,
+# since there is no Amharic stemmer) and a pg_trgm index are kept current by every
+# insert and update. SQLite gets FTS5 word and trigram indexes synced by triggers.
+# Neither is mapped on the model; crud.search_telegram_messages queries them directly.
+SEARCH_DDL = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "ALTER TABLE telegram_messages ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_content_tsv ON telegram_messages USING gin (content_tsv)",
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_content_trgm ON telegram_messages USING gin (content gin_trgm_ops)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS telegram_messages_fts USING fts5("
+        "content, content='telegram_messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS telegram_messages_trigram USING fts5("
+        "content, content='telegram_messages', content_rowid='id', tokenize='trigram')",
+        """CREATE TRIGGER IF NOT EXISTS telegram_messages_search_insert AFTER INSERT ON telegram_messages BEGIN
+            INSERT INTO telegram_messages_fts (rowid, content) VALUES (new.id, new.content);
+            INSERT INTO telegram_messages_trigram (rowid, content) VALUES (new.id, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS telegram_messages_search_delete AFTER DELETE ON telegram_messages BEGIN
+            INSERT INTO telegram_messages_fts (telegram_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO telegram_messages_trigram (telegram_messages_trigram, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS telegram_messages_search_update AFTER UPDATE OF content ON telegram_messages BEGIN
+            INSERT INTO telegram_messages_fts (telegram_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO telegram_messages_trigram (telegram_messages_trigram, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO telegram_messages_fts (rowid, content) VALUES (new.id, new.content);
+            INSERT INTO telegram_messages_trigram (rowid, content) VALUES (new.id, new.content);
+        END""",
+    ],
+}
+SEARCH_DROP_DDL = {
+    "sqlite": ["DROP TABLE IF EXISTS telegram_messages_fts", "DROP TABLE IF EXISTS telegram_messages_trigram"],
+}
+
+for dialect, statements in SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(TelegramMessage.__table__, "after_create", DDL(statement).execute_if(dialect=dialect))
+for dialect, statements in SEARCH_DROP_DDL.items():
+    for statement in statements:
+        event.listen(TelegramMessage.__table__, "after_drop", DDL(statement).execute_if(dialect=dialect))
+
+class ChannelDailyStats(AnalyticsBase):
+    __tablename__ = "agg_channel_daily"
+    __table_args__ = {"schema": ANALYTICS_SCHEMA or None}
+
+    channel = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    message_count = Column(BigInteger)
+    view_sum = Column(Float)
+    max_message_id = Column(Integer)
+
+class ChannelClassCounts(AnalyticsBase):
+    __tablename__ = "agg_channel_classes"
+    __table_args__ = {"schema": ANALYTICS_SCHEMA or None}
+
+    channel = Column(String, primary_key=True)
+    class_label = Column(Integer, primary_key=True)
+    detections = Column(BigInteger)
+    confidence_sum = Column(Float)
+    max_detection_id = Column(Integer)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime
 
 class DetectionResultBase(BaseModel):
     class_label: int
@@ -9,6 +9,10 @@ class DetectionResultBase(BaseModel):
     width: float
     height: float
     confidence: float
+    channel: Optional[str] = None
+    message_id: Optional[int] = None
+    image_name: Optional[str] = None
+    run_id: Optional[str] = None
 
 class DetectionResultCreate(DetectionResultBase):
     pass
@@ -28,7 +32,8 @@ class TelegramMessageBase(BaseModel):
     message_link: Optional[str]
 
 class TelegramMessageCreate(TelegramMessageBase):
-    pass
+    # Part of the natural key and the partition key, so new messages must have one
+    timestamp: datetime
 
 class TelegramMessage(TelegramMessageBase):
     id: int
@@ -36,8 +41,38 @@ class TelegramMessage(TelegramMessageBase):
     class Config:
         orm_mode = True
 
+class TelegramMessageSearchResult(TelegramMessage):
+    rank: float
+
 class TelegramMessageUpdate(BaseModel):
     channel: Optional[str]
     content: Optional[str]
     views: Optional[float]
-    message_link: Optional[str]
\ No newline at end of file
+    message_link: Optional[str]
+
+class BatchItemStatus(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchResult(BaseModel):
+    created: int
+    skipped: int
+    invalid: int
+    items: List[BatchItemStatus]
+
+class ChannelDailyStats(BaseModel):
+    channel: str
+    day: date
+    message_count: int
+    view_sum: Optional[float]
+
+    class Config:
+        orm_mode = True
+
+class ClassCount(BaseModel):
+    channel: Optional[str]
+    class_label: int
+    detections: int
+    mean_confidence: Optional[float]
@@ -0,0 +1,4 @@
+import os
+
+# main creates its tables on import, so point the app at SQLite before any test module imports it
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test_metrics.db")
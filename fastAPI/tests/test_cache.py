@@ -0,0 +1,44 @@
+import time
+from starlette.requests import Request
+
+from cache import MemoryBackend, ResponseCache
+
+def make_request(query_string=b"", if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/telegram_messages/",
+                    "query_string": query_string, "headers": headers})
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", "1", ttl=60)
+    backend.set("b", "2", ttl=60)
+    backend.get("a")
+    backend.set("c", "3", ttl=60)
+    assert backend.get("a") == "1"
+    assert backend.get("b") is None
+    assert backend.get("c") == "3"
+
+def test_memory_backend_expires_entries():
+    backend = MemoryBackend()
+    backend.set("a", "1", ttl=0.01)
+    time.sleep(0.02)
+    assert backend.get("a") is None
+
+def test_response_cache_hit_etag_and_invalidation():
+    cache = ResponseCache(MemoryBackend(), ttl=60)
+    key, cached = cache.lookup(make_request(b"limit=2&channel=c"), "telegram_messages")
+    assert cached is None
+    response = cache.respond(make_request(), key, [{"id": 1}], {"X-Next-Cursor": "abc"})
+    etag = response.headers["etag"]
+
+    # Query parameter order does not change the key
+    _, cached = cache.lookup(make_request(b"channel=c&limit=2"), "telegram_messages")
+    assert cached.body == b'[{"id":1}]'
+    assert cached.headers["x-next-cursor"] == "abc"
+
+    _, cached = cache.lookup(make_request(b"channel=c&limit=2", if_none_match=etag), "telegram_messages")
+    assert cached.status_code == 304
+
+    cache.invalidate("telegram_messages")
+    _, cached = cache.lookup(make_request(b"channel=c&limit=2"), "telegram_messages")
+    assert cached is None
@@ -1,12 +1,17 @@
 import pytest
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 
-from models import Base, DetectionResult, TelegramMessage
+from database import AnalyticsBase
+from models import ANALYTICS_SCHEMA, Base, ChannelClassCounts, ChannelDailyStats, DetectionResult, TelegramMessage
 from schemas import DetectionResultCreate, TelegramMessageCreate, TelegramMessageUpdate
 import crud
 
+# Post date for messages whose timestamp does not matter to the test
+POSTED = datetime(2024, 5, 1, 12, 0)
+
 #  In-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 
@@ -72,3 +77,142 @@ def test_delete_telegram_message(setup_database, db_session):
     assert deleted is True
     message = db_session.query(TelegramMessage).filter(TelegramMessage.id == message.id).first()
     assert message is None
+
+def test_get_telegram_messages_keyset_pages(setup_database, db_session):
+    for message_id in range(5):
+        db_session.add(TelegramMessage(channel="paging", message_id=message_id, content=f"page {message_id}",
+                                       timestamp=POSTED))
+    db_session.commit()
+    first_page, cursor = crud.get_telegram_messages(db_session, limit=3, channel="paging")
+    assert [m.message_id for m in first_page] == [0, 1, 2]
+    assert cursor is not None
+    second_page, cursor = crud.get_telegram_messages(db_session, limit=3, cursor=cursor, channel="paging")
+    assert [m.message_id for m in second_page] == [3, 4]
+    assert cursor is None
+
+def test_get_telegram_messages_by_timestamp_and_time_range(setup_database, db_session):
+    base = datetime(2024, 4, 1)
+    for day in (3, 1, 2):
+        db_session.add(TelegramMessage(channel="ranged", message_id=day, timestamp=base + timedelta(days=day)))
+    db_session.commit()
+    page, cursor = crud.get_telegram_messages(db_session, limit=1, channel="ranged", order_by="timestamp")
+    assert [m.message_id for m in page] == [1]
+    page, cursor = crud.get_telegram_messages(db_session, limit=5, cursor=cursor, channel="ranged",
+                                              order_by="timestamp")
+    assert [m.message_id for m in page] == [2, 3]
+    page, _ = crud.get_telegram_messages(db_session, channel="ranged", start_time=base + timedelta(days=2),
+                                         end_time=base + timedelta(days=3))
+    assert [m.message_id for m in page] == [2]
+
+def test_get_telegram_messages_rejects_bad_cursor(setup_database, db_session):
+    with pytest.raises(ValueError):
+        crud.get_telegram_messages(db_session, cursor="not-a-cursor")
+
+def test_get_detection_results_filters(setup_database, db_session):
+    for confidence in (0.2, 0.6, 0.9):
+        db_session.add(DetectionResult(class_label=7, x_center=0.5, y_center=0.5, width=0.1, height=0.1,
+                                       confidence=confidence))
+    db_session.add(DetectionResult(class_label=8, x_center=0.5, y_center=0.5, width=0.1, height=0.1,
+                                   confidence=0.95))
+    db_session.commit()
+    page, cursor = crud.get_detection_results(db_session, limit=1, class_label=7, min_confidence=0.5)
+    assert [r.confidence for r in page] == [0.6]
+    page, cursor = crud.get_detection_results(db_session, limit=1, cursor=cursor, class_label=7,
+                                              min_confidence=0.5)
+    assert [r.confidence for r in page] == [0.9]
+    assert cursor is None
+
+def test_stream_telegram_messages_batches(setup_database, db_session):
+    for message_id in range(5):
+        db_session.add(TelegramMessage(channel="export", message_id=message_id, timestamp=POSTED))
+    db_session.commit()
+    with engine.connect() as connection:
+        batches = list(crud.stream_telegram_messages(connection, batch_size=2, channel="export"))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [row.message_id for batch in batches for row in batch] == [0, 1, 2, 3, 4]
+
+def test_create_detection_results_returns_ids_in_order(setup_database, db_session):
+    detections = [
+        DetectionResultCreate(class_label=3, x_center=0.1, y_center=0.2, width=0.3, height=0.4, confidence=c)
+        for c in (0.3, 0.7)
+    ]
+    ids = crud.create_detection_results(db_session, detections)
+    assert len(ids) == 2
+    stored = {r.id: r.confidence for r in db_session.query(DetectionResult).filter(DetectionResult.id.in_(ids))}
+    assert [stored[i] for i in ids] == [0.3, 0.7]
+
+def test_create_telegram_messages_skips_duplicates(setup_database, db_session):
+    def message(message_id, timestamp=POSTED):
+        return TelegramMessageCreate(channel="batch", message_id=message_id, content=None, timestamp=timestamp,
+                                     views=None, message_link=None)
+    first = crud.create_telegram_messages(db_session, [message(1), message(2), message(1),
+                                                       message(2, POSTED + timedelta(hours=1))])
+    assert first[0] is not None and first[1] is not None and first[2] is None and first[3] is None
+    second = crud.create_telegram_messages(db_session, [message(2), message(3)])
+    assert second[0] is None and second[1] is not None
+
+def test_detections_linked_to_messages(setup_database, db_session):
+    for message_id in (10, 11, 12):
+        db_session.add(TelegramMessage(channel="linked", message_id=message_id, timestamp=POSTED))
+    for message_id, class_label, confidence in ((10, 5, 0.9), (10, 5, 0.95), (11, 5, 0.3), (12, 6, 0.9)):
+        db_session.add(DetectionResult(class_label=class_label, x_center=0.5, y_center=0.5, width=0.1, height=0.1,
+                                       confidence=confidence, channel="linked", message_id=message_id,
+                                       image_name=str(message_id), run_id="run1"))
+    db_session.commit()
+    detections, _ = crud.get_detection_results(db_session, channel="linked", message_id=10)
+    assert [d.confidence for d in detections] == [0.9, 0.95]
+    messages, cursor = crud.get_telegram_messages(db_session, channel="linked", class_label=5, min_confidence=0.5)
+    assert [m.message_id for m in messages] == [10]
+    assert cursor is None
+
+def test_search_telegram_messages(setup_database, db_session):
+    contents = ["Paracetamol 500mg available", "paracetamol syrup", "ፓራሲታሞል paracetamol tablets", "amoxicillin"]
+    for message_id, content in enumerate(contents):
+        db_session.add(TelegramMessage(channel="search", message_id=message_id, content=content, timestamp=POSTED))
+    db_session.commit()
+    first_page, cursor = crud.search_telegram_messages(db_session, "paracetamol", limit=2, channel="search")
+    second_page, cursor = crud.search_telegram_messages(db_session, "paracetamol", limit=2, cursor=cursor,
+                                                        channel="search")
+    assert cursor is None
+    assert sorted(m.message_id for m, _ in first_page + second_page) == [0, 1, 2]
+    ranks = [rank for _, rank in first_page + second_page]
+    assert ranks == sorted(ranks, reverse=True)
+    matches, _ = crud.search_telegram_messages(db_session, "ፓራሲታ", mode="trigram", channel="search")
+    assert [m.message_id for m, _ in matches] == [2]
+
+    # The search indexes follow updates and deletes
+    amoxicillin = db_session.query(TelegramMessage).filter_by(channel="search", message_id=3).one()
+    amoxicillin.content = "paracetamol drops"
+    db_session.commit()
+    matches, _ = crud.search_telegram_messages(db_session, "amoxicillin", channel="search")
+    assert matches == []
+    db_session.delete(amoxicillin)
+    db_session.commit()
+    matches, _ = crud.search_telegram_messages(db_session, "drops", channel="search")
+    assert matches == []
+
+def test_rollup_readers():
+    # The rollups live in the dbt schema; SQLite has no schemas
+    analytics_engine = engine.execution_options(schema_translate_map={ANALYTICS_SCHEMA: None})
+    AnalyticsBase.metadata.create_all(bind=analytics_engine)
+    session = sessionmaker(bind=analytics_engine)()
+    try:
+        day = datetime(2024, 5, 1).date()
+        session.add_all([
+            ChannelDailyStats(channel="a", day=day, message_count=3, view_sum=30.0, max_message_id=3),
+            ChannelDailyStats(channel="a", day=day + timedelta(days=1), message_count=1, view_sum=5.0, max_message_id=4),
+            ChannelDailyStats(channel="b", day=day, message_count=2, view_sum=8.0, max_message_id=6),
+            ChannelClassCounts(channel="a", class_label=1, detections=4, confidence_sum=2.0, max_detection_id=4),
+            ChannelClassCounts(channel="b", class_label=1, detections=1, confidence_sum=1.0, max_detection_id=5),
+            ChannelClassCounts(channel="b", class_label=2, detections=3, confidence_sum=1.5, max_detection_id=8),
+        ])
+        session.commit()
+        stats = crud.get_channel_daily_stats(session, channel="a", start_date=day + timedelta(days=1))
+        assert [(s.day, s.message_count) for s in stats] == [(day + timedelta(days=1), 1)]
+        histogram = crud.get_class_histogram(session)
+        assert [(h["class_label"], h["detections"], h["mean_confidence"]) for h in histogram] == [(1, 5, 0.6), (2, 3, 0.5)]
+        histogram = crud.get_class_histogram(session, channel="b", limit=1)
+        assert [(h["channel"], h["class_label"]) for h in histogram] == [("b", 2)]
+    finally:
+        session.close()
+        AnalyticsBase.metadata.drop_all(bind=analytics_engine)
@@ -0,0 +1,39 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base
+from main import app, get_db
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_metrics.db"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def setup_database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+    os.remove("./test_metrics.db")
+
+def test_metrics_record_route_latency(setup_database):
+    client.get("/telegram_messages/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/telegram_messages/",status="200"}' in response.text
+    assert 'db_pool_connections{pool="api",state="in_use"}' in response.text
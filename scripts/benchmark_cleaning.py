@@ -0,0 +1,198 @@
+"""
+Benchmark clean_messages against the SQL the dbt models run, and check they agree.
+
+Generates messages with synthetic_data (plus missing values and mixed Amharic/English
+content with punctuation), then times:
+
+    python      clean_messages.clean_table on one Arrow batch, on a single core
+    sql         (PostgreSQL) COPY into a temporary table, then the handle_missing_values,
+                standardize_formats and fact_telegram models, read from dbt_med/models,
+                in one query
+
+With PostgreSQL available, every cleaned row is compared with the SQL result and the
+exit status is 1 on any difference.
+
+    python benchmark_cleaning.py --rows 1000000
+    python benchmark_cleaning.py --rows 1000000 --no-sql
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import logging
+import pyarrow as pa
+from dotenv import load_dotenv
+import db_pool
+import synthetic_data
+from clean_messages import clean_table
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Content the generator does not produce: Ethiopic punctuation, emoji, tabs, leading
+# and trailing spaces, underscores, empty photo captions
+TRICKY_CONTENT = [
+    'ፓራሲታሞል 500 ሚግ። ዋጋ 50 ብር!',
+    '  Amoxicillin!! ለልጆች  ',
+    'Vitamin_C\ttablets. Call: 0911',
+    '💊 Paracetamol 💊',
+    '',
+    '   ',
+    'NO PUNCTUATION',
+    '¡Hola! ¿Qué tal?',
+]
+
+DBT_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dbt_med', 'models')
+# The models clean_messages mirrors, in dependency order; the first reads remove_duplicates
+CLEANING_MODELS = ['handle_missing_values', 'standardize_formats', 'fact_telegram']
+CONFIG_BLOCK = re.compile(r'\{\{\s*config\(.*?\)\s*\}\}', re.DOTALL)
+REF = re.compile(r"\{\{\s*ref\('(\w+)'\)\s*\}\}")
+# Renders to nothing on a full refresh
+WATERMARK = re.compile(r'\{\{\s*incremental_watermark\(\)\s*\}\}')
+COMPARED_COLUMNS = ['id', 'channel', 'message_id', 'content', 'timestamp', 'views', 'message_link', 'message_length']
+
+
+def model_sql(name, relations):
+    """
+    The SQL of a dbt model as a full refresh would run it, with each ref() replaced by
+    the relation mapped to it.
+
+    Raises:
+        ValueError: If the model uses Jinja beyond config, ref and incremental_watermark.
+    """
+    with open(os.path.join(DBT_MODELS_DIR, f'{name}.sql'), encoding='utf-8') as f:
+        text = f.read()
+    text = WATERMARK.sub('', CONFIG_BLOCK.sub('', text))
+    text = REF.sub(lambda match: relations[match.group(1)], text)
+    if '{{' in text or '{%' in text:
+        raise ValueError(f'{name}.sql uses Jinja the cleaning benchmark cannot render')
+    return text.strip()
+
+
+def clean_sql(table):
+    """CLEANING_MODELS rendered as one query over table, a CTE per model."""
+    relations = {'remove_duplicates': table}
+    ctes = []
+    for name in CLEANING_MODELS:
+        ctes.append(f'{name} AS (\n{model_sql(name, relations)}\n)')
+        relations[name] = name
+    return (f'WITH {", ".join(ctes)}\n'
+            f'SELECT {", ".join(COMPARED_COLUMNS)} FROM {CLEANING_MODELS[-1]} ORDER BY id')
+
+
+def sample_frame(rows, seed=0):
+    """Synthetic messages with an id column, missing values and TRICKY_CONTENT mixed in."""
+    df = synthetic_data.messages_frame(rows, seed=seed)
+    df.insert(0, 'id', range(1, rows + 1))
+    df.loc[df.index % 13 == 0, 'content'] = [TRICKY_CONTENT[i % len(TRICKY_CONTENT)] for i in range(len(df.index[::13]))]
+    df.loc[df.index % 37 == 0, 'message_link'] = None
+    df.loc[df.index % 41 == 0, 'views'] = None
+    df.loc[df.index % 43 == 0, 'timestamp'] = None
+    return df
+
+
+def time_python(table, repeat):
+    """Best of repeat runs of clean_table on one core; returns (seconds, cleaned table)."""
+    pa.set_cpu_count(1)
+    best, cleaned = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cleaned = clean_table(table)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, cleaned
+
+
+def run_sql(df):
+    """Load df into a temporary table and run clean_sql on it; returns (load seconds, clean seconds, rows)."""
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SET TIME ZONE 'UTC'")
+        cur.execute("""
+            CREATE TEMP TABLE benchmark_cleaning (
+                id BIGINT, channel TEXT, message_id INT, content TEXT,
+                timestamp TIMESTAMP WITH TIME ZONE, views FLOAT, message_link TEXT
+            ) ON COMMIT DROP
+        """)
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, na_rep='\\N')
+        buffer.seek(0)
+        started = time.perf_counter()
+        cur.copy_expert(
+            "COPY benchmark_cleaning (id, channel, message_id, content, timestamp, views, message_link) "
+            "FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+        load_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        cur.execute(clean_sql('benchmark_cleaning'))
+        rows = cur.fetchall()
+        clean_seconds = time.perf_counter() - started
+        cur.close()
+    return load_seconds, clean_seconds, rows
+
+
+def compare(cleaned, sql_rows):
+    """Return (python row, sql row) pairs that differ, matched by id."""
+    python_rows = list(zip(*(cleaned[name].to_pylist() for name in COMPARED_COLUMNS)))
+    python_rows.sort(key=lambda row: row[0])
+    # CAST(timestamp AS TIMESTAMP) in a UTC session is the UTC wall time without a zone
+    python_rows = [row[:4] + (row[4].replace(tzinfo=None),) + row[5:] for row in python_rows]
+    differences = [(p, s) for p, s in zip(python_rows, sql_rows) if tuple(p) != tuple(s)]
+    if len(python_rows) != len(sql_rows):
+        differences.append((f'{len(python_rows)} rows', f'{len(sql_rows)} rows'))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3, help='Python runs; the best is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-sql', action='store_true', help='Skip the PostgreSQL comparison')
+    parser.add_argument('--output', default=None, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    df = sample_frame(args.rows, args.seed)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    python_seconds, cleaned = time_python(table, args.repeat)
+    results = {
+        'rows': args.rows,
+        'cleaned_rows': cleaned.num_rows,
+        'python_seconds': round(python_seconds, 3),
+        'python_messages_per_second': round(args.rows / python_seconds),
+    }
+
+    differences = []
+    if not args.no_sql and db_pool.healthcheck():
+        try:
+            load_seconds, clean_seconds, sql_rows = run_sql(df)
+        finally:
+            db_pool.close_pool()
+        differences = compare(cleaned, sql_rows)
+        results.update({
+            'sql_load_seconds': round(load_seconds, 3),
+            'sql_clean_seconds': round(clean_seconds, 3),
+            'sql_messages_per_second': round(args.rows / (load_seconds + clean_seconds)),
+            'differences': len(differences),
+        })
+    elif not args.no_sql:
+        logger.info('PostgreSQL (DB_*) is not reachable; skipping the SQL path and comparison')
+
+    for name, value in results.items():
+        print(f'{name:<28}{value:>14}')
+    for python_row, sql_row in differences[:10]:
+        print(f'python: {python_row}\n   sql: {sql_row}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if differences:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
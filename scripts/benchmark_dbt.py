@@ -0,0 +1,239 @@
+"""
+Benchmark the dbt cleaning models on generated datasets.
+
+For each dataset size, generates raw telegram_messages rows (with a share of
+duplicate (channel, message_id) pairs and dirty content) in a scratch schema and times:
+
+    dedup        the former ROW_NUMBER() dedup against the DISTINCT ON model query
+    validation   the former nested-REPLACE data test against the single-pass regex test
+    dbt          (with --dbt) a full refresh of +fact_telegram, an incremental run after
+                 appending --new-rows-fraction more rows, and dbt test
+
+    python benchmark_dbt.py --rows 1000000 10000000
+    python benchmark_dbt.py --rows 1000000 --dbt --project-dir ../dbt_med
+"""
+import os
+import json
+import time
+import argparse
+import logging
+import subprocess
+from psycopg2 import sql
+from dotenv import load_dotenv
+import db_pool
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHANNELS = 16
+
+LEGACY_DEDUP = """
+    WITH ranked_messages AS (
+        SELECT id, channel, message_id, content, message_link, timestamp, views,
+               ROW_NUMBER() OVER (PARTITION BY message_id ORDER BY timestamp DESC) AS row_num
+        FROM {table}
+    )
+    SELECT id, channel, message_id, content, message_link, timestamp, views
+    FROM ranked_messages
+    WHERE row_num = 1
+"""
+
+DEDUP = """
+    SELECT DISTINCT ON (channel, message_id)
+        id, channel, message_id, content, message_link, timestamp, views
+    FROM {table}
+    ORDER BY channel, message_id, timestamp DESC
+"""
+
+LEGACY_VALIDATION = """
+    WITH validation_checks AS (
+      SELECT *,
+        REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(content, '!', ''), '@', ''), '#', ''), '$', ''), '%', ''), '^', '') AS cleaned_content,
+        LOWER(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(content, '!', ''), '@', ''), '#', ''), '$', ''), '%', ''), '^', '')) AS lowercased_content
+      FROM {table}
+    )
+    SELECT * FROM validation_checks
+    WHERE cleaned_content <> content
+      OR lowercased_content <> content
+      OR id IN (SELECT id FROM validation_checks GROUP BY id HAVING COUNT(*) > 1)
+      OR id IS NULL OR channel IS NULL OR message_id IS NULL OR content IS NULL
+      OR timestamp IS NULL OR views IS NULL OR message_link IS NULL OR message_length IS NULL
+"""
+
+VALIDATION = """
+    WITH source_data AS (
+      SELECT *, COUNT(*) OVER (PARTITION BY id) AS id_count
+      FROM {table}
+    )
+    SELECT * FROM source_data
+    WHERE content ~ '[!@#$%^[:upper:]]'
+      OR id_count > 1
+      OR id IS NULL OR channel IS NULL OR message_id IS NULL OR content IS NULL
+      OR timestamp IS NULL OR views IS NULL OR message_link IS NULL OR message_length IS NULL
+"""
+
+
+def create_raw_table(cur, schema):
+    cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema)))
+    cur.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(schema)))
+    # Same columns as public.telegram_messages, without the unique (channel, message_id)
+    # index so the generated duplicates reach the dedup model
+    cur.execute(sql.SQL("""
+        CREATE TABLE {}.telegram_messages (
+            id BIGINT PRIMARY KEY,
+            channel TEXT,
+            message_id BIGINT,
+            content TEXT,
+            timestamp TIMESTAMP WITH TIME ZONE,
+            views FLOAT,
+            message_link TEXT
+        )
+    """).format(sql.Identifier(schema)))
+    cur.execute(sql.SQL("CREATE INDEX ON {}.telegram_messages (timestamp)").format(sql.Identifier(schema)))
+
+
+def generate_rows(cur, schema, start_id, rows, duplicate_rate):
+    """
+    Append rows with ids start_id .. start_id + rows - 1. A duplicate_rate share of them
+    repeat the (channel, message_id) of an earlier row with a later timestamp; one in
+    ten has punctuation and upper case for the validation test to flag.
+    """
+    table = sql.SQL("{}.telegram_messages").format(sql.Identifier(schema))
+    duplicates = int(rows * duplicate_rate)
+    unique_rows = rows - duplicates
+    cur.execute(sql.SQL("""
+        INSERT INTO {table} (id, channel, message_id, content, timestamp, views, message_link)
+        SELECT g,
+               'channel_' || (g %% %(channels)s),
+               g,
+               CASE WHEN g %% 10 = 0 THEN 'Price ' || g || ' Birr! Call @pharmacy'
+                    ELSE 'paracetamol 500mg available ' || g END,
+               TIMESTAMP WITH TIME ZONE '2024-01-01 00:00:00+00' + make_interval(secs => g),
+               g %% 5000,
+               'https://t.me/channel_' || (g %% %(channels)s) || '/' || g
+        FROM generate_series(%(first)s::bigint, %(last)s::bigint) AS g
+    """).format(table=table), {'channels': CHANNELS, 'first': start_id, 'last': start_id + unique_rows - 1})
+    if duplicates:
+        step = max(unique_rows // duplicates, 1)
+        cur.execute(sql.SQL("""
+            INSERT INTO {table} (id, channel, message_id, content, timestamp, views, message_link)
+            SELECT %(next_id)s + row_number() OVER (ORDER BY id), channel, message_id, content,
+                   timestamp + INTERVAL '1 hour', views + 1, message_link
+            FROM {table}
+            WHERE id BETWEEN %(first)s AND %(last)s AND (id - %(first)s) %% %(step)s = 0
+            LIMIT %(duplicates)s
+        """).format(table=table), {
+            'next_id': start_id + unique_rows - 1, 'first': start_id, 'last': start_id + unique_rows - 1,
+            'step': step, 'duplicates': duplicates
+        })
+    cur.execute(sql.SQL("ANALYZE {}").format(table))
+
+
+def create_fact_table(cur, schema):
+    """Fact-shaped table for the validation queries, built with the current dedup."""
+    cur.execute(sql.SQL("""
+        CREATE TABLE {schema}.fact_telegram AS
+        SELECT d.*, LENGTH(content) AS message_length
+        FROM ({dedup}) d
+    """).format(schema=sql.Identifier(schema),
+                dedup=sql.SQL(DEDUP.format(table=f'"{schema}".telegram_messages'))))
+    cur.execute(sql.SQL("ANALYZE {}.fact_telegram").format(sql.Identifier(schema)))
+
+
+def time_query(cur, query):
+    """Run a query to completion server-side and return (seconds, result rows)."""
+    started = time.perf_counter()
+    cur.execute(f"SELECT COUNT(*) FROM ({query}) q")
+    count = cur.fetchone()[0]
+    return time.perf_counter() - started, count
+
+
+def run_dbt(args, project_dir, schema):
+    env = dict(os.environ, DBT_SCHEMA=f'{schema}_analysis')
+    command = ['dbt'] + args + ['--project-dir', project_dir, '--vars', json.dumps({'raw_schema': schema})]
+    started = time.perf_counter()
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def benchmark(rows, schema, duplicate_rate, new_rows_fraction, with_dbt, project_dir, keep):
+    results = []
+
+    def record(step, seconds, result_rows=None):
+        results.append({'rows': rows, 'step': step, 'seconds': round(seconds, 3), 'result_rows': result_rows})
+        logger.info(f'{rows} rows, {step}: {seconds:.3f}s' + ('' if result_rows is None else f' ({result_rows} rows)'))
+
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        started = time.perf_counter()
+        create_raw_table(cur, schema)
+        generate_rows(cur, schema, 1, rows, duplicate_rate)
+        conn.commit()
+        record('generate', time.perf_counter() - started)
+
+        raw_table = f'"{schema}".telegram_messages'
+        record('dedup legacy row_number', *time_query(cur, LEGACY_DEDUP.format(table=raw_table)))
+        record('dedup distinct on', *time_query(cur, DEDUP.format(table=raw_table)))
+
+        create_fact_table(cur, schema)
+        conn.commit()
+        fact_table = f'"{schema}".fact_telegram'
+        record('validation legacy replace', *time_query(cur, LEGACY_VALIDATION.format(table=fact_table)))
+        record('validation single-pass regex', *time_query(cur, VALIDATION.format(table=fact_table)))
+        cur.close()
+
+    if with_dbt:
+        record('dbt run full refresh', run_dbt(['run', '--full-refresh', '--select', '+fact_telegram'], project_dir, schema))
+        with db_pool.connection() as conn:
+            cur = conn.cursor()
+            generate_rows(cur, schema, rows * 2, max(int(rows * new_rows_fraction), 1), duplicate_rate)
+            cur.close()
+        record('dbt run incremental', run_dbt(['run', '--select', '+fact_telegram'], project_dir, schema))
+        try:
+            record('dbt test', run_dbt(['test', '--select', 'data_validation'], project_dir, schema))
+        except subprocess.CalledProcessError:
+            # The generated dirty content makes the data test fail by design; the timing still counts
+            logger.info('dbt test reported failing rows (expected for generated dirty content)')
+
+    if not keep:
+        with db_pool.connection() as conn:
+            cur = conn.cursor()
+            for name in (schema, f'{schema}_analysis', f'{schema}_analysis_analysis'):
+                cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(name)))
+            cur.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--schema', default='dbt_benchmark')
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--new-rows-fraction', type=float, default=0.01,
+                        help='Rows appended before the incremental dbt run, as a fraction of --rows')
+    parser.add_argument('--dbt', action='store_true', help='Also time dbt run/test against the generated data')
+    parser.add_argument('--project-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dbt_med'))
+    parser.add_argument('--keep', action='store_true', help='Keep the generated schemas')
+    parser.add_argument('--output', default=None, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    try:
+        for rows in args.rows:
+            results.extend(benchmark(rows, args.schema, args.duplicate_rate, args.new_rows_fraction,
+                                     args.dbt, args.project_dir, args.keep))
+    finally:
+        db_pool.close_pool()
+
+    print(f"{'rows':>12}  {'step':<32}{'seconds':>10}")
+    for result in results:
+        print(f"{result['rows']:>12}  {result['step']:<32}{result['seconds']:>10.3f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
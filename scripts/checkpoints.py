@@ -0,0 +1,64 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """
+    Per-channel scraping high-water marks persisted to a JSON file.
+
+    Each channel entry records:
+        last_message_id: newest message id written to the warehouse.
+        oldest_message_id: oldest message id written, where backfill resumes from.
+        backfill_complete: True once backfill reached the start of the channel history.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f'Error reading checkpoint file {self.path}: {e}')
+            raise
+
+    def _save(self):
+        # Write to a temporary file and rename so a crash never leaves a truncated checkpoint
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, channel_key):
+        """Return a copy of the checkpoint for a channel (empty dict if none)."""
+        with self._lock:
+            return dict(self._state.get(channel_key, {}))
+
+    def advance(self, channel_key, message_ids):
+        """Record that the given message ids were written for a channel."""
+        if not message_ids:
+            return
+        with self._lock:
+            entry = self._state.setdefault(channel_key, {})
+            entry['last_message_id'] = max(entry.get('last_message_id', 0), max(message_ids))
+            oldest = entry.get('oldest_message_id')
+            entry['oldest_message_id'] = min(message_ids) if oldest is None else min(oldest, min(message_ids))
+            self._save()
+
+    def mark_backfill_complete(self, channel_key):
+        """Record that a channel's full history has been loaded."""
+        with self._lock:
+            self._state.setdefault(channel_key, {})['backfill_complete'] = True
+            self._save()
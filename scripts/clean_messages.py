@@ -0,0 +1,64 @@
+"""
+Vectorized cleaning of message batches, mirroring the dbt models.
+
+clean_table applies, with pyarrow compute kernels, what the warehouse does to a row on
+its way from the raw table to fact_telegram:
+
+    handle_missing_values   content defaults to 'message not found'; rows with a null
+                            channel, message_id, message_link, timestamp or views are dropped
+    standardize_formats     TRIM(LOWER(REGEXP_REPLACE(content, '[^\\w\\s]', ''))); without
+                            the 'g' flag REGEXP_REPLACE removes only the first match
+    fact_telegram           message_length = LENGTH(content)
+
+The remaining COALESCE defaults in standardize_formats never apply, because
+handle_missing_values has already dropped the rows they would fill. Timestamps are kept
+as they are; the model's CAST(timestamp AS TIMESTAMP) only drops the zone, which for a
+UTC session leaves the same instant.
+"""
+import pyarrow as pa
+import pyarrow.compute as pc
+
+MISSING_CONTENT = 'message not found'
+# PostgreSQL's \w is letters, digits and underscore in the database locale; RE2's \w is
+# ASCII only, so the class is spelled out in Unicode properties to keep Amharic letters
+PUNCTUATION = r'[^\p{L}\p{N}\p{M}_[:space:]]'
+REQUIRED_COLUMNS = ['channel', 'message_id', 'message_link', 'timestamp', 'views']
+
+
+def clean_table(table):
+    """
+    Clean an Arrow table of messages (at least the MESSAGE_COLUMNS columns).
+
+    Returns:
+        pyarrow.Table: The rows that survive handle_missing_values, with cleaned
+        content and a message_length column.
+    """
+    valid = pc.is_valid(table[REQUIRED_COLUMNS[0]])
+    for name in REQUIRED_COLUMNS[1:]:
+        valid = pc.and_(valid, pc.is_valid(table[name]))
+    table = table.filter(valid)
+
+    content = pc.fill_null(table['content'], MISSING_CONTENT)
+    content = pc.replace_substring_regex(content, PUNCTUATION, '', max_replacements=1)
+    # TRIM removes spaces only, not tabs or newlines
+    content = pc.utf8_trim(pc.utf8_lower(content), ' ')
+    table = table.set_column(table.schema.get_field_index('content'), 'content', content)
+    return table.append_column('message_length', pc.utf8_length(content))
+
+
+def clean_rows(rows, columns, schema=None):
+    """
+    Clean row tuples in columns order.
+
+    Returns:
+        list: Cleaned row tuples in columns order (without message_length).
+    """
+    if not rows:
+        return []
+    table = clean_table(pa.table(dict(zip(columns, map(list, zip(*rows)))), schema=schema))
+    return list(zip(*(table[name].to_pylist() for name in columns)))
+
+
+def clean_frame(df, schema=None):
+    """Clean a pandas DataFrame of messages; returns a DataFrame with message_length."""
+    return clean_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False)).to_pandas()
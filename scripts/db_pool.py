@@ -0,0 +1,197 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool
+from dotenv import load_dotenv
+import profiling
+
+# Load environment variables from .env file
+load_dotenv()
+
+# PostgreSQL database credentials
+db_host = os.getenv('DB_HOST')
+db_name = os.getenv('DB_NAME')
+db_user = os.getenv('DB_USER')
+db_password = os.getenv('DB_PASSWORD')
+db_port = os.getenv('DB_PORT')
+
+# Pool configuration shared by the pipeline scripts and the FastAPI engine
+pool_min_size = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+pool_max_size = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+pool_recycle = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+pool_pre_ping = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+# Bounds concurrent checkouts so callers wait for a free connection instead of
+# getting PoolError from psycopg2 when the pool is exhausted
+_slots = threading.BoundedSemaphore(pool_max_size)
+_created_at = {}
+_in_use = 0
+# Callers blocked in getconn waiting for a free connection
+_waiting = 0
+
+
+def _connect_kwargs():
+    kwargs = {
+        'host': db_host,
+        'dbname': db_name,
+        'user': db_user,
+        'password': db_password,
+    }
+    if db_port:
+        kwargs['port'] = db_port
+    # SLOW_QUERY_MS logs slow statements with their plan (profiling.SlowQueryCursor)
+    if profiling.slow_query_ms > 0:
+        kwargs['cursor_factory'] = profiling.SlowQueryCursor
+    return kwargs
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(pool_min_size, pool_max_size, **_connect_kwargs())
+                logger.info(f'Created PostgreSQL connection pool (min={pool_min_size}, max={pool_max_size})')
+    return _pool
+
+
+def _is_healthy(conn):
+    """Check that a pooled connection is open, not expired and (optionally) answers a ping."""
+    if conn.closed:
+        return False
+    created_at = _created_at.setdefault(id(conn), time.monotonic())
+    if pool_recycle > 0 and time.monotonic() - created_at > pool_recycle:
+        return False
+    if not pool_pre_ping:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def getconn():
+    """
+    Check a connection out of the pool.
+
+    Blocks for up to DB_POOL_TIMEOUT seconds when all connections are in use.
+    Stale or broken connections are discarded and replaced transparently.
+    """
+    global _in_use, _waiting
+    with _pool_lock:
+        _waiting += 1
+    try:
+        acquired = _slots.acquire(timeout=pool_timeout)
+    finally:
+        with _pool_lock:
+            _waiting -= 1
+    if not acquired:
+        raise pool.PoolError(f'Timed out after {pool_timeout}s waiting for a database connection')
+    try:
+        db_pool = get_pool()
+        conn = db_pool.getconn()
+        # Every idle connection may have gone stale (e.g. after a server restart),
+        # so keep discarding until a healthy or freshly opened one comes back
+        for _ in range(pool_max_size):
+            if _is_healthy(conn):
+                break
+            logger.info('Discarding stale PostgreSQL connection')
+            _created_at.pop(id(conn), None)
+            db_pool.putconn(conn, close=True)
+            conn = db_pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+    with _pool_lock:
+        _in_use += 1
+    return conn
+
+
+def putconn(conn, close=False):
+    """Return a connection to the pool."""
+    global _in_use
+    try:
+        if close or conn.closed:
+            _created_at.pop(id(conn), None)
+        get_pool().putconn(conn, close=close)
+    finally:
+        with _pool_lock:
+            _in_use -= 1
+        _slots.release()
+
+
+@contextmanager
+def connection():
+    """
+    Context manager yielding a pooled connection.
+
+    Commits when the block succeeds, rolls back and re-raises when it fails.
+    """
+    conn = getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        putconn(conn)
+
+
+def healthcheck():
+    """Return True if a pooled connection can run a trivial query."""
+    try:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+                return cur.fetchone() == (1,)
+    except (psycopg2.Error, pool.PoolError) as e:
+        logger.error(f'Database health check failed: {e}')
+        return False
+
+
+def pool_status():
+    """
+    Return the configured bounds, the number of connections currently checked out and
+    the number of callers waiting for one.
+    """
+    return {'min_size': pool_min_size, 'max_size': pool_max_size, 'in_use': _in_use, 'waiting': _waiting}
+
+
+def close_pool():
+    """Close every connection held by the pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _created_at.clear()
+            logger.info('Closed PostgreSQL connection pool')
+
+
+def engine_options():
+    """
+    Keyword arguments for sqlalchemy.create_engine matching the psycopg2 pool settings.
+
+    DB_POOL_MIN_SIZE connections are kept open, up to DB_POOL_MAX_SIZE under load.
+    """
+    return {
+        'pool_size': pool_min_size,
+        'max_overflow': max(pool_max_size - pool_min_size, 0),
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': pool_pre_ping,
+    }
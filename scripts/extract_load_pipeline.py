@@ -1,14 +1,27 @@
 import os
+import argparse
 import logging
 import asyncio
 import csv
+import io
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import pyarrow as pa
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2 import sql
 from telethon import TelegramClient, events
-from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
-from prometheus_client import start_http_server, Counter
+from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError, FloodWaitError
+import db_pool
+import metrics
+import partitions
+import profiling
+from checkpoints import CheckpointStore
+from load_csv import append_dataset
+from clean_messages import clean_frame, clean_rows
+import telegram_source
 
 
 load_dotenv()
@@ -26,20 +39,103 @@ api_id = os.getenv('TELEGRAM_API_ID')
 api_hash = os.getenv('TELEGRAM_API_HASH')
 phone_number = os.getenv('TELEGRAM_PHONE_NUMBER')
 
-# PostgreSQL database credentials
-db_host = os.getenv('DB_HOST')
-db_name = os.getenv('DB_NAME')
-db_user = os.getenv('DB_USER')
-db_password = os.getenv('DB_PASSWORD')
+# Channels to scrape; override with a comma-separated CHANNEL_URLS
+DEFAULT_CHANNEL_URLS = [
+    'https://t.me/DoctorsET',
+    'https://t.me/lobelia4cosmetics',
+    'https://t.me/yetenaweg',
+    'https://t.me/EAHCI'
+]
+channel_urls = [url.strip() for url in os.getenv('CHANNEL_URLS', ','.join(DEFAULT_CHANNEL_URLS)).split(',') if url.strip()]
+
+# Number of channels fetched from Telegram at the same time
+extract_concurrency = int(os.getenv('EXTRACT_CONCURRENCY', '4'))
+# How many times a channel request is retried after Telegram answers with FloodWait
+flood_wait_retries = int(os.getenv('FLOOD_WAIT_RETRIES', '3'))
+
+# 'incremental' fetches messages newer than each channel's checkpoint,
+# 'backfill' pages older history below the oldest loaded message
+scrape_mode = os.getenv('SCRAPE_MODE', 'incremental')
+# Messages fetched on the first incremental run of a channel without a checkpoint
+initial_fetch_limit = int(os.getenv('INITIAL_FETCH_LIMIT', '100'))
+# Messages written and checkpointed together
+fetch_chunk_size = int(os.getenv('FETCH_CHUNK_SIZE', '500'))
+checkpoint_file = os.getenv('CHECKPOINT_FILE', '../data/checkpoints.json')
+# 'dataframe' builds a pandas DataFrame per chunk, 'stream' passes plain row tuples
+# straight from Telethon to the CSV and DB writers
+pipeline_mode = os.getenv('PIPELINE_MODE', 'dataframe')
 
 # Directory to save CSV files
 csv_directory = os.getenv('CSV_DIRECTORY', '../data/raw')
 
-# Prometheus metrics
-messages_processed_counter = Counter('messages_processed', 'Number of messages processed')
+# Raw landing layer: 'csv' appends to one file per channel, 'parquet' appends to a
+# compressed Parquet dataset partitioned by channel and message date
+landing_format = os.getenv('LANDING_FORMAT', 'csv')
+parquet_directory = os.getenv('PARQUET_DIRECTORY', '../data/raw/telegram_messages')
+
+# Database load strategy: 'bulk' stages batches through COPY and merges them with a
+# single INSERT ... ON CONFLICT, 'row' keeps the original per-row SELECT/UPDATE/INSERT path
+load_mode = os.getenv('LOAD_MODE', 'bulk')
+load_batch_size = int(os.getenv('LOAD_BATCH_SIZE', '5000'))
+# When set, each chunk is also cleaned like the dbt models (clean_messages.py) and
+# upserted into this table, so cleaned rows are queryable before dbt runs
+clean_table_name = os.getenv('CLEAN_TABLE', '')
+
+MESSAGE_COLUMNS = ['channel', 'message_id', 'content', 'timestamp', 'views', 'message_link']
+TIMESTAMP_INDEX = MESSAGE_COLUMNS.index('timestamp')
+MESSAGE_ARROW_SCHEMA = pa.schema([
+    ('channel', pa.string()),
+    ('message_id', pa.int64()),
+    ('content', pa.string()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('views', pa.float64()),
+    ('message_link', pa.string()),
+])
+
+# Tables whose DDL already ran on this process's pooled connections, with their ON CONFLICT columns
+_created_tables = {}
+
+class StageStats:
+    """Thread-safe per-stage row and time counters for throughput reporting."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, rows, seconds):
+        with self._lock:
+            totals = self._stages.setdefault(stage, [0, 0.0])
+            totals[0] += rows
+            totals[1] += seconds
+
+    def summary(self):
+        """Return {stage: {'rows', 'seconds', 'rows_per_second'}}."""
+        with self._lock:
+            return {
+                stage: {
+                    'rows': rows,
+                    'seconds': round(seconds, 3),
+                    'rows_per_second': round(rows / seconds, 1) if seconds else None,
+                }
+                for stage, (rows, seconds) in self._stages.items()
+            }
+
+    def report(self):
+        for stage, totals in self.summary().items():
+            logging.info(f'Stage {stage}: {totals["rows"]} rows in {totals["seconds"]}s '
+                         f'({totals["rows_per_second"]} rows/s)')
+
 
 async def start_telegram_client():
-    """Start the Telegram client and handle authentication."""
+    """
+    Start the Telegram client and handle authentication.
+
+    With TELEGRAM_SOURCE=synthetic or replay, returns an offline FakeTelegramClient instead.
+    """
+    client = telegram_source.open_client()
+    if client is not None:
+        logging.info(f'Using the offline {telegram_source.TELEGRAM_SOURCE} Telegram source')
+        return client
     client = TelegramClient(phone_number, api_id, api_hash)
     await client.connect()
     if not await client.is_user_authorized():
@@ -53,113 +149,532 @@ async def start_telegram_client():
             return None
     return client
 
-async def extract_telegram_data(client):
-    """Extract data from Telegram channels."""
-    channel_urls = [
-        'https://t.me/DoctorsET',
-        'https://t.me/lobelia4cosmetics',
-        'https://t.me/yetenaweg',
-        'https://t.me/EAHCI'
-    ]
-    for channel_url in channel_urls:
+async def call_with_flood_wait(channel_url, request, *args, **kwargs):
+    """
+    Await a Telegram request, sleeping for the server-requested interval and
+    retrying when Telegram answers with FloodWait.
+    """
+    for attempt in range(flood_wait_retries + 1):
         try:
-            channel = await client.get_entity(channel_url)
-            messages = await client.get_messages(channel, limit=100)
-            data = [{
-                'channel': channel.title,
-                'message_id': message.id,
-                'content': message.message,
-                'timestamp': message.date,
-                'views': message.views,
-                'message_link': f'https://t.me/{channel.username}/{message.id}' if channel.username else None
-            } for message in messages]
-            df = pd.DataFrame(data)
-            save_to_csv(df, channel.title)
-            save_to_database(df, 'telegram_messages')
-            messages_processed_counter.inc(len(messages))
-        except Exception as e:
-            logging.error(f'Error extracting data from {channel_url}: {e}')
+            return await request(*args, **kwargs)
+        except FloodWaitError as e:
+            metrics.telegram_flood_waits.labels(channel_url).inc()
+            if attempt == flood_wait_retries:
+                raise
+            logging.warning(f'FloodWait on {channel_url}: sleeping {e.seconds}s '
+                            f'(retry {attempt + 1}/{flood_wait_retries})')
+            await asyncio.sleep(e.seconds + 1)
 
-def save_to_csv(df, channel_title):
-    """Save DataFrame to a CSV file."""
+def save_clean_chunk(chunk, channel_title, stats):
+    """Clean a chunk (a DataFrame or MESSAGE_COLUMNS row tuples) and upsert it into CLEAN_TABLE."""
+    started = time.perf_counter()
+    if isinstance(chunk, pd.DataFrame):
+        # from_pandas turns NaN views and NaT timestamps into nulls, as they are in the database
+        cleaned = _df_to_rows(clean_frame(chunk, MESSAGE_ARROW_SCHEMA))
+    else:
+        cleaned = clean_rows(chunk, MESSAGE_COLUMNS, MESSAGE_ARROW_SCHEMA)
+    stats.record('clean', len(chunk), time.perf_counter() - started)
+    started = time.perf_counter()
+    if cleaned and save_rows_to_database(cleaned, clean_table_name) is None:
+        raise RuntimeError(f'Clean load failed for {channel_title}')
+    stats.record('clean_db', len(cleaned), time.perf_counter() - started)
+
+def save_channel_data(df, channel_title, stats=None):
+    """
+    Write one chunk of channel messages to the landing zone and the database; runs in a
+    worker thread. Raises RuntimeError if either write fails.
+    """
+    stats = stats or StageStats()
+    started = time.perf_counter()
+    if landing_format == 'parquet':
+        written_bytes = save_to_parquet(df)
+    else:
+        written_bytes = save_to_csv(df, channel_title)
+    # Raise like a failed database load, so the checkpoint does not move past a chunk missing from landing
+    if written_bytes is None:
+        raise RuntimeError(f'Landing write failed for {channel_title}')
+    stats.record(landing_format, len(df), time.perf_counter() - started)
+    started = time.perf_counter()
+    if save_to_database(df, 'telegram_messages') is None:
+        raise RuntimeError(f'Database load failed for {channel_title}')
+    stats.record('db', len(df), time.perf_counter() - started)
+    if clean_table_name:
+        save_clean_chunk(df, channel_title, stats)
+    metrics.messages_processed.inc(len(df))
+
+def save_channel_rows(rows, channel_title, stats=None):
+    """Streaming counterpart of save_channel_data taking MESSAGE_COLUMNS row tuples."""
+    stats = stats or StageStats()
+    started = time.perf_counter()
+    if landing_format == 'parquet':
+        # Build the Arrow table column by column; no pandas objects in stream mode
+        written_bytes = save_to_parquet(
+            pa.table(dict(zip(MESSAGE_COLUMNS, map(list, zip(*rows)))), schema=MESSAGE_ARROW_SCHEMA))
+    else:
+        written_bytes = append_rows_to_csv(rows, MESSAGE_COLUMNS, channel_title)
+    if written_bytes is None:
+        raise RuntimeError(f'Landing write failed for {channel_title}')
+    stats.record(landing_format, len(rows), time.perf_counter() - started)
+    started = time.perf_counter()
+    if save_rows_to_database(rows, 'telegram_messages') is None:
+        raise RuntimeError(f'Database load failed for {channel_title}')
+    stats.record('db', len(rows), time.perf_counter() - started)
+    if clean_table_name:
+        save_clean_chunk(rows, channel_title, stats)
+    metrics.messages_processed.inc(len(rows))
+
+def fetch_kwargs(checkpoint, mode):
+    """
+    Build iter_messages arguments that resume from a channel checkpoint.
+
+    Returns None when there is nothing left to fetch.
+    """
+    if mode == 'incremental':
+        if checkpoint.get('last_message_id'):
+            # Oldest-first above the high-water mark, so each chunk extends it contiguously
+            return {'min_id': checkpoint['last_message_id'], 'reverse': True}
+        return {'limit': initial_fetch_limit}
+    if mode == 'backfill':
+        if checkpoint.get('backfill_complete'):
+            return None
+        # Newest-first below the oldest loaded message
+        return {'offset_id': checkpoint.get('oldest_message_id') or 0}
+    raise ValueError(f"Unsupported scrape mode: {mode}. Use 'incremental' or 'backfill'.")
+
+async def iter_message_chunks(client, channel, chunk_size, stats=None, label=None, **kwargs):
+    """
+    Yield lists of at most chunk_size messages from client.iter_messages.
+
+    Time spent waiting on Telegram (not on the consumer) is recorded as the 'fetch' stage,
+    and in the fetch metrics under label (the channel URL; the title by default).
+    """
+    fetch_seconds = metrics.telegram_fetch_seconds.labels(label or channel.title)
+    fetched = metrics.telegram_messages_fetched.labels(label or channel.title)
+
+    def record(count, seconds):
+        if stats:
+            stats.record('fetch', count, seconds)
+        fetch_seconds.observe(seconds)
+        fetched.inc(count)
+
+    chunk = []
+    started = time.perf_counter()
+    async for message in client.iter_messages(channel, **kwargs):
+        chunk.append(message)
+        if len(chunk) >= chunk_size:
+            record(len(chunk), time.perf_counter() - started)
+            yield chunk
+            chunk = []
+            started = time.perf_counter()
+    if chunk:
+        record(len(chunk), time.perf_counter() - started)
+        yield chunk
+
+def messages_to_rows(channel, messages):
+    """Build MESSAGE_COLUMNS row tuples from Telethon messages."""
+    return [(
+        channel.title,
+        message.id,
+        message.message,
+        message.date,
+        message.views,
+        f'https://t.me/{channel.username}/{message.id}' if channel.username else None
+    ) for message in messages]
+
+def messages_to_df(channel, messages):
+    """Build a MESSAGE_COLUMNS DataFrame from Telethon messages."""
+    return pd.DataFrame(messages_to_rows(channel, messages), columns=MESSAGE_COLUMNS)
+
+async def extract_channel_data(client, channel_url, semaphore, executor, checkpoints, mode,
+                               stream=False, stats=None):
+    """
+    Fetch one channel under the concurrency limit, resuming from its checkpoint.
+
+    Each chunk is written through the executor and only then checkpointed, so an
+    interrupted or failed run resumes after the last chunk that reached both the landing
+    zone and the database. In stream
+    mode chunks stay plain row tuples end to end, so memory is bounded by the chunk size.
+    """
+    stats = stats or StageStats()
+    try:
+        async with semaphore:
+            channel = await call_with_flood_wait(channel_url, client.get_entity, channel_url)
+            loop = asyncio.get_running_loop()
+            fetched = 0
+            for attempt in range(flood_wait_retries + 1):
+                kwargs = fetch_kwargs(checkpoints.get(channel_url), mode)
+                if kwargs is None:
+                    logging.info(f'Backfill already complete for {channel_url}')
+                    return
+                try:
+                    chunks = iter_message_chunks(client, channel, fetch_chunk_size, stats, channel_url, **kwargs)
+                    async for chunk in chunks:
+                        started = time.perf_counter()
+                        if stream:
+                            payload, save = messages_to_rows(channel, chunk), save_channel_rows
+                        else:
+                            payload, save = messages_to_df(channel, chunk), save_channel_data
+                        stats.record('transform', len(chunk), time.perf_counter() - started)
+                        # Landing and DB writes block, so keep them off the event loop
+                        await loop.run_in_executor(executor, save, payload, channel.title, stats)
+                        checkpoints.advance(channel_url, [message.id for message in chunk])
+                        fetched += len(chunk)
+                    break
+                except FloodWaitError as e:
+                    # Telethon sleeps through short waits itself; longer ones restart from the checkpoint
+                    if attempt == flood_wait_retries:
+                        raise
+                    logging.warning(f'FloodWait on {channel_url}: sleeping {e.seconds}s '
+                                    f'(retry {attempt + 1}/{flood_wait_retries})')
+                    await asyncio.sleep(e.seconds + 1)
+            if mode == 'backfill':
+                checkpoints.mark_backfill_complete(channel_url)
+            logging.info(f'[{mode}] Fetched {fetched} new messages from {channel_url}')
+    except Exception as e:
+        logging.error(f'Error extracting data from {channel_url}: {e}')
+
+async def extract_telegram_data(client, urls=None, concurrency=None, mode=None, checkpoints=None,
+                                stream=None):
+    """
+    Extract data from Telegram channels concurrently.
+
+    Args:
+        client (TelegramClient): Connected Telegram client.
+        urls (list): Channel URLs; defaults to CHANNEL_URLS.
+        concurrency (int): Maximum channels fetched at once; defaults to EXTRACT_CONCURRENCY.
+        mode (str): 'incremental' or 'backfill'; defaults to SCRAPE_MODE.
+        checkpoints (CheckpointStore): Per-channel high-water marks; defaults to CHECKPOINT_FILE.
+        stream (bool): Skip DataFrame materialization; defaults to PIPELINE_MODE == 'stream'.
+
+    Returns:
+        dict: Per-stage throughput from StageStats.summary().
+    """
+    urls = urls or channel_urls
+    mode = mode or scrape_mode
+    checkpoints = checkpoints or CheckpointStore(checkpoint_file)
+    stream = pipeline_mode == 'stream' if stream is None else stream
+    stats = StageStats()
+    semaphore = asyncio.Semaphore(concurrency or extract_concurrency)
+    started = time.perf_counter()
+    # One writer thread per pooled connection so writes never wait on the pool
+    with ThreadPoolExecutor(max_workers=db_pool.pool_max_size) as executor:
+        await asyncio.gather(*(
+            extract_channel_data(client, channel_url, semaphore, executor, checkpoints, mode, stream, stats)
+            for channel_url in urls
+        ))
+    logging.info(f'Extracted {len(urls)} channels in {time.perf_counter() - started:.2f}s')
+    stats.report()
+    return stats.summary()
+
+def append_rows_to_csv(rows, columns, channel_title):
+    """
+    Append rows to the channel's CSV file, writing the header for a new file.
+    Returns the number of bytes written, or None if the write failed.
+    """
     if not os.path.exists(csv_directory):
         os.makedirs(csv_directory)
     csv_file_path = os.path.join(csv_directory, f'{channel_title}.csv')
     try:
-        with open(csv_file_path, 'w', newline='', encoding='utf-8') as f:
+        write_header = not os.path.exists(csv_file_path)
+        size = 0 if write_header else os.path.getsize(csv_file_path)
+        with open(csv_file_path, 'a', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             # Write header
-            writer.writerow(df.columns)
+            if write_header:
+                writer.writerow(columns)
             # Write data rows
-            for index, row in df.iterrows():
-                writer.writerow(row)
+            writer.writerows(rows)
+        written_bytes = os.path.getsize(csv_file_path) - size
+        metrics.landing_write_bytes.labels('csv').inc(written_bytes)
         logging.info(f'Saved data to CSV file: {csv_file_path}')
+        return written_bytes
     except Exception as e:
         logging.error(f'Error saving data to CSV file: {e}')
+        return None
 
-def save_to_database(df, table_name):
-    """Save DataFrame to PostgreSQL database."""
-    try:
-        conn = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_password
+def save_to_csv(df, channel_title):
+    """Append DataFrame rows to the channel's CSV file, writing the header for a new file."""
+    return append_rows_to_csv(df.itertuples(index=False, name=None), df.columns, channel_title)
+
+def save_to_parquet(data):
+    """Append messages (DataFrame or Arrow table) to the partitioned Parquet landing dataset."""
+    written_bytes = append_dataset(data, parquet_directory, schema=MESSAGE_ARROW_SCHEMA)
+    if written_bytes is None:
+        logging.error(f'Error saving data to Parquet dataset: {parquet_directory}')
+    else:
+        metrics.landing_write_bytes.labels('parquet').inc(written_bytes)
+        logging.info(f'Appended {len(data)} rows ({written_bytes} bytes) to Parquet dataset: {parquet_directory}')
+    return written_bytes
+
+def _is_missing(value):
+    """True for None and the NaN/NaT values pandas uses for missing data."""
+    return value is None or (not isinstance(value, str) and pd.isna(value))
+
+def _copy_value(value):
+    """Format a single value for PostgreSQL COPY text format."""
+    if _is_missing(value):
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+def _df_to_rows(df):
+    """Convert a DataFrame to a list of tuples in MESSAGE_COLUMNS order."""
+    return list(df[MESSAGE_COLUMNS].itertuples(index=False, name=None))
+
+def _create_table(cursor, table_name):
+    """
+    Create the messages table partitioned by month on timestamp (see partitions.py),
+    its natural-key unique index and the search indexes: a generated tsvector column
+    with a GIN index and a pg_trgm index on content. Both are maintained by PostgreSQL
+    as rows are inserted, so loads need no extra step.
+
+    Returns the ON CONFLICT columns for the table, read from its natural-key unique
+    index (see _natural_key). A partitioned table can only enforce uniqueness with the
+    partition key included, so timestamp is NOT NULL and part of the key; tables created
+    before partitioning keep (channel, message_id) until partitions.py migrate converts
+    them, and a table created by the API's create_all has (channel, message_id, timestamp).
+    """
+    create_table_query = sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {} (
+            id SERIAL,
+            channel TEXT,
+            message_id INT,
+            content TEXT,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            views FLOAT,
+            message_link TEXT
+        ) PARTITION BY RANGE (timestamp)
+    """).format(sql.Identifier(table_name))
+    cursor.execute(create_table_query)
+    conflict_columns = ['channel', 'message_id']
+    if partitions.is_partitioned(cursor, table_name):
+        conflict_columns.append('timestamp')
+        cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} (id, timestamp)").format(
+            sql.Identifier(f'{table_name}_id_timestamp_key'), sql.Identifier(table_name)))
+    create_index_query = sql.SQL("""
+        CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})
+    """).format(sql.Identifier(f'{table_name}_channel_message_id_key'), sql.Identifier(table_name),
+                sql.SQL(', ').join(map(sql.Identifier, conflict_columns)))
+    cursor.execute(create_index_query)
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cursor.execute(sql.SQL("""
+        ALTER TABLE {} ADD COLUMN IF NOT EXISTS content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+    """).format(sql.Identifier(table_name)))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING gin (content_tsv)").format(
+        sql.Identifier(f'ix_{table_name}_content_tsv'), sql.Identifier(table_name)))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING gin (content gin_trgm_ops)").format(
+        sql.Identifier(f'ix_{table_name}_content_trgm'), sql.Identifier(table_name)))
+    return _natural_key(cursor, table_name)
+
+def _natural_key(cursor, table_name):
+    """
+    Columns of the table's narrowest unique index on (channel, message_id[, timestamp]).
+
+    The index named <table>_channel_message_id_key may already exist with other columns
+    (created by the API, or before partitioning), in which case CREATE ... IF NOT EXISTS
+    above did nothing; ON CONFLICT has to name the columns of the index that is there.
+    """
+    cursor.execute("""
+        SELECT array(SELECT a.attname::text
+                     FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+                     JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                     ORDER BY k.position)
+        FROM pg_index i
+        WHERE i.indrelid = to_regclass(%s) AND i.indisunique
+          AND i.indpred IS NULL AND i.indexprs IS NULL
+    """, (table_name,))
+    candidates = [columns for (columns,) in cursor.fetchall()
+                  if {'channel', 'message_id'} <= set(columns) <= {'channel', 'message_id', 'timestamp'}]
+    if not candidates:
+        raise RuntimeError(f'{table_name} has no unique index on (channel, message_id[, timestamp])')
+    return min(candidates, key=len)
+
+def _row_upsert(cursor, table_name, rows):
+    """Upsert rows one at a time with a SELECT followed by an UPDATE or INSERT."""
+    inserted = updated = 0
+    select_query = sql.SQL("""
+        SELECT 1 FROM {} WHERE message_id = %s
+    """).format(sql.Identifier(table_name))
+    update_query = sql.SQL("""
+        UPDATE {} SET
+            channel = %s,
+            content = %s,
+            timestamp = %s,
+            views = %s,
+            message_link = %s
+        WHERE message_id = %s
+    """).format(sql.Identifier(table_name))
+    insert_query = sql.SQL("""
+        INSERT INTO {} (channel, message_id, content, timestamp, views, message_link)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """).format(sql.Identifier(table_name))
+    for channel, message_id, content, timestamp, views, message_link in rows:
+        cursor.execute(select_query, (message_id,))
+        if cursor.fetchone():
+            cursor.execute(update_query, (channel, content, timestamp, views, message_link, message_id))
+            updated += 1
+        else:
+            cursor.execute(insert_query, (channel, message_id, content, timestamp, views, message_link))
+            inserted += 1
+    return inserted, updated
+
+def _bulk_upsert(cursor, table_name, rows):
+    """
+    Stage rows into a temporary table with COPY and merge them into the target
+    table with a single INSERT ... ON CONFLICT (channel, message_id[, timestamp]) DO UPDATE.
+    When timestamp is part of the key, a stored copy of a message with a different
+    timestamp is deleted first, so a re-dated message replaces its row.
+
+    Returns a tuple of (inserted, updated) row counts.
+    """
+    stage_name = f'{table_name}_stage'
+    cursor.execute(sql.SQL("""
+        CREATE TEMP TABLE IF NOT EXISTS {} (
+            channel TEXT,
+            message_id INT,
+            content TEXT,
+            timestamp TIMESTAMP WITH TIME ZONE,
+            views FLOAT,
+            message_link TEXT
+        ) ON COMMIT DELETE ROWS
+    """).format(sql.Identifier(stage_name)))
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(stage_name),
+        sql.SQL(', ').join(map(sql.Identifier, MESSAGE_COLUMNS))
+    )
+    cursor.copy_expert(copy_query, buffer)
+
+    conflict_columns = _created_tables.get(table_name, ['channel', 'message_id'])
+    moved = 0
+    if 'timestamp' in conflict_columns:
+        cursor.execute(sql.SQL("""
+            DELETE FROM {table} AS target USING {stage} AS stage
+            WHERE target.channel = stage.channel
+              AND target.message_id = stage.message_id
+              AND target.timestamp <> stage.timestamp
+        """).format(table=sql.Identifier(table_name), stage=sql.Identifier(stage_name)))
+        moved = cursor.rowcount
+
+    # DISTINCT ON keeps the latest copy of a message when a batch holds duplicates,
+    # since ON CONFLICT cannot touch the same target row twice in one statement.
+    # xmax is 0 only for freshly inserted tuples, which separates inserts from updates.
+    merge_query = sql.SQL("""
+        WITH merged AS (
+            INSERT INTO {table} (channel, message_id, content, timestamp, views, message_link)
+            SELECT DISTINCT ON (channel, message_id)
+                channel, message_id, content, timestamp, views, message_link
+            FROM {stage}
+            ORDER BY channel, message_id, timestamp DESC
+            ON CONFLICT ({conflict}) DO UPDATE SET
+                content = EXCLUDED.content,
+                timestamp = EXCLUDED.timestamp,
+                views = EXCLUDED.views,
+                message_link = EXCLUDED.message_link
+            RETURNING (xmax = 0) AS inserted
         )
-        cursor = conn.cursor()
-
-        # Create the table if it doesn't exist
-        create_table_query = sql.SQL("""
-            CREATE TABLE IF NOT EXISTS {} (
-                id SERIAL PRIMARY KEY,
-                channel TEXT,
-                message_id INT,
-                content TEXT,
-                timestamp TIMESTAMP WITH TIME ZONE,
-                views FLOAT,
-                message_link TEXT
-            )
-        """).format(sql.Identifier(table_name))
-        cursor.execute(create_table_query)
-
-        for index, row in df.iterrows():
-            select_query = sql.SQL("""
-                SELECT 1 FROM {} WHERE message_id = %s
-            """).format(sql.Identifier(table_name))
-            cursor.execute(select_query, (row['message_id'],))
-            if cursor.fetchone():
-                update_query = sql.SQL("""
-                    UPDATE {} SET
-                        channel = %s,
-                        content = %s,
-                        timestamp = %s,
-                        views = %s,
-                        message_link = %s
-                    WHERE message_id = %s
-                """).format(sql.Identifier(table_name))
-                cursor.execute(update_query, (row['channel'], row['content'], row['timestamp'], row['views'], row['message_link'], row['message_id']))
-            else:
-                insert_query = sql.SQL("""
-                    INSERT INTO {} (channel, message_id, content, timestamp, views, message_link)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """).format(sql.Identifier(table_name))
-                cursor.execute(insert_query, (row['channel'], row['message_id'], row['content'], row['timestamp'], row['views'], row['message_link']))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-        logging.info(f'Saved {len(df)} records to {table_name}')
+        SELECT
+            COUNT(*) FILTER (WHERE inserted),
+            COUNT(*) FILTER (WHERE NOT inserted)
+        FROM merged
+    """).format(table=sql.Identifier(table_name), stage=sql.Identifier(stage_name),
+               conflict=sql.SQL(', ').join(map(sql.Identifier, conflict_columns)))
+    cursor.execute(merge_query)
+    inserted, updated = cursor.fetchone()
+    # A replaced row is re-inserted under its new timestamp; count it as an update
+    return inserted - moved, updated + moved
+
+def save_to_database(df, table_name, mode=None, batch_size=None):
+    """
+    Save DataFrame to PostgreSQL database.
+
+    Args:
+        df (pandas.DataFrame): Messages with the MESSAGE_COLUMNS columns.
+        table_name (str): Target table.
+        mode (str): 'bulk' or 'row'; defaults to the LOAD_MODE environment variable.
+        batch_size (int): Rows per transaction; defaults to LOAD_BATCH_SIZE.
+
+    Returns:
+        dict: Total inserted, updated and rejected row counts, or None if the load failed.
+    """
+    return save_rows_to_database(_df_to_rows(df), table_name, mode, batch_size)
+
+def save_rows_to_database(rows, table_name, mode=None, batch_size=None):
+    """
+    Save MESSAGE_COLUMNS row tuples to PostgreSQL database. Rows without a timestamp
+    are rejected: it is the partition key and part of the natural key.
+
+    Args:
+        rows (list): Row tuples in MESSAGE_COLUMNS order.
+        table_name (str): Target table.
+        mode (str): 'bulk' or 'row'; defaults to the LOAD_MODE environment variable.
+        batch_size (int): Rows per transaction; defaults to LOAD_BATCH_SIZE.
+
+    Returns:
+        dict: Total inserted, updated and rejected row counts, or None if the load failed.
+    """
+    mode = mode or load_mode
+    batch_size = batch_size or load_batch_size
+    if mode not in ('bulk', 'row'):
+        raise ValueError(f"Unsupported load mode: {mode}. Use 'bulk' or 'row'.")
+    upsert = _bulk_upsert if mode == 'bulk' else _row_upsert
+    total_rows = len(rows)
+    rows = [row for row in rows if not _is_missing(row[TIMESTAMP_INDEX])]
+    if len(rows) < total_rows:
+        logging.warning(f'Rejected {total_rows - len(rows)} {table_name} rows without a timestamp')
+
+    try:
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+
+            if table_name not in _created_tables:
+                _created_tables[table_name] = _create_table(cursor, table_name)
+                conn.commit()
+
+            totals = {'inserted': 0, 'updated': 0, 'rejected': total_rows - len(rows)}
+            for batch_number, start in enumerate(range(0, len(rows), batch_size), start=1):
+                batch = rows[start:start + batch_size]
+                started = time.perf_counter()
+                timestamps = (row[TIMESTAMP_INDEX] for row in batch)
+                partitions.ensure_partitions(conn, table_name, partitions.months_spanned(timestamps))
+                inserted, updated = upsert(cursor, table_name, batch)
+                conn.commit()
+                elapsed = time.perf_counter() - started
+                metrics.db_batch_seconds.labels(table_name, mode).observe(elapsed)
+                metrics.db_batch_rows.labels(table_name).observe(len(batch))
+                totals['inserted'] += inserted
+                totals['updated'] += updated
+                logging.info(
+                    f'[{mode}] {table_name} batch {batch_number}: {len(batch)} rows, '
+                    f'{inserted} inserted, {updated} updated in {elapsed:.3f}s'
+                )
+
+            cursor.close()
+        logging.info(f'Saved {len(rows)} records to {table_name} '
+                     f'({totals["inserted"]} inserted, {totals["updated"]} updated)')
+        return totals
     except psycopg2.DatabaseError as e:
         logging.error(f'Database error: {e}')
     except Exception as e:
         logging.error(f'Error saving data to database: {e}')
+    return None
 
 async def main():
     """Main function to orchestrate the data pipeline."""
     try:
         # Start Prometheus HTTP server
-        start_http_server(8000)
-        
+        metrics.register_pool('pipeline', db_pool.pool_status)
+        metrics.start_metrics_server()
+
         client = await start_telegram_client()
         if client:
             await extract_telegram_data(client)
@@ -168,6 +683,13 @@ async def main():
         logging.info("Telegram data extraction and loading process completed successfully.")
     except Exception as e:
         logging.error(f"Telegram data extraction and loading process failed: {e}")
+    finally:
+        db_pool.close_pool()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description='Extract Telegram channel messages and load them into PostgreSQL.')
+    parser.add_argument('--profile', action='store_true', default=profiling.profile_enabled,
+                        help='Profile the run with cProfile (default: PROFILE)')
+    args = parser.parse_args()
+    with profiling.profiled('extract_load_pipeline', args.profile):
+        asyncio.run(main())
@@ -0,0 +1,80 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ImageManifest:
+    """
+    Append-only JSON-lines index of the Telegram photos the image scraper has fetched.
+
+    Each line records one message:
+        channel, message_id: the message the photo was posted in.
+        channel_title: the channel title, as stored in telegram_messages.channel.
+        photo_id: Telegram's id of the photo; forwards and reposts share it.
+        sha256: hash of the image bytes; the stored object is named after it.
+        path: object path relative to the image directory.
+        date: message date (ISO 8601).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = []
+        self._messages = set()
+        self._photos = {}
+        self._hashes = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+        except (OSError, ValueError) as e:
+            logger.error(f'Error reading image manifest {self.path}: {e}')
+            raise
+
+    def _index(self, entry):
+        self._entries.append(entry)
+        self._messages.add((entry['channel'], entry['message_id']))
+        self._photos.setdefault(entry['photo_id'], entry)
+        self._hashes.setdefault(entry['sha256'], entry['path'])
+
+    def __len__(self):
+        return len(self._messages)
+
+    def entries(self):
+        """Return every recorded entry in the order it was written."""
+        with self._lock:
+            return list(self._entries)
+
+    def has_message(self, channel, message_id):
+        """Return True if the photo of this message has already been recorded."""
+        with self._lock:
+            return (channel, message_id) in self._messages
+
+    def photo(self, photo_id):
+        """Return the first entry recorded for a Telegram photo id, or None."""
+        with self._lock:
+            return self._photos.get(photo_id)
+
+    def object_path(self, sha256):
+        """Return the stored object path for a content hash, or None."""
+        with self._lock:
+            return self._hashes.get(sha256)
+
+    def record(self, entry):
+        """Append an entry and index it; the line is flushed before returning."""
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+            self._index(entry)
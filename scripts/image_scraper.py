@@ -1,44 +1,259 @@
 import os
-from telethon.sync import TelegramClient
+import asyncio
+import argparse
+import hashlib
+import logging
+import shutil
+import time
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from telethon.tl.types import InputMessagesFilterPhotos
 from dotenv import load_dotenv
 from datetime import datetime, timezone
+from image_manifest import ImageManifest
+import metrics
+import profiling
+import telegram_source
 
 
 # Load environment variables
 load_dotenv()
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 # Configuration
-api_id = int(os.getenv("API_ID"))
 api_hash = os.getenv("API_HASH")
 phone = os.getenv("PHONE")
 
+# Directory to save images. Image bytes are stored once under objects/ named by their
+# SHA-256; <channel>/<message_id>.jpg links to the object so YOLO label files keep
+# the Telegram message id as their name.
+SAVE_DIR = os.getenv('IMAGE_SAVE_DIR', 'telegram_images')
+MANIFEST_FILE = os.getenv('IMAGE_MANIFEST', os.path.join(SAVE_DIR, 'manifest.jsonl'))
+
+# Channels to download photos from; override with a comma-separated IMAGE_CHANNELS
+DEFAULT_IMAGE_CHANNELS = ['lobelia4cosmetics']
+image_channels = [c.strip() for c in os.getenv('IMAGE_CHANNELS', ','.join(DEFAULT_IMAGE_CHANNELS)).split(',') if c.strip()]
+
+# Photos downloaded at the same time across all channels
+download_concurrency = int(os.getenv('IMAGE_DOWNLOAD_CONCURRENCY', '8'))
+# How many times a download is retried after Telegram answers with FloodWait
+flood_wait_retries = int(os.getenv('FLOOD_WAIT_RETRIES', '3'))
+
+
+def object_path(sha256):
+    """Path of a stored image, relative to the image directory."""
+    return os.path.join('objects', sha256[:2], f'{sha256}.jpg')
+
+
+def store_object(save_dir, data):
+    """
+    Store image bytes content-addressed under save_dir.
+
+    Returns:
+        tuple: (sha256, relative path, True if the object was written or False if
+        identical bytes were already stored).
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    relpath = object_path(sha256)
+    path = os.path.join(save_dir, relpath)
+    if os.path.exists(path):
+        return sha256, relpath, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file and rename so a crash never leaves a truncated image
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return sha256, relpath, True
+
+
+def link_message_image(save_dir, channel, message_id, relpath):
+    """Expose a stored object as <save_dir>/<channel>/<message_id>.jpg (hard link, copy fallback)."""
+    link = os.path.join(save_dir, channel, f'{message_id}.jpg')
+    if os.path.exists(link):
+        return link
+    os.makedirs(os.path.dirname(link), exist_ok=True)
+    try:
+        os.link(os.path.join(save_dir, relpath), link)
+    except OSError:
+        shutil.copyfile(os.path.join(save_dir, relpath), link)
+    return link
+
+
+class ImageDownloader:
+    """
+    Download channel photos with a bounded pool of worker tasks.
+
+    Listing tasks (one per channel) queue photo messages that are not in the manifest;
+    workers fetch them. A photo id already in the manifest is linked without contacting
+    Telegram, a photo id being fetched by another worker is awaited instead of fetched
+    twice, and bytes matching a stored hash are not written again.
+    """
 
+    def __init__(self, client, manifest, save_dir=SAVE_DIR, concurrency=None):
+        self.client = client
+        self.manifest = manifest
+        self.save_dir = save_dir
+        self.concurrency = concurrency or download_concurrency
+        self.queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        self._inflight = {}
+        self.stats = {'downloaded': 0, 'duplicate_photo': 0, 'duplicate_content': 0, 'already_fetched': 0, 'failed': 0,
+                      'failed_channels': 0}
 
-# Directory to save images
-SAVE_DIR = 'telegram_images'
+    async def _download(self, photo, channel):
+        for attempt in range(flood_wait_retries + 1):
+            try:
+                started = time.perf_counter()
+                data = await self.client.download_media(photo, file=bytes)
+                metrics.image_download_seconds.labels(channel).observe(time.perf_counter() - started)
+                metrics.image_downloads.labels(channel).inc()
+                metrics.image_download_bytes.labels(channel).inc(len(data))
+                break
+            except FloodWaitError as e:
+                metrics.telegram_flood_waits.labels(channel).inc()
+                if attempt == flood_wait_retries:
+                    raise
+                logger.warning(f'FloodWait downloading photo {photo.id}: sleeping {e.seconds}s '
+                               f'(retry {attempt + 1}/{flood_wait_retries})')
+                await asyncio.sleep(e.seconds + 1)
+        return await asyncio.to_thread(store_object, self.save_dir, data)
 
-# Create save directory if it doesn't exist
-os.makedirs(SAVE_DIR, exist_ok=True)
+    async def fetch_photo(self, photo, channel):
+        """Return (sha256, relative path) for a photo, downloading it at most once."""
+        entry = self.manifest.photo(photo.id)
+        if entry and os.path.exists(os.path.join(self.save_dir, entry['path'])):
+            self.stats['duplicate_photo'] += 1
+            return entry['sha256'], entry['path']
+        task = self._inflight.get(photo.id)
+        if task is not None:
+            self.stats['duplicate_photo'] += 1
+            sha256, relpath, _ = await task
+            return sha256, relpath
+        task = asyncio.ensure_future(self._download(photo, channel))
+        self._inflight[photo.id] = task
+        try:
+            sha256, relpath, created = await task
+        finally:
+            del self._inflight[photo.id]
+        self.stats['downloaded' if created else 'duplicate_content'] += 1
+        return sha256, relpath
+
+    async def save_message_photo(self, channel, channel_title, message):
+        sha256, relpath = await self.fetch_photo(message.photo, channel)
+        link_message_image(self.save_dir, channel, message.id, relpath)
+        self.manifest.record({
+            'channel': channel,
+            'channel_title': channel_title,
+            'message_id': message.id,
+            'photo_id': message.photo.id,
+            'sha256': sha256,
+            'path': relpath,
+            'date': message.date.isoformat(),
+        })
+
+    async def worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                if item is None:
+                    return
+                channel, channel_title, message = item
+                try:
+                    await self.save_message_photo(channel, channel_title, message)
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    logger.error(f'Error downloading photo of {channel}/{message.id}: {e}')
+            finally:
+                self.queue.task_done()
+
+    async def list_channel(self, channel, start_date=None, end_date=None, max_images=None):
+        """
+        Queue the channel's photo messages in [start_date, end_date], newest first.
+
+        A channel that cannot be listed (private, renamed, FloodWait) is logged and
+        counted in failed_channels; the other channels carry on.
+        """
+        queued = 0
+        try:
+            entity = await self.client.get_entity(channel)
+            # telegram_messages stores the channel title, so keep it for linking detections
+            channel_title = getattr(entity, 'title', channel)
+            async for message in self.client.iter_messages(entity, filter=InputMessagesFilterPhotos, offset_date=end_date):
+                message_date = message.date.replace(tzinfo=timezone.utc)  # Make message date timezone aware
+                if start_date and message_date < start_date:
+                    break
+                if max_images and queued >= max_images:
+                    break
+                if message.photo is None:
+                    continue
+                if self.manifest.has_message(channel, message.id):
+                    self.stats['already_fetched'] += 1
+                    continue
+                await self.queue.put((channel, channel_title, message))
+                queued += 1
+        except Exception as e:
+            self.stats['failed_channels'] += 1
+            logger.error(f'Error listing photos of {channel} after queuing {queued}: {e}')
+            return
+        logger.info(f'Queued {queued} photos from {channel}')
+
+    async def run(self, channels, start_date=None, end_date=None, max_images=None):
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*(self.list_channel(channel, start_date, end_date, max_images) for channel in channels))
+        finally:
+            for _ in workers:
+                await self.queue.put(None)
+            await asyncio.gather(*workers)
+        logger.info(f'Image download finished: {self.stats}')
+        return dict(self.stats)
 
-# Connect to Telegram
-client = TelegramClient(phone, api_id, api_hash)
 
 # Function to download images
-async def download_images(channel, start_date=None, end_date=None, max_images=None):
-    image_count = 0
-    async for message in client.iter_messages(channel, filter=InputMessagesFilterPhotos):
-        message_date = message.date.replace(tzinfo=timezone.utc)  # Make message date timezone aware
-        if (start_date and message_date < start_date) or (end_date and message_date > end_date):
-            continue
-        if max_images and image_count >= max_images:
-            break
-        # Download the photo
-        await client.download_media(message.photo, file=os.path.join(SAVE_DIR, f'{message.id}.jpg'))
-        image_count += 1
-channel_name = 'lobelia4cosmetics'
-# Start the client
-with client:
-    # Run the function to download images from the channel
-    client.loop.run_until_complete(download_images(channel_name,start_date=datetime(2024, 4, 1, tzinfo=timezone.utc), end_date=datetime(2024, 6, 10, tzinfo=timezone.utc),max_images=100))
+async def download_images(client, channels, start_date=None, end_date=None, max_images=None,
+                          save_dir=SAVE_DIR, manifest_file=MANIFEST_FILE, concurrency=None):
+    os.makedirs(save_dir, exist_ok=True)
+    downloader = ImageDownloader(client, ImageManifest(manifest_file), save_dir, concurrency)
+    return await downloader.run(channels, start_date, end_date, max_images)
+
+
+def parse_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download photos from Telegram channels.')
+    parser.add_argument('--channels', nargs='+', default=image_channels)
+    parser.add_argument('--start-date', type=parse_date, default=datetime(2024, 4, 1, tzinfo=timezone.utc))
+    parser.add_argument('--end-date', type=parse_date, default=datetime(2024, 6, 10, tzinfo=timezone.utc))
+    parser.add_argument('--max-images', type=int, default=100, help='Maximum new photos per channel')
+    parser.add_argument('--concurrency', type=int, default=download_concurrency)
+    parser.add_argument('--profile', action='store_true', default=profiling.profile_enabled,
+                        help='Profile the run with cProfile (default: PROFILE)')
+    args = parser.parse_args()
+    metrics.start_metrics_server()
+
+    with profiling.profiled('image_scraper', args.profile):
+        # TELEGRAM_SOURCE=synthetic or replay serves photos from an offline client
+        fake_client = telegram_source.open_client()
+        if fake_client is not None:
+            asyncio.run(download_images(
+                fake_client, args.channels, start_date=args.start_date, end_date=args.end_date,
+                max_images=args.max_images, concurrency=args.concurrency
+            ))
+            return
+
+        # Connect to Telegram
+        client = TelegramClient(phone, int(os.getenv("API_ID")), api_hash)
+        # Start the client
+        with client:
+            client.loop.run_until_complete(download_images(
+                client, args.channels, start_date=args.start_date, end_date=args.end_date,
+                max_images=args.max_images, concurrency=args.concurrency
+            ))
+
 
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,50 @@
 import os
 import sys
+import uuid
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
 
-def load_data(path):
+# Hive-style layout of the raw landing datasets: <root>/channel=<title>/date=<YYYY-MM-DD>/part-*.parquet
+LANDING_PARTITIONING = ds.partitioning(
+    pa.schema([('channel', pa.string()), ('date', pa.date32())]),
+    flavor='hive'
+)
+# Read side: channel comes back dictionary-encoded so it costs one string per partition
+LANDING_READ_PARTITIONING = ds.partitioning(
+    pa.schema([('channel', pa.dictionary(pa.int32(), pa.string())), ('date', pa.date32())]),
+    flavor='hive',
+    dictionaries='infer'
+)
+
+def load_data(path, columns=None, filters=None):
     """
-    Load the dataset from a CSV or Parquet file.
+    Load the dataset from a CSV or Parquet file, or a partitioned Parquet dataset directory.
 
     Args:
-        path (str): Path to the dataset file.
+        path (str): Path to the dataset file or dataset directory.
+        columns (list): Columns to read; all columns when None.
+        filters (list): Parquet only. pyarrow filter tuples such as
+            [('channel', '=', 'DoctorsET'), ('date', '>=', datetime.date(2024, 4, 1))].
+            Partition filters skip whole directories, other filters are checked
+            against row-group statistics before any data is read.
 
     Returns:
         pandas.DataFrame: The loaded dataset.
     """
     try:
+        # Check if the path is a partitioned Parquet dataset
+        if os.path.isdir(path):
+            df = pq.read_table(path, columns=columns, filters=filters,
+                               partitioning=LANDING_READ_PARTITIONING).to_pandas()
         # Check if the file is a Parquet file
-        if path.endswith('.parquet'):
-            df = pd.read_parquet(path, engine='pyarrow')
+        elif path.endswith('.parquet'):
+            df = pd.read_parquet(path, engine='pyarrow', columns=columns, filters=filters)
         # Check if the file is a CSV file
         elif path.endswith('.csv'):
-            df = pd.read_csv(path, low_memory=False)
+            df = pd.read_csv(path, low_memory=False, usecols=columns)
         else:
             raise ValueError("Unsupported file format. Please provide a CSV or Parquet file.")
         return df
@@ -57,4 +82,50 @@ def save_data(df, output_folder, filename):
         print(f"Error: {e}. An error occurred while creating the output folder.")
     except Exception as e:
         print(f"Error: {e}. An unknown error occurred while saving the dataset.")
-    return None
\ No newline at end of file
+    return None
+
+
+def append_dataset(data, output_folder, schema=None, compression='zstd'):
+    """
+    Append messages to a Parquet dataset partitioned by channel and message date.
+
+    Every call writes new uniquely named files, so existing data is never rewritten.
+
+    Args:
+        data (pandas.DataFrame or pyarrow.Table): Messages with channel and timestamp columns.
+        output_folder (str): Root folder of the dataset.
+        schema (pyarrow.Schema): Column types to enforce, so batches with all-null
+            columns still match the files already in the dataset.
+        compression (str): Parquet compression codec.
+
+    Returns:
+        int: Number of bytes written, or None if the write failed.
+    """
+    try:
+        if isinstance(data, pa.Table):
+            table = data.cast(schema) if schema is not None else data
+        else:
+            table = pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+        table = table.append_column('date', pc.cast(table['timestamp'], pa.date32()))
+        channel_index = table.schema.get_field_index('channel')
+        table = table.set_column(channel_index, 'channel', pc.dictionary_encode(table['channel']))
+
+        written = []
+        ds.write_dataset(
+            table,
+            output_folder,
+            format='parquet',
+            partitioning=LANDING_PARTITIONING,
+            basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+            existing_data_behavior='overwrite_or_ignore',
+            file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+            file_visitor=lambda written_file: written.append(written_file.size)
+        )
+        return sum(written)
+    except PermissionError as e:
+        print(f"Error: {e}. You do not have permission to write to the output folder.")
+    except OSError as e:
+        print(f"Error: {e}. An error occurred while writing the dataset.")
+    except Exception as e:
+        print(f"Error: {e}. An unknown error occurred while writing the dataset.")
+    return None
@@ -0,0 +1,105 @@
+"""
+Prometheus metrics shared by the pipeline scripts and the FastAPI app.
+
+Every stage records into the metrics defined here, so one scrape shows where time
+goes: Telegram fetches, landing writes, database batches, image downloads, YOLO
+label ingestion and API requests. Throughput is the rate() of the counters, e.g.
+rate(image_download_bytes_total[5m]) or rate(yolo_detections_loaded_total[5m]).
+
+Scripts call start_metrics_server() to serve the default registry on METRICS_PORT;
+the FastAPI app serves it at /metrics.
+"""
+import os
+import logging
+import threading
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+metrics_port = int(os.getenv('METRICS_PORT', '8000'))
+
+# Row counts per batch, from a handful of rows to the largest LOAD_BATCH_SIZE in use
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+messages_processed = Counter('messages_processed', 'Number of messages processed')
+
+telegram_fetch_seconds = Histogram(
+    'telegram_fetch_seconds', 'Time spent waiting on Telegram for one chunk of messages', ['channel'])
+telegram_messages_fetched = Counter('telegram_messages_fetched', 'Messages fetched from Telegram', ['channel'])
+telegram_flood_waits = Counter('telegram_flood_waits', 'FloodWait answers from Telegram', ['channel'])
+
+db_batch_seconds = Histogram(
+    'db_batch_write_seconds', 'Time to write and commit one database batch', ['table', 'mode'])
+db_batch_rows = Histogram('db_batch_rows', 'Rows per database batch', ['table'], buckets=ROW_BUCKETS)
+
+landing_write_bytes = Counter('landing_write_bytes', 'Bytes written to the landing zone', ['format'])
+
+image_downloads = Counter('image_downloads', 'Photos downloaded from Telegram', ['channel'])
+image_download_bytes = Counter('image_download_bytes', 'Bytes of photos downloaded from Telegram', ['channel'])
+image_download_seconds = Histogram('image_download_seconds', 'Time to download one photo', ['channel'])
+
+yolo_label_files_loaded = Counter('yolo_label_files_loaded', 'YOLO label files loaded into the database')
+yolo_detections_loaded = Counter(
+    'yolo_detections_loaded', 'Detections written to yolo_detection_results', ['source'])
+yolo_transaction_seconds = Histogram(
+    'yolo_transaction_seconds', 'Time to COPY and commit one transaction of detections', ['source'])
+
+http_request_seconds = Histogram(
+    'http_request_duration_seconds', 'API request latency', ['method', 'route', 'status'])
+http_requests_in_progress = Gauge('http_requests_in_progress', 'API requests being served', ['method', 'route'])
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+class PoolCollector:
+    """
+    Connection pool gauges read at scrape time.
+
+    pools maps a pool name to a callable returning the pool's current numbers, such as
+    db_pool.pool_status(); each one becomes db_pool_connections{pool, state}. One
+    collector serves every pool, since the registry allows a metric name only once.
+    """
+
+    def __init__(self):
+        self.pools = {}
+
+    def collect(self):
+        gauge = GaugeMetricFamily('db_pool_connections', 'Database connection pool sizes and usage',
+                                  labels=['pool', 'state'])
+        for name, status in list(self.pools.items()):
+            for state, value in status().items():
+                gauge.add_metric([name, state], value)
+        yield gauge
+
+
+_pool_collector = None
+
+
+def register_pool(name, status):
+    """Expose a connection pool's status as gauges; registering a name twice is a no-op."""
+    global _pool_collector
+    with _server_lock:
+        if _pool_collector is None:
+            _pool_collector = PoolCollector()
+            REGISTRY.register(_pool_collector)
+        _pool_collector.pools.setdefault(name, status)
+
+
+def start_metrics_server(port=None):
+    """
+    Serve the metrics on port (METRICS_PORT by default), once per process. A port that
+    is already taken, e.g. by another script on the same host, is logged and the
+    script runs on without an endpoint.
+    """
+    global _server_started
+    with _server_lock:
+        if not _server_started:
+            port = port or metrics_port
+            try:
+                start_http_server(port)
+            except OSError as e:
+                logger.warning(f'Metrics server not started on port {port}: {e}; set METRICS_PORT to a free port')
+                return
+            _server_started = True
@@ -0,0 +1,408 @@
+"""
+Monthly range partitions of the raw tables, and their retention.
+
+telegram_messages is partitioned on timestamp and yolo_detection_results on
+detected_at (the time a detection was loaded). Each month is a partition named
+<table>_pYYYY_MM; rows for a month whose partition does not exist yet go to
+<table>_default. The partition key is NOT NULL.
+
+The loaders call ensure_partitions with the months of each batch before writing it.
+Partitions older than the retention window are detached, exported to Parquet under
+ARCHIVE_DIRECTORY/<table>/month=YYYY-MM/ and dropped, so queries on recent data only
+touch recent partitions.
+
+    python partitions.py migrate              # convert existing plain tables, once
+    python partitions.py create --months-ahead 2
+    python partitions.py archive --retention-months 12
+"""
+import os
+import re
+import time
+import argparse
+import logging
+import threading
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycopg2 import sql
+from dotenv import load_dotenv
+import db_pool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Partition key of each raw table; other tables created by the loaders (CLEAN_TABLE) use timestamp
+PARTITIONED_TABLES = {'telegram_messages': 'timestamp', 'yolo_detection_results': 'detected_at'}
+DEFAULT_KEY = 'timestamp'
+
+# Months kept in the database before the current one; older partitions are archived
+retention_months = int(os.getenv('PARTITION_RETENTION_MONTHS', '12'))
+# Months after the current one created ahead of time by the create command
+months_ahead = int(os.getenv('PARTITION_MONTHS_AHEAD', '2'))
+archive_directory = os.getenv('ARCHIVE_DIRECTORY', '../data/archive')
+ARCHIVE_BATCH_SIZE = 50_000
+
+ARROW_TYPES = {
+    'integer': pa.int32(),
+    'bigint': pa.int64(),
+    'real': pa.float32(),
+    'double precision': pa.float64(),
+    'boolean': pa.bool_(),
+    'timestamp with time zone': pa.timestamp('us', tz='UTC'),
+    'timestamp without time zone': pa.timestamp('us'),
+}
+
+# Per-process state: whether a table is partitioned, and the months known to have a partition
+_partitioned = {}
+_months = {}
+_lock = threading.Lock()
+
+
+def month_start(value):
+    """First instant (UTC) of the month value falls in."""
+    value = pd.Timestamp(value)
+    value = value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def months_spanned(values):
+    """Every month from the earliest to the latest of values; missing values are ignored."""
+    values = [value for value in values if value is not None and value == value]
+    if not values:
+        return []
+    month, last = month_start(min(values)), month_start(max(values))
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def partition_key(table):
+    return PARTITIONED_TABLES.get(table, DEFAULT_KEY)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def partition_month(table, name):
+    """Month of a partition named by partition_name, or None for other tables."""
+    match = re.fullmatch(re.escape(table) + r'_p(\d{4})_(\d{2})', name)
+    return datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc) if match else None
+
+
+def is_partitioned(cursor, table):
+    """True if table exists and is partitioned; cached per process."""
+    if table not in _partitioned:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        _partitioned[table] = row[0] == 'p'
+    return _partitioned[table]
+
+
+def insert_columns(cursor, table):
+    """(name, data type) of the columns of table that accept values, in table order."""
+    cursor.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """, (table,))
+    return cursor.fetchall()
+
+
+def create_partition(cursor, table, month):
+    """
+    Create the partition of table for month, moving any rows for that month out of
+    the default partition first (PostgreSQL refuses the partition otherwise).
+    Returns False if it already exists.
+    """
+    name = partition_name(table, month)
+    cursor.execute("SELECT to_regclass(%s)", (name,))
+    if cursor.fetchone()[0]:
+        return False
+    key = sql.Identifier(partition_key(table))
+    default = sql.Identifier(f'{table}_default')
+    bounds = (month, add_months(month, 1))
+    in_month = sql.SQL("{key} >= %s AND {key} < %s").format(key=key)
+    columns = sql.SQL(', ').join(sql.Identifier(column) for column, _ in insert_columns(cursor, table))
+
+    cursor.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {} WHERE {})").format(default, in_month), bounds)
+    moved = cursor.fetchone()[0]
+    if moved:
+        cursor.execute(sql.SQL("CREATE TEMP TABLE partition_moved AS SELECT {} FROM {} WHERE {}").format(
+            columns, default, in_month), bounds)
+        cursor.execute(sql.SQL("DELETE FROM {} WHERE {}").format(default, in_month), bounds)
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+        sql.Identifier(name), sql.Identifier(table)), bounds)
+    if moved:
+        cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM partition_moved").format(
+            sql.Identifier(table), columns, columns))
+        logger.info(f'Moved {cursor.rowcount} rows from {table}_default to {name}')
+        cursor.execute("DROP TABLE partition_moved")
+    logger.info(f'Created partition {name}')
+    return True
+
+
+def ensure_partitions(conn, table, months):
+    """
+    Make sure table has a partition for each of months, and a default partition.
+
+    Safe to call before every batch: months already seen by this process are skipped
+    without a query, and plain (unpartitioned) tables are left alone. Concurrent
+    loaders serialize on an advisory lock. Commits.
+
+    Returns:
+        int: Partitions created.
+    """
+    months = {month_start(month) for month in months}
+    if not months <= _months.get(table, set()) or table not in _partitioned:
+        with _lock:
+            cursor = conn.cursor()
+            if not is_partitioned(cursor, table):
+                cursor.close()
+                return 0
+            known = _months.setdefault(table, set())
+            missing = months - known
+            created = 0
+            if missing or not known:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (table,))
+                cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT").format(
+                    sql.Identifier(f'{table}_default'), sql.Identifier(table)))
+                created = sum(create_partition(cursor, table, month) for month in sorted(missing))
+                conn.commit()
+            known.update(missing)
+            cursor.close()
+            return created
+    return 0
+
+
+def ensure_current_partitions(conn, table, now=None):
+    """
+    ensure_partitions for this month and the next, for tables keyed on load time, so
+    a load that crosses into the next month finds its partition there.
+    """
+    current = month_start(now or datetime.now(timezone.utc))
+    return ensure_partitions(conn, table, [current, add_months(current, 1)])
+
+
+def list_partitions(cursor, table):
+    """
+    Return {name: attached} for the monthly partitions of table, including partitions
+    that were detached but not yet archived.
+    """
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    attached = {row[0] for row in cursor.fetchall()}
+    # LIKE treats the underscores in the name as wildcards; partition_month filters exactly
+    cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE %s",
+                   (f'{table}_p%',))
+    names = {row[0] for row in cursor.fetchall()} | attached
+    return {name: name in attached for name in names if partition_month(table, name)}
+
+
+def export_partition(conn, table, name, month, directory):
+    """
+    Write every row of partition name to a zstd Parquet file under
+    directory/<table>/month=YYYY-MM/. Returns (rows, path); path is None when empty.
+    """
+    cursor = conn.cursor()
+    columns = insert_columns(cursor, name)
+    schema = pa.schema([(column, ARROW_TYPES.get(data_type, pa.string())) for column, data_type in columns])
+    # Server-side timestamps come back in the session zone; UTC keeps the export zone-independent
+    cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+    cursor.close()
+
+    path = os.path.join(directory, table, f'month={month:%Y-%m}', f'{name}-{int(time.time())}.parquet')
+    tmp_path = f'{path}.tmp'
+    rows = 0
+    writer = None
+    with conn.cursor(name=f'export_{name}') as cursor:
+        cursor.execute(sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(', ').join(sql.Identifier(column) for column, _ in columns), sql.Identifier(name)))
+        while True:
+            batch = cursor.fetchmany(ARCHIVE_BATCH_SIZE)
+            if not batch:
+                break
+            if writer is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(batch)
+    conn.commit()
+    if writer is None:
+        return 0, None
+    writer.close()
+    os.replace(tmp_path, path)
+    return rows, path
+
+
+def archive_partitions(conn, table, retention=None, directory=None, now=None, keep_detached=False):
+    """
+    Detach the partitions of table older than retention months before the current
+    month, export each to Parquet and drop it (or keep it detached with keep_detached).
+
+    A partition is detached before it is exported, so queries stop reading it first; a
+    run interrupted after the detach archives the leftover table the next time.
+
+    Returns:
+        list: One dict (partition, rows, path) per archived partition.
+    """
+    retention = retention_months if retention is None else retention
+    directory = directory or archive_directory
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention)
+
+    cursor = conn.cursor()
+    partitions = list_partitions(cursor, table)
+    conn.commit()
+    archived = []
+    for name, attached in sorted(partitions.items()):
+        month = partition_month(table, name)
+        if month >= cutoff:
+            continue
+        if attached:
+            cursor.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(table), sql.Identifier(name)))
+            conn.commit()
+            _months.get(table, set()).discard(month)
+        rows, path = export_partition(conn, table, name, month, directory)
+        if not keep_detached:
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            conn.commit()
+        logger.info(f'Archived {name}: {rows} rows to {path}')
+        archived.append({'partition': name, 'rows': rows, 'path': path})
+    cursor.close()
+    return archived
+
+
+def partition_table(conn, table):
+    """
+    Convert a plain table into a monthly partitioned one in a single transaction.
+
+    The rows, the id sequence and the indexes carry over. Unique indexes, and the
+    primary key, get the partition key appended, since PostgreSQL only enforces
+    uniqueness per partition. A missing detected_at column is added first, set to now.
+    The partition key becomes NOT NULL; rows without one are moved to
+    <table>_missing_<key> for review instead of being copied.
+
+    Returns:
+        bool: False if table does not exist or is already partitioned.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    if row is None or row[0] == 'p':
+        cursor.close()
+        return False
+    key = partition_key(table)
+    old = f'{table}_unpartitioned'
+    cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(table)))
+    if key not in [column for column, _ in insert_columns(cursor, table)]:
+        cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN {} TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()").format(
+            sql.Identifier(table), sql.Identifier(key)))
+
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid), i.indisunique, i.indisprimary,
+               array(SELECT a.attname::text FROM pg_attribute a
+                     WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey))
+        FROM pg_index i WHERE i.indrelid = to_regclass(%s)
+    """, (table,))
+    indexes = cursor.fetchall()
+    columns = insert_columns(cursor, table)
+    column_list = sql.SQL(', ').join(sql.Identifier(column) for column, _ in columns)
+
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table), sql.Identifier(old)))
+    cursor.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING GENERATED) "
+                           "PARTITION BY RANGE ({})").format(
+        sql.Identifier(table), sql.Identifier(old), sql.Identifier(key)))
+    # SERIAL columns keep their sequence, which would otherwise be dropped with the old table
+    for column, _ in columns:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (old, column))
+        sequence = cursor.fetchone()[0]
+        if sequence:
+            cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.{}").format(
+                sql.SQL(sequence), sql.Identifier(table), sql.Identifier(column)))
+    cursor.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN {} SET NOT NULL").format(
+        sql.Identifier(table), sql.Identifier(key)))
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT").format(
+        sql.Identifier(f'{table}_default'), sql.Identifier(table)))
+    cursor.execute(sql.SQL("SELECT min({key}), max({key}) FROM {old}").format(
+        key=sql.Identifier(key), old=sql.Identifier(old)))
+    for month in months_spanned(cursor.fetchone()):
+        create_partition(cursor, table, month)
+    cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} WHERE {} IS NOT NULL").format(
+        sql.Identifier(table), column_list, column_list, sql.Identifier(old), sql.Identifier(key)))
+    logger.info(f'Copied {cursor.rowcount} rows into partitioned {table}')
+    missing = f'{table}_missing_{key}'
+    cursor.execute(sql.SQL("CREATE TABLE {} AS SELECT * FROM {} WHERE {} IS NULL").format(
+        sql.Identifier(missing), sql.Identifier(old), sql.Identifier(key)))
+    if cursor.rowcount:
+        logger.warning(f'Moved {cursor.rowcount} {table} rows without {key} to {missing}')
+    else:
+        cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(missing)))
+    cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(old)))
+
+    # Indexes that already include the key first, so an equivalent converted index is skipped
+    created = set()
+    for definition, unique, primary, index_columns in sorted(indexes, key=lambda index: key not in index[3]):
+        if primary:
+            definition = 'CREATE UNIQUE INDEX {} ON {} USING btree ({}, {})'.format(
+                f'{table}_{"_".join(index_columns)}_{key}_key', table, ', '.join(index_columns), key)
+        elif unique and key not in index_columns:
+            definition = re.sub(r'USING (\w+) \(([^)]*)\)', rf'USING \1 (\2, {key})', definition, count=1)
+        signature = re.sub(r'INDEX \S+ ON', 'INDEX ON', definition)
+        if signature in created:
+            continue
+        created.add(signature)
+        cursor.execute(definition)
+    conn.commit()
+    cursor.close()
+    _partitioned[table] = True
+    logger.info(f'Partitioned {table} by month on {key}')
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['migrate', 'create', 'archive'])
+    parser.add_argument('--tables', nargs='+', default=list(PARTITIONED_TABLES))
+    parser.add_argument('--months-ahead', type=int, default=months_ahead)
+    parser.add_argument('--retention-months', type=int, default=retention_months)
+    parser.add_argument('--archive-dir', default=archive_directory)
+    parser.add_argument('--keep-detached', action='store_true', help='Keep archived partitions as detached tables')
+    args = parser.parse_args()
+
+    try:
+        with db_pool.connection() as conn:
+            for table in args.tables:
+                if args.command == 'migrate':
+                    if not partition_table(conn, table):
+                        logger.info(f'{table} is missing or already partitioned')
+                elif args.command == 'create':
+                    current = month_start(datetime.now(timezone.utc))
+                    created = ensure_partitions(conn, table, [add_months(current, n) for n in range(args.months_ahead + 1)])
+                    logger.info(f'{table}: {created} partitions created')
+                else:
+                    archived = archive_partitions(conn, table, args.retention_months, args.archive_dir,
+                                                  keep_detached=args.keep_detached)
+                    logger.info(f'{table}: {len(archived)} partitions archived, '
+                                f'{sum(a["rows"] for a in archived)} rows')
+    finally:
+        db_pool.close_pool()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
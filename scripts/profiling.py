@@ -0,0 +1,262 @@
+"""
+Opt-in profiling and slow-query logging.
+
+PROFILE=1 (or --profile on the scripts) runs each pipeline entry point under cProfile.
+Worker threads started during the run get a profiler of their own, merged into the
+run's profile at the end. The stats are written to PROFILE_DIR as
+<name>-<timestamp>.prof and the slowest functions are logged. Open a .prof file with
+`python -m pstats` or snakeviz. With PROFILE=1 the API profiles every request's endpoint
+into PROFILE_DIR/api/.
+
+SLOW_QUERY_MS logs every statement slower than that many milliseconds, with its
+EXPLAIN plan (unless SLOW_QUERY_EXPLAIN=false). db_pool connections use
+SlowQueryCursor; SQLAlchemy engines get log_slow_queries.
+"""
+import os
+import re
+import io
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import functools
+import threading
+import inspect
+from contextlib import contextmanager
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+profile_enabled = os.getenv('PROFILE', '').lower() in ('1', 'true', 'yes')
+profile_directory = os.getenv('PROFILE_DIR', '../data/profiles')
+# Functions logged at the end of a profiled run, by cumulative time
+profile_top = int(os.getenv('PROFILE_TOP', '25'))
+# 0 disables slow-query logging
+slow_query_ms = float(os.getenv('SLOW_QUERY_MS', '0'))
+slow_query_explain = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() in ('1', 'true', 'yes')
+
+# Statements EXPLAIN accepts; DDL, COPY and transaction control are logged without a plan
+EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b', re.IGNORECASE)
+# Longest statement text logged
+MAX_STATEMENT_LENGTH = 2000
+
+_active = threading.local()
+
+
+def _profile_path(name, directory):
+    directory = directory or profile_directory
+    os.makedirs(directory, exist_ok=True)
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+    return os.path.join(directory, f'{safe_name}-{time.strftime("%Y%m%dT%H%M%S")}-{time.time_ns() % 10**9:09d}.prof')
+
+
+@contextmanager
+def profiled(name, enabled=None, directory=None, threads=True):
+    """
+    Profile the block with cProfile when enabled (PROFILE by default), write the stats
+    to PROFILE_DIR and log the top functions. With threads, threads started inside
+    the block are profiled too.
+    """
+    enabled = profile_enabled if enabled is None else enabled
+    if not enabled:
+        yield None
+        return
+    profiles = [cProfile.Profile()]
+    lock = threading.Lock()
+
+    def start_thread_profile(*args):
+        # Runs as the profile hook on a new thread's first call, then hands over to cProfile
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows only one active cProfile; the thread goes unprofiled
+            return
+        with lock:
+            profiles.append(profile)
+
+    if threads:
+        threading.setprofile(start_thread_profile)
+    started = time.perf_counter()
+    profiles[0].enable()
+    try:
+        yield profiles[0]
+    finally:
+        profiles[0].disable()
+        if threads:
+            threading.setprofile(None)
+        elapsed = time.perf_counter() - started
+        path = _profile_path(name, directory)
+        with lock:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+        stats.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(path, stream=summary).sort_stats('cumulative').print_stats(profile_top)
+        logger.info(f'Profile of {name} ({elapsed:.2f}s, {len(profiles)} threads) written to {path}\n'
+                    f'{summary.getvalue()}')
+
+
+def profile_endpoint(endpoint, name, directory=None):
+    """
+    Wrap a FastAPI endpoint so each call is profiled into its own file.
+
+    The profile runs where the endpoint runs: the threadpool for sync endpoints, the
+    event loop for async ones. Only one async call is profiled at a time, since other
+    requests' coroutines would interleave with it.
+    """
+    directory = directory or os.path.join(profile_directory, 'api')
+
+    def write(profile, elapsed):
+        path = _profile_path(name, directory)
+        profile.dump_stats(path)
+        logger.info(f'Profile of {name} ({elapsed * 1000:.1f} ms) written to {path}')
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def profiled_endpoint(*args, **kwargs):
+            if getattr(_active, 'profile', None) is not None:
+                return await endpoint(*args, **kwargs)
+            _active.profile = profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profile.disable()
+                _active.profile = None
+                write(profile, time.perf_counter() - started)
+    else:
+        @functools.wraps(endpoint)
+        def profiled_endpoint(*args, **kwargs):
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                profile.disable()
+                write(profile, time.perf_counter() - started)
+    return profiled_endpoint
+
+
+def _statement_text(statement):
+    statement = statement.decode('utf-8', 'replace') if isinstance(statement, bytes) else str(statement)
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= MAX_STATEMENT_LENGTH else statement[:MAX_STATEMENT_LENGTH] + '...'
+
+
+def _log_slow(elapsed, statement, plan):
+    message = f'Slow query ({elapsed * 1000:.1f} ms): {_statement_text(statement)}'
+    if plan:
+        message += '\n' + '\n'.join(plan)
+    logger.warning(message)
+
+
+def _explain_psycopg2(connection, statement):
+    """
+    EXPLAIN a fully interpolated statement. Inside a transaction it runs in a savepoint,
+    so a failure leaves the transaction usable.
+    """
+    # A plain cursor, so the EXPLAIN itself is not timed and explained
+    cursor = connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+    savepoint = not connection.autocommit
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(b'EXPLAIN ' + statement if isinstance(statement, bytes) else 'EXPLAIN ' + statement)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+    except Exception as e:
+        return [f'(EXPLAIN failed: {e})']
+    finally:
+        cursor.close()
+
+
+class SlowQueryCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that logs statements slower than SLOW_QUERY_MS with their plan."""
+
+    def _timed(self, method, query, vars, explain):
+        started = time.perf_counter()
+        result = method(query, vars)
+        elapsed = time.perf_counter() - started
+        if elapsed * 1000 >= slow_query_ms:
+            statement = self.query or self.mogrify(query, vars)
+            plan = None
+            if explain and slow_query_explain and EXPLAINABLE.match(_statement_text(statement)):
+                plan = _explain_psycopg2(self.connection, statement)
+            _log_slow(elapsed, statement, plan)
+        return result
+
+    def execute(self, query, vars=None):
+        # Named (server-side) cursors only DECLARE here; the work happens on fetch
+        if self.name is not None:
+            return super().execute(query, vars)
+        return self._timed(super().execute, query, vars, explain=True)
+
+    def executemany(self, query, vars_list):
+        # Plans are per statement, so executemany is only timed
+        return self._timed(super().executemany, query, vars_list, explain=False)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        result = super().copy_expert(sql, file, size)
+        elapsed = time.perf_counter() - started
+        if elapsed * 1000 >= slow_query_ms:
+            _log_slow(elapsed, sql.as_string(self) if hasattr(sql, 'as_string') else sql, None)
+        return result
+
+
+def log_slow_queries(engine, threshold_ms=None):
+    """
+    Log statements run through a SQLAlchemy engine that take longer than threshold_ms
+    (SLOW_QUERY_MS by default), with EXPLAIN output on PostgreSQL and SQLite.
+    Does nothing when the threshold is 0.
+    """
+    from sqlalchemy import event
+
+    threshold = (slow_query_ms if threshold_ms is None else threshold_ms) / 1000
+    if threshold <= 0:
+        return
+    dialect = engine.dialect.name
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def log_if_slow(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        if elapsed < threshold or conn.info.get('explaining'):
+            return
+        plan = None
+        if slow_query_explain and not executemany and EXPLAINABLE.match(statement):
+            plan = _explain_sqlalchemy(conn, dialect, statement, parameters)
+        _log_slow(elapsed, statement, plan)
+
+
+def _explain_sqlalchemy(conn, dialect, statement, parameters):
+    prefix = {'postgresql': 'EXPLAIN ', 'sqlite': 'EXPLAIN QUERY PLAN '}.get(dialect)
+    if prefix is None:
+        return None
+    # Statements run here go through the same events; the flag keeps them out of the log
+    conn.info['explaining'] = True
+    try:
+        if dialect == 'postgresql':
+            conn.exec_driver_sql('SAVEPOINT slow_query_explain')
+        try:
+            rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        finally:
+            if dialect == 'postgresql':
+                conn.exec_driver_sql('ROLLBACK TO SAVEPOINT slow_query_explain')
+        return [' | '.join(str(value) for value in row) for row in rows]
+    except Exception as e:
+        return [f'(EXPLAIN failed: {e})']
+    finally:
+        conn.info['explaining'] = False
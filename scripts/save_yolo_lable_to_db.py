@@ -1,86 +1,249 @@
 import os
-import psycopg2
+import io
+import time
+import argparse
+from psycopg2.extras import execute_values
 import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
+import db_pool
+import metrics
+import partitions
+import profiling
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get environment variables
-db_host = os.getenv('DB_HOST')
-db_name = os.getenv('DB_NAME')
-db_user = os.getenv('DB_USER')
-db_password = os.getenv('DB_PASSWORD')
-db_port = os.getenv('DB_PORT')  
-
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# connect to PostgreSQL database
-def connect_to_db():
-    try:
-        conn = psycopg2.connect(
-            dbname=db_name,
-            user=db_user,
-            password=db_password,
-            host=db_host,
-            port=db_port
+LABEL_COLUMNS = ['class_label', 'x_center', 'y_center', 'width', 'height', 'confidence']
+# Identity of the image a detection came from, repeated on each of its rows
+SOURCE_COLUMNS = ['channel', 'message_id', 'image_name', 'run_id']
+# Label files parsed per process-pool task
+PARSE_CHUNK_SIZE = 256
+# Label files committed together in one COPY transaction
+FILES_PER_TRANSACTION = int(os.getenv('YOLO_FILES_PER_TRANSACTION', '5000'))
+
+
+def parse_label_file(file_path):
+    """
+    Parse a YOLO label file into an (n, 6) float array.
+
+    Lines without exactly six fields (class, x, y, w, h, confidence) are skipped.
+    """
+    with open(file_path, 'r') as file:
+        lines = [line for line in file.read().splitlines() if len(line.split()) == 6]
+    if not lines:
+        return np.empty((0, len(LABEL_COLUMNS)))
+    return np.array(' '.join(lines).split(), dtype=np.float64).reshape(-1, len(LABEL_COLUMNS))
+
+
+def parse_label_files(file_paths):
+    """Process-pool task: parse a group of label files into (file_name, array) pairs."""
+    return [(os.path.basename(file_path), parse_label_file(file_path)) for file_path in file_paths]
+
+
+def ensure_tables(cur):
+    # Partitioned by month on load time (see partitions.py); tables created before
+    # partitioning stay plain until partitions.py migrate converts them
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS yolo_detection_results (
+            id SERIAL,
+            class_label INTEGER,
+            x_center FLOAT,
+            y_center FLOAT,
+            width FLOAT,
+            height FLOAT,
+            confidence FLOAT,
+            detected_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        ) PARTITION BY RANGE (detected_at)
+    """)
+    # Columns and indexes linking detections to their image and Telegram message
+    for column, column_type in (('channel', 'TEXT'), ('message_id', 'INTEGER'),
+                                ('image_name', 'TEXT'), ('run_id', 'TEXT'),
+                                ('detected_at', 'TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()')):
+        cur.execute(f"ALTER TABLE yolo_detection_results ADD COLUMN IF NOT EXISTS {column} {column_type}")
+    if partitions.is_partitioned(cur, 'yolo_detection_results'):
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS yolo_detection_results_id_detected_at_key
+                ON yolo_detection_results (id, detected_at)
+        """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS ix_yolo_detection_results_channel_message_id
+            ON yolo_detection_results (channel, message_id, id)
+    """)
+    cur.execute("DROP INDEX IF EXISTS ix_yolo_detection_results_class_label_confidence")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS ix_yolo_detection_results_class_label_confidence_message
+            ON yolo_detection_results (class_label, confidence) INCLUDE (channel, message_id)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS yolo_loaded_files (
+            label_dir TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            detections INTEGER NOT NULL,
+            loaded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (label_dir, file_name)
         )
-        logger.info("Connected to PostgreSQL database")
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Error connecting to PostgreSQL: {e}")
-        raise
-
-# Function to save detection results into database
-def save_to_db(conn, class_label, x_center, y_center, width, height, confidence):
-    try:
+    """)
+
+
+def loaded_files(cur, label_dir, *aliases):
+    """Return the names of label files already loaded from label_dir or one of its aliases."""
+    cur.execute("SELECT file_name FROM yolo_loaded_files WHERE label_dir = ANY(%s)", ([label_dir, *aliases],))
+    return {row[0] for row in cur.fetchall()}
+
+
+def _copy_text(value):
+    """Format a text value for PostgreSQL COPY text format."""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def source_identity(file_name, channel, run_id):
+    """
+    Return the COPY-formatted SOURCE_COLUMNS for a label or image file.
+
+    image_scraper links each photo as <channel>/<message.id>.jpg, so a numeric file
+    name is the Telegram message id within the channel. Only ASCII digits count:
+    str.isdigit also accepts other scripts' digits, which the INTEGER column rejects.
+    """
+    image_name = os.path.splitext(os.path.basename(file_name))[0]
+    message_id = image_name if image_name.isascii() and image_name.isdigit() else None
+    return '\t'.join(_copy_text(value) for value in (channel, message_id, image_name, run_id))
+
+
+def copy_detection_arrays(cur, arrays, sources):
+    """
+    COPY (n, 6) detection arrays into yolo_detection_results without committing.
+
+    sources[i] is the COPY-formatted SOURCE_COLUMNS of every row in arrays[i].
+    Returns the number of rows copied.
+    """
+    pairs = [(array, source) for array, source in zip(arrays, sources) if len(array)]
+    if not pairs:
+        return 0
+    detections = np.vstack([array for array, _ in pairs])
+    buffer = io.StringIO()
+    np.savetxt(buffer, detections, fmt=['%d'] + ['%.10g'] * (len(LABEL_COLUMNS) - 1), delimiter='\t')
+    row_sources = np.repeat([source for _, source in pairs], [len(array) for array, _ in pairs])
+    lines = buffer.getvalue().splitlines()
+    buffer = io.StringIO('\n'.join(f'{line}\t{source}' for line, source in zip(lines, row_sources)) + '\n')
+    columns = ', '.join(LABEL_COLUMNS + SOURCE_COLUMNS)
+    cur.copy_expert(f"COPY yolo_detection_results ({columns}) FROM STDIN", buffer)
+    return len(detections)
+
+
+def copy_detections(conn, label_dir, parsed, channel=None, run_id=None):
+    """
+    Load parsed label files in one transaction: COPY every detection with its source
+    image identity, then record the files as loaded so a rerun skips them.
+    Returns the number of detections.
+    """
+    started = time.perf_counter()
+    cur = conn.cursor()
+    detections = copy_detection_arrays(
+        cur,
+        [array for _, array in parsed],
+        [source_identity(file_name, channel, run_id) for file_name, _ in parsed]
+    )
+    execute_values(
+        cur,
+        "INSERT INTO yolo_loaded_files (label_dir, file_name, detections) VALUES %s "
+        "ON CONFLICT (label_dir, file_name) DO NOTHING",
+        [(label_dir, file_name, len(array)) for file_name, array in parsed]
+    )
+    conn.commit()
+    cur.close()
+    metrics.yolo_transaction_seconds.labels('labels').observe(time.perf_counter() - started)
+    metrics.yolo_label_files_loaded.inc(len(parsed))
+    metrics.yolo_detections_loaded.labels('labels').inc(detections)
+    return detections
+
+
+def load_label_dir(label_dir, workers=None, files_per_transaction=FILES_PER_TRANSACTION, channel=None, run_id=None):
+    """
+    Load every YOLO label file in label_dir that has not been loaded before.
+
+    channel is the telegram_messages.channel the images were scraped from; together
+    with the message id taken from each file name it links detections to messages.
+    run_id defaults to the YOLO run folder name (the parent of the labels folder).
+
+    Files are parsed in a process pool and loaded with COPY in transactions of
+    files_per_transaction files. Each transaction also records its files in
+    yolo_loaded_files, so an interrupted run resumes where it stopped.
+
+    Returns:
+        dict: Files and detections loaded, and elapsed seconds.
+    """
+    # Absolute, so the loaded-files check holds whatever the working directory
+    relative_dir = os.path.normpath(label_dir)
+    label_dir = os.path.abspath(label_dir)
+    run_id = run_id or os.path.basename(os.path.dirname(label_dir))
+    started = time.perf_counter()
+    totals = {'files': 0, 'detections': 0}
+    with db_pool.connection() as conn:
         cur = conn.cursor()
-        sql = "INSERT INTO yolo_detection_results (class_label, x_center, y_center, width, height, confidence) VALUES (%s, %s, %s, %s, %s, %s)"
-        values = (class_label, x_center, y_center, width, height, confidence)
-        cur.execute(sql, values)
+        ensure_tables(cur)
         conn.commit()
-        logger.info(f"Saved detection result for class {class_label} to database")
+        # Files recorded by earlier versions under the relative path count as loaded too
+        done = loaded_files(cur, label_dir, relative_dir)
         cur.close()
-    except psycopg2.Error as e:
-        logger.error(f"Error saving to PostgreSQL: {e}")
-        raise
+        partitions.ensure_current_partitions(conn, 'yolo_detection_results')
+
+        pending = sorted(f for f in os.listdir(label_dir) if f.endswith('.txt') and f not in done)
+        logger.info(f"{len(pending)} label files to load from {label_dir} ({len(done)} already loaded)")
+        tasks = [
+            [os.path.join(label_dir, file_name) for file_name in pending[i:i + PARSE_CHUNK_SIZE]]
+            for i in range(0, len(pending), PARSE_CHUNK_SIZE)
+        ]
+
+        batch = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for parsed in executor.map(parse_label_files, tasks):
+                batch.extend(parsed)
+                if len(batch) >= files_per_transaction:
+                    totals['detections'] += copy_detections(conn, label_dir, batch, channel, run_id)
+                    totals['files'] += len(batch)
+                    batch = []
+            if batch:
+                totals['detections'] += copy_detections(conn, label_dir, batch, channel, run_id)
+                totals['files'] += len(batch)
+
+    totals['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Loaded {totals['files']} files and {totals['detections']} detections in {totals['seconds']}s")
+    return totals
 
 
 result_dir = '../yolov5/results/run13/labels'
 
-try:
-    # Connect to PostgreSQL
-    conn = connect_to_db()
-
-    # Iterat
-    for filename in os.listdir(result_dir):
-        if filename.endswith(".txt"):
-            file_path = os.path.join(result_dir, filename)
-            
-            # Read contents of the file
-            with open(file_path, 'r') as file:
-                lines = file.readlines()
-            
-            # Process each line in the file
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) == 6:
-                    class_label = int(parts[0])
-                    x_center = float(parts[1])
-                    y_center = float(parts[2])
-                    width = float(parts[3])
-                    height = float(parts[4])
-                    confidence = float(parts[5])
-                    
-                    # Save to database
-                    save_to_db(conn, class_label, x_center, y_center, width, height, confidence)
-
-    print("Detection results saved to database.")
-except Exception as e:
-    logger.error(f"Unexpected error: {e}")
-finally:
-    if conn is not None:
-        conn.close()
-        logger.info("PostgreSQL connection closed")
+def main():
+    parser = argparse.ArgumentParser(description='Load YOLO label files into yolo_detection_results.')
+    parser.add_argument('label_dir', nargs='?', default=result_dir)
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: CPU count)')
+    parser.add_argument('--files-per-transaction', type=int, default=FILES_PER_TRANSACTION)
+    parser.add_argument('--channel', default=None, help='telegram_messages.channel the images were scraped from')
+    parser.add_argument('--run-id', default=None, help='YOLO run identifier (default: run folder name)')
+    parser.add_argument('--profile', action='store_true', default=profiling.profile_enabled,
+                        help='Profile the run with cProfile; parser processes are not included (default: PROFILE)')
+    args = parser.parse_args()
+    metrics.register_pool('yolo_loader', db_pool.pool_status)
+    metrics.start_metrics_server()
+
+    try:
+        with profiling.profiled('save_yolo_lable_to_db', args.profile):
+            load_label_dir(args.label_dir, workers=args.workers, files_per_transaction=args.files_per_transaction,
+                           channel=args.channel, run_id=args.run_id)
+        print("Detection results saved to database.")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+    finally:
+        db_pool.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Generate synthetic Telegram messages, YOLO label files and images.
+
+The data has the shape the pipeline sees from Telegram and YOLO: messages spread over
+channels with a share of dirty content (punctuation, upper case) and photo-only
+messages without text, label files named after message ids, and photos stored through
+the image scraper's content-addressed layout with a share of reposted photos.
+Everything is derived from a seed, so two runs with the same arguments produce the
+same data.
+
+    python synthetic_data.py --messages 100000 --label-files 10000 --images 500 --output-dir ../data/synthetic
+"""
+import os
+import io
+import argparse
+import logging
+from datetime import datetime, timezone, timedelta
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Same order as extract_load_pipeline.MESSAGE_COLUMNS
+MESSAGE_COLUMNS = ['channel', 'message_id', 'content', 'timestamp', 'views', 'message_link']
+# Titles of synthetic channels start with this, so benchmark rows can be told apart
+CHANNEL_TITLE_PREFIX = 'Synthetic Channel'
+START_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+PRODUCTS = ['paracetamol', 'amoxicillin', 'ibuprofen', 'omeprazole', 'metformin',
+            'vitamin c', 'sunscreen spf 50', 'face cream', 'insulin pen', 'blood pressure monitor']
+# YOLO's COCO classes
+CLASSES = 80
+
+
+def channel_username(index):
+    return f'synthetic_{index}'
+
+
+def channel_title(index):
+    return f'{CHANNEL_TITLE_PREFIX} {index}'
+
+
+def message_rows(count, channels=8, start_id=1, seed=0, start_date=START_DATE,
+                 dirty_rate=0.1, empty_rate=0.05):
+    """
+    Build MESSAGE_COLUMNS row tuples for count messages.
+
+    Message ids run from start_id and are dealt round-robin over the channels; message
+    id n is posted n minutes after start_date. A dirty_rate share has punctuation and
+    upper case for the validation test to flag; an empty_rate share are photo-only
+    messages with no content.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(start_id, start_id + count)
+    products = rng.integers(0, len(PRODUCTS), count)
+    doses = rng.choice([50, 100, 250, 500, 1000], count)
+    prices = rng.integers(20, 5000, count)
+    views = rng.zipf(1.5, count).clip(max=1_000_000).astype(np.float64)
+    kinds = rng.random(count)
+
+    rows = []
+    for i, message_id in enumerate(ids.tolist()):
+        index = message_id % channels
+        if kinds[i] < empty_rate:
+            content = None
+        elif kinds[i] < empty_rate + dirty_rate:
+            content = f'{PRODUCTS[products[i]].upper()} {doses[i]}MG Price {prices[i]} Birr! Call @pharmacy #{message_id}'
+        else:
+            content = f'{PRODUCTS[products[i]]} {doses[i]}mg available for {prices[i]} birr'
+        rows.append((
+            channel_title(index),
+            message_id,
+            content,
+            start_date + timedelta(minutes=message_id),
+            views[i],
+            f'https://t.me/{channel_username(index)}/{message_id}'
+        ))
+    return rows
+
+
+def messages_frame(count, **kwargs):
+    """message_rows as a MESSAGE_COLUMNS DataFrame."""
+    return pd.DataFrame(message_rows(count, **kwargs), columns=MESSAGE_COLUMNS)
+
+
+def detection_arrays(message_ids, seed=0, max_detections=6):
+    """
+    Build one (n, 6) detection array per message id, in label-file column order
+    (class, x_center, y_center, width, height, confidence); n is 0..max_detections.
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, max_detections + 1, len(message_ids))
+    total = int(counts.sum())
+    detections = np.column_stack([
+        rng.integers(0, CLASSES, total),
+        rng.random((total, 4)),
+        rng.uniform(0.25, 1.0, total),
+    ])
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    return [(message_id, detections[bounds[i]:bounds[i + 1]]) for i, message_id in enumerate(message_ids)]
+
+
+def write_label_files(label_dir, message_ids, seed=0, max_detections=6):
+    """
+    Write a <message_id>.txt YOLO label file per message id, as yolov5 --save-txt
+    --save-conf does.
+
+    Returns:
+        int: Detections written.
+    """
+    os.makedirs(label_dir, exist_ok=True)
+    detections = 0
+    for message_id, array in detection_arrays(message_ids, seed, max_detections):
+        with open(os.path.join(label_dir, f'{message_id}.txt'), 'w') as f:
+            f.writelines(f'{int(row[0])} {row[1]:.6f} {row[2]:.6f} {row[3]:.6f} {row[4]:.6f} {row[5]:.6f}\n'
+                         for row in array)
+        detections += len(array)
+    return detections
+
+
+def image_bytes(rng, size=64):
+    """Encode a random RGB image as JPEG."""
+    from PIL import Image
+
+    pixels = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'RGB').save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def write_images(save_dir, manifest_file, channel_index, message_ids, seed=0, size=64, repost_rate=0.1):
+    """
+    Store a photo for each message id the way the image scraper does, and record it in
+    the manifest. A repost_rate share reuse an earlier photo (same photo id and bytes).
+
+    Returns:
+        int: Distinct images written.
+    """
+    from image_manifest import ImageManifest
+    from image_scraper import store_object, link_message_image
+
+    rng = np.random.default_rng(seed)
+    manifest = ImageManifest(manifest_file)
+    channel = channel_username(channel_index)
+    photos = []
+    for message_id in message_ids:
+        if photos and rng.random() < repost_rate:
+            photo_id, sha256, relpath = photos[rng.integers(0, len(photos))]
+        else:
+            sha256, relpath, _ = store_object(save_dir, image_bytes(rng, size))
+            photo_id = int(rng.integers(1, 2 ** 62))
+            photos.append((photo_id, sha256, relpath))
+        link_message_image(save_dir, channel, message_id, relpath)
+        manifest.record({
+            'channel': channel,
+            'channel_title': channel_title(channel_index),
+            'message_id': int(message_id),
+            'photo_id': photo_id,
+            'sha256': sha256,
+            'path': relpath,
+            'date': (START_DATE + timedelta(minutes=int(message_id))).isoformat(),
+        })
+    return len(photos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--channels', type=int, default=8)
+    parser.add_argument('--label-files', type=int, default=10_000, help='Label files, for the first channel')
+    parser.add_argument('--images', type=int, default=500, help='Images, for the first channel')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default='../data/synthetic')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    messages = messages_frame(args.messages, channels=args.channels, seed=args.seed)
+    messages.to_csv(os.path.join(args.output_dir, 'telegram_messages.csv'), index=False)
+    logger.info(f'Wrote {len(messages)} messages')
+
+    # Label files and images belong to messages of the first channel
+    first_channel = messages.loc[messages['channel'] == channel_title(0), 'message_id'].tolist()
+    detections = write_label_files(os.path.join(args.output_dir, 'labels'), first_channel[:args.label_files], args.seed)
+    logger.info(f'Wrote {min(args.label_files, len(first_channel))} label files with {detections} detections')
+    image_dir = os.path.join(args.output_dir, 'images')
+    images = write_images(image_dir, os.path.join(image_dir, 'manifest.jsonl'), 0, first_channel[:args.images], args.seed)
+    logger.info(f'Wrote {images} images')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
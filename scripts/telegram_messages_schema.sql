@@ -1,10 +1,45 @@
 
+-- Partitioned by month on timestamp. Monthly partitions (telegram_messages_pYYYY_MM) are
+-- created by the loaders and scripts/partitions.py; rows for a month with no partition
+-- yet go to the default partition. timestamp is NOT NULL since it is part of the natural
+-- key; the loaders reject rows without one. Convert a table created before partitioning
+-- with `python partitions.py migrate`.
 CREATE TABLE IF NOT EXISTS telegram_messages (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     channel TEXT,
     message_id INT,
     content TEXT,
-    timestamp TIMESTAMP WITH TIME ZONE,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
     views FLOAT,
     message_link TEXT
-);
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS telegram_messages_default PARTITION OF telegram_messages DEFAULT;
+
+-- Unique indexes on a partitioned table must include the partition key. A message's
+-- timestamp is its post date, which does not change; if it ever does, the bulk loader
+-- deletes the old row before inserting the new one.
+CREATE UNIQUE INDEX IF NOT EXISTS telegram_messages_id_timestamp_key
+    ON telegram_messages (id, timestamp);
+-- Natural key used by the bulk loader's INSERT ... ON CONFLICT merge.
+CREATE UNIQUE INDEX IF NOT EXISTS telegram_messages_channel_message_id_key
+    ON telegram_messages (channel, message_id, timestamp);
+
+-- Keyset pagination by id or (timestamp, id), optionally within one channel
+CREATE INDEX IF NOT EXISTS ix_telegram_messages_channel_id
+    ON telegram_messages (channel, id);
+CREATE INDEX IF NOT EXISTS ix_telegram_messages_timestamp_id
+    ON telegram_messages (timestamp, id);
+CREATE INDEX IF NOT EXISTS ix_telegram_messages_channel_timestamp_id
+    ON telegram_messages (channel, timestamp, id);
+
+-- Search over content (GET /telegram_messages/search). The generated column and both GIN
+-- indexes are maintained on every insert and update. Adding the column to an existing
+-- table rewrites it once. 'simple' lowercases and splits words without stemming, which
+-- suits mixed Amharic/English text.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE telegram_messages ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED;
+CREATE INDEX IF NOT EXISTS ix_telegram_messages_content_tsv
+    ON telegram_messages USING gin (content_tsv);
+CREATE INDEX IF NOT EXISTS ix_telegram_messages_content_trgm
+    ON telegram_messages USING gin (content gin_trgm_ops);
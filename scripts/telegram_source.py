@@ -0,0 +1,353 @@
+"""
+Offline stand-ins for the Telegram client used by the extract pipeline and the image scraper.
+
+TELEGRAM_SOURCE selects where messages come from:
+
+    telegram   the real TelegramClient (default)
+    synthetic  histories generated on the fly from the channel name and FAKE_TELEGRAM_SEED;
+               FAKE_TELEGRAM_MESSAGES messages per channel, nothing is held in memory
+    replay     histories recorded to TELEGRAM_REPLAY_FILE with `python telegram_source.py record`
+
+FakeTelegramClient answers the calls the pipeline makes (get_entity, iter_messages,
+download_media, disconnect) with Telethon's paging and filtering semantics. Each request
+(a page of FAKE_TELEGRAM_PAGE_SIZE messages, an entity lookup, a photo download) waits
+FAKE_TELEGRAM_LATENCY seconds and raises FloodWaitError with probability
+FAKE_TELEGRAM_FLOOD_WAIT_RATE, so retries, concurrency and checkpointing can be exercised
+with no network.
+
+    TELEGRAM_SOURCE=synthetic FAKE_TELEGRAM_MESSAGES=1000000 python extract_load_pipeline.py
+    python telegram_source.py record --channels https://t.me/DoctorsET --limit 5000 --output history.jsonl
+"""
+import abc
+import os
+import json
+import zlib
+import random
+import asyncio
+import argparse
+import logging
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, timezone, timedelta
+import numpy as np
+from telethon.errors import FloodWaitError
+from dotenv import load_dotenv
+import synthetic_data
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_SOURCE = os.getenv('TELEGRAM_SOURCE', 'telegram')
+TELEGRAM_REPLAY_FILE = os.getenv('TELEGRAM_REPLAY_FILE', '../data/telegram_history.jsonl')
+FAKE_TELEGRAM_MESSAGES = int(os.getenv('FAKE_TELEGRAM_MESSAGES', '10000'))
+FAKE_TELEGRAM_PHOTO_RATE = float(os.getenv('FAKE_TELEGRAM_PHOTO_RATE', '0.3'))
+FAKE_TELEGRAM_SEED = int(os.getenv('FAKE_TELEGRAM_SEED', '0'))
+# Seconds each request takes, and messages returned per history request (Telethon uses 100)
+FAKE_TELEGRAM_LATENCY = float(os.getenv('FAKE_TELEGRAM_LATENCY', '0.05'))
+FAKE_TELEGRAM_PAGE_SIZE = int(os.getenv('FAKE_TELEGRAM_PAGE_SIZE', '100'))
+# Share of requests answered with FloodWait, and the wait they ask for
+FAKE_TELEGRAM_FLOOD_WAIT_RATE = float(os.getenv('FAKE_TELEGRAM_FLOOD_WAIT_RATE', '0'))
+FAKE_TELEGRAM_FLOOD_WAIT_SECONDS = int(os.getenv('FAKE_TELEGRAM_FLOOD_WAIT_SECONDS', '1'))
+
+# Generated histories end here, one message every MESSAGE_INTERVAL before it
+HISTORY_END = datetime(2024, 6, 10, tzinfo=timezone.utc)
+MESSAGE_INTERVAL = timedelta(minutes=5)
+
+Channel = namedtuple('Channel', ['id', 'title', 'username'])
+Photo = namedtuple('Photo', ['id'])
+Message = namedtuple('Message', ['id', 'message', 'date', 'views', 'photo'])
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(*values):
+    """Deterministic 64-bit hash of integers (splitmix64 rounds)."""
+    x = 0x9E3779B97F4A7C15
+    for value in values:
+        x = ((x ^ value) * 0xBF58476D1CE4E5B9) & _MASK
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+        x ^= x >> 31
+    return x
+
+
+def channel_username(channel):
+    """Username of a channel given as a t.me URL, @username or username."""
+    return channel.rstrip('/').rsplit('/', 1)[-1].lstrip('@')
+
+
+class MessageSource(abc.ABC):
+    """
+    Channel histories a FakeTelegramClient serves.
+
+    Subclasses return channels by username and messages by id; message_ids must be a
+    sorted sequence supporting len() and indexing (a range or a list).
+    """
+
+    @abc.abstractmethod
+    def channel(self, username):
+        """The Channel entity for username."""
+
+    @abc.abstractmethod
+    def message_ids(self, channel):
+        """Ids of channel's messages, oldest first."""
+
+    @abc.abstractmethod
+    def message(self, channel, message_id):
+        """The Message with message_id in channel."""
+
+
+class GeneratedSource(MessageSource):
+    """
+    Histories of messages_per_channel messages (ids 1..n) for any channel name.
+
+    Each message is computed from (seed, channel, id) when it is read, so histories of
+    millions of messages cost no memory and every run sees the same messages. A
+    photo_rate share carry a photo; one in ten of those reposts an earlier photo id.
+    """
+
+    def __init__(self, messages_per_channel=FAKE_TELEGRAM_MESSAGES, photo_rate=FAKE_TELEGRAM_PHOTO_RATE,
+                 seed=FAKE_TELEGRAM_SEED):
+        self.messages_per_channel = messages_per_channel
+        self.photo_rate = photo_rate
+        self.seed = seed
+
+    def channel(self, username):
+        return Channel(zlib.crc32(username.encode()), username, username)
+
+    def message_ids(self, channel):
+        return range(1, self.messages_per_channel + 1)
+
+    def message(self, channel, message_id):
+        h = _mix(self.seed, channel.id, message_id)
+        photo = None
+        if (h % 1000) < self.photo_rate * 1000:
+            source_id = message_id - 1 - (h >> 40) % 10 if (h >> 10) % 10 == 0 and message_id > 10 else message_id
+            photo = Photo(_mix(self.seed, channel.id, source_id, 1) >> 2)
+        kind = (h >> 20) % 100
+        product = synthetic_data.PRODUCTS[(h >> 28) % len(synthetic_data.PRODUCTS)]
+        price = 20 + (h >> 36) % 5000
+        if photo is not None and kind < 30:
+            content = ''
+        elif kind < 40:
+            content = f'{product.upper()} Price {price} Birr! Call @pharmacy'
+        else:
+            content = f'{product} available for {price} birr'
+        date = HISTORY_END - (self.messages_per_channel - message_id) * MESSAGE_INTERVAL
+        return Message(message_id, content, date, (h >> 48) % 5000, photo)
+
+
+class RecordedSource(MessageSource):
+    """
+    Histories recorded to a JSON-lines file by record_history, one message per line:
+    channel, title, id, date (ISO 8601), message, views and photo_id (or null).
+    """
+
+    def __init__(self, path):
+        self._channels = {}
+        self._messages = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                username = entry['channel']
+                if username not in self._channels:
+                    self._channels[username] = Channel(zlib.crc32(username.encode()), entry['title'], username)
+                    self._messages[username] = {}
+                self._messages[username][entry['id']] = Message(
+                    entry['id'], entry['message'], datetime.fromisoformat(entry['date']), entry['views'],
+                    Photo(entry['photo_id']) if entry.get('photo_id') is not None else None
+                )
+        self._ids = {username: sorted(messages) for username, messages in self._messages.items()}
+        logger.info(f'Loaded {sum(map(len, self._ids.values()))} recorded messages from {path}')
+
+    def channel(self, username):
+        try:
+            return self._channels[username]
+        except KeyError:
+            raise ValueError(f'No recorded history for channel "{username}"') from None
+
+    def message_ids(self, channel):
+        return self._ids[channel.username]
+
+    def message(self, channel, message_id):
+        return self._messages[channel.username][message_id]
+
+
+class FakeTelegramClient:
+    """
+    Telethon-compatible client serving a MessageSource.
+
+    stats counts requests, injected flood waits, messages returned and photos downloaded.
+    """
+
+    def __init__(self, source, latency=FAKE_TELEGRAM_LATENCY, page_size=FAKE_TELEGRAM_PAGE_SIZE,
+                 flood_wait_rate=FAKE_TELEGRAM_FLOOD_WAIT_RATE, flood_wait_seconds=FAKE_TELEGRAM_FLOOD_WAIT_SECONDS,
+                 seed=FAKE_TELEGRAM_SEED, image_size=64):
+        self.source = source
+        self.latency = latency
+        self.page_size = page_size
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.image_size = image_size
+        self._random = random.Random(seed)
+        self.stats = {'requests': 0, 'flood_waits': 0, 'messages': 0, 'downloads': 0}
+
+    async def _request(self):
+        self.stats['requests'] += 1
+        if self.flood_wait_rate and self._random.random() < self.flood_wait_rate:
+            self.stats['flood_waits'] += 1
+            raise FloodWaitError(request=None, capture=self.flood_wait_seconds)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_entity(self, entity):
+        if isinstance(entity, Channel):
+            return entity
+        await self._request()
+        return self.source.channel(channel_username(entity))
+
+    def _bounds(self, channel, ids, offset_date, offset_id, max_id, min_id, reverse):
+        """Index range [lo, hi) of the ids iter_messages returns, before limit."""
+        lo, hi = bisect_right(ids, min_id), len(ids)
+        if max_id:
+            hi = min(hi, bisect_left(ids, max_id))
+        if offset_id:
+            if reverse:
+                lo = max(lo, bisect_right(ids, offset_id))
+            else:
+                hi = min(hi, bisect_left(ids, offset_id))
+        if offset_date:
+            # Message dates grow with their ids, so the date bound is a position in ids
+            position = bisect_left(range(len(ids)), offset_date, key=lambda i: self.source.message(channel, ids[i]).date)
+            if reverse:
+                lo = max(lo, position)
+            else:
+                hi = min(hi, position)
+        return lo, hi
+
+    async def iter_messages(self, entity, limit=None, offset_date=None, offset_id=0, max_id=0, min_id=0,
+                            reverse=False, filter=None):
+        """
+        Yield messages newest first (oldest first with reverse), one page per request.
+
+        offset_id, max_id and min_id are exclusive id bounds and offset_date a date bound,
+        as in Telethon; any filter returns photo messages only.
+        """
+        channel = await self.get_entity(entity)
+        ids = self.source.message_ids(channel)
+        lo, hi = self._bounds(channel, ids, offset_date, offset_id, max_id, min_id, reverse)
+        positions = range(lo, hi) if reverse else range(hi - 1, lo - 1, -1)
+        returned = 0
+        page = []
+        for position in positions:
+            if limit is not None and returned + len(page) >= limit:
+                break
+            message = self.source.message(channel, ids[position])
+            if filter is not None and message.photo is None:
+                continue
+            page.append(message)
+            if len(page) == self.page_size:
+                await self._request()
+                for message in page:
+                    yield message
+                returned += len(page)
+                self.stats['messages'] += len(page)
+                page = []
+        if page:
+            await self._request()
+            for message in page:
+                yield message
+            self.stats['messages'] += len(page)
+
+    async def download_media(self, media, file=None):
+        """Return deterministic JPEG bytes for a photo (written to file when it is a path)."""
+        await self._request()
+        self.stats['downloads'] += 1
+        data = synthetic_data.image_bytes(np.random.default_rng(media.id), self.image_size)
+        if file is None or file is bytes:
+            return data
+        with open(file, 'wb') as f:
+            f.write(data)
+        return file
+
+
+def open_client(source=None):
+    """
+    Return a FakeTelegramClient for TELEGRAM_SOURCE, or None when it is 'telegram' and
+    the caller should connect the real client.
+    """
+    source = source or TELEGRAM_SOURCE
+    if source == 'telegram':
+        return None
+    if source == 'synthetic':
+        return FakeTelegramClient(GeneratedSource())
+    if source == 'replay':
+        return FakeTelegramClient(RecordedSource(TELEGRAM_REPLAY_FILE))
+    raise ValueError(f"Unsupported Telegram source: {source}. Use 'telegram', 'synthetic' or 'replay'.")
+
+
+async def record_history(client, channels, path, limit=None):
+    """
+    Write the history of each channel (newest first, at most limit messages) to a
+    JSON-lines file RecordedSource can replay. Photos are recorded by id only.
+
+    Returns:
+        int: Messages recorded.
+    """
+    recorded = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for url in channels:
+            entity = await client.get_entity(url)
+            async for message in client.iter_messages(entity, limit=limit):
+                photo = getattr(message, 'photo', None)
+                f.write(json.dumps({
+                    'channel': channel_username(url),
+                    'title': entity.title,
+                    'id': message.id,
+                    'date': message.date.isoformat(),
+                    'message': message.message,
+                    'views': message.views,
+                    'photo_id': photo.id if photo is not None else None,
+                }) + '\n')
+                recorded += 1
+            logger.info(f'Recorded {url}')
+    return recorded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record Telegram channel histories for offline replay.')
+    parser.add_argument('command', choices=['record'])
+    parser.add_argument('--channels', nargs='+', required=True)
+    parser.add_argument('--limit', type=int, default=None, help='Newest messages per channel (default: all)')
+    parser.add_argument('--output', default=TELEGRAM_REPLAY_FILE)
+    args = parser.parse_args()
+
+    from extract_load_pipeline import start_telegram_client
+
+    async def record():
+        client = await start_telegram_client()
+        if client is None:
+            return
+        try:
+            count = await record_history(client, args.channels, args.output, args.limit)
+            print(f'Recorded {count} messages to {args.output}')
+        finally:
+            await client.disconnect()
+
+    asyncio.run(record())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
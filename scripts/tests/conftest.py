@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+import db_pool
+import extract_load_pipeline
+import partitions
+
+# Scratch schema the PostgreSQL tests create their tables in, ahead of public on the search_path
+SCHEMA = "pipeline_test"
+
+@pytest.fixture
+def postgres(monkeypatch):
+    """
+    The DB_* database with a fresh SCHEMA first on the search_path, and the
+    per-process table caches cleared. Skipped unless TEST_POSTGRES=1.
+    """
+    if os.getenv("TEST_POSTGRES", "").lower() not in ("1", "true", "yes"):
+        pytest.skip("set TEST_POSTGRES=1 to run against the DB_* database")
+    # libpq reads PGOPTIONS for every new connection, pooled or SQLAlchemy
+    monkeypatch.setenv("PGOPTIONS", f"-c search_path={SCHEMA},public")
+    monkeypatch.setattr(extract_load_pipeline, "_created_tables", {})
+    monkeypatch.setattr(partitions, "_partitioned", {})
+    monkeypatch.setattr(partitions, "_months", {})
+    db_pool.close_pool()
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    yield
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    db_pool.close_pool()
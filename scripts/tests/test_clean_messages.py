@@ -0,0 +1,78 @@
+import re
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import benchmark_cleaning
+from clean_messages import MISSING_CONTENT, REQUIRED_COLUMNS, clean_frame, clean_rows, clean_table
+
+COLUMNS = ["id", "channel", "message_id", "content", "message_link", "timestamp", "views"]
+POSTED = datetime(2024, 5, 1, 8, 30, tzinfo=timezone.utc)
+
+def row(id, content="text", **overrides):
+    values = dict(id=id, channel="chemed", message_id=id, content=content,
+                  message_link=f"https://t.me/chemed/{id}", timestamp=POSTED, views=10.0)
+    values.update(overrides)
+    return tuple(values[name] for name in COLUMNS)
+
+def cleaned_content(*contents):
+    return [cleaned[3] for cleaned in clean_rows([row(i, c) for i, c in enumerate(contents, 1)], COLUMNS)]
+
+def test_amharic_and_other_word_characters_are_kept():
+    # The Ethiopic full stop is punctuation; the letters and digits around it are not
+    assert cleaned_content("ፓራሲታሞል 500 ሚግ። ዋጋ", "Vitamin_C Ünïcode", "Ñandú 2x") == [
+        "ፓራሲታሞል 500 ሚግ ዋጋ",
+        "vitamin_c ünïcode",
+        "ñandú 2x",
+    ]
+
+def test_only_the_first_punctuation_mark_is_removed():
+    # REGEXP_REPLACE without the 'g' flag replaces a single match
+    assert cleaned_content("Hello, world!!", "ዋጋ 50 ብር!።", "💊 Paracetamol 💊") == [
+        "hello world!!",
+        "ዋጋ 50 ብር።",
+        "paracetamol 💊",
+    ]
+
+def test_trim_removes_spaces_only():
+    assert cleaned_content("  Amoxicillin  ", "\tTabs\n", "   ", "") == ["amoxicillin", "\ttabs\n", "", ""]
+
+def test_missing_content_is_filled_and_lengths_count_characters():
+    table = clean_table(pa.table(dict(zip(COLUMNS, map(list, zip(row(1, None), row(2, "ዋጋ 50")))))))
+    assert table["content"].to_pylist() == [MISSING_CONTENT, "ዋጋ 50"]
+    assert table["message_length"].to_pylist() == [len(MISSING_CONTENT), 5]
+
+@pytest.mark.parametrize("column", REQUIRED_COLUMNS)
+def test_rows_missing_a_required_column_are_dropped(column):
+    rows = [row(1), row(2, **{column: None}), row(3)]
+    assert [cleaned[0] for cleaned in clean_rows(rows, COLUMNS)] == [1, 3]
+
+def test_rows_come_back_in_column_order_without_message_length():
+    assert clean_rows([], COLUMNS) == []
+    assert clean_rows([row(1, "Hello!")], COLUMNS) == [row(1, "hello")]
+
+def test_clean_frame_handles_missing_values():
+    df = pd.DataFrame([row(1, None), row(2, "OK."), row(3, views=None)], columns=COLUMNS)
+    cleaned = clean_frame(df)
+    assert cleaned["id"].tolist() == [1, 2]
+    assert cleaned["content"].tolist() == [MISSING_CONTENT, "ok"]
+    assert cleaned["message_length"].tolist() == [len(MISSING_CONTENT), 2]
+
+def test_benchmark_sql_is_read_from_the_models():
+    sql = benchmark_cleaning.clean_sql("raw_messages")
+    assert "{{" not in sql and "{%" not in sql
+    assert "FROM raw_messages" in sql
+    assert f"COALESCE(content, '{MISSING_CONTENT}')" in sql
+    for name in REQUIRED_COLUMNS:
+        assert f"{name} IS NOT NULL" in sql
+    # What clean_messages relies on: one replacement (no 'g' flag), then TRIM of spaces
+    assert re.search(r"TRIM\(LOWER\(REGEXP_REPLACE\(COALESCE\(content, '[^']*'\), '\[\^\\w\\s\]', ''\)\)\)", sql)
+    assert "LENGTH(content) AS message_length" in sql
+
+def test_python_cleaning_matches_the_models(postgres):
+    df = benchmark_cleaning.sample_frame(2000, seed=3)
+    cleaned = clean_table(pa.Table.from_pandas(df, preserve_index=False))
+    _, _, sql_rows = benchmark_cleaning.run_sql(df)
+    assert benchmark_cleaning.compare(cleaned, sql_rows) == []
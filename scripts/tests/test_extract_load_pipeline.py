@@ -0,0 +1,235 @@
+import os
+import sys
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+from psycopg2 import sql
+
+import db_pool
+import extract_load_pipeline
+from checkpoints import CheckpointStore
+from telegram_source import FakeTelegramClient, GeneratedSource
+
+FASTAPI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "fastAPI")
+CHANNELS = ["https://t.me/fake_a", "https://t.me/fake_b", "https://t.me/fake_c"]
+MESSAGES = 1000
+
+_sleep = asyncio.sleep
+
+async def no_wait(seconds, *args, **kwargs):
+    # FloodWait recovery sleeps e.seconds + 1; keep the retries but not the waiting
+    return await _sleep(0, *args, **kwargs)
+
+@pytest.fixture
+def delivered(monkeypatch):
+    """Stub the landing and database writes, recording (channel, message_id) per saved chunk."""
+    saved = Counter()
+
+    def save(payload, channel_title, stats=None):
+        if isinstance(payload, pd.DataFrame):
+            ids = payload["message_id"].tolist()
+        else:
+            ids = [row[1] for row in payload]
+        saved.update((channel_title, message_id) for message_id in ids)
+
+    monkeypatch.setattr(extract_load_pipeline, "save_channel_data", save)
+    monkeypatch.setattr(extract_load_pipeline, "save_channel_rows", save)
+    monkeypatch.setattr(extract_load_pipeline, "fetch_chunk_size", 120)
+    monkeypatch.setattr(extract_load_pipeline, "flood_wait_retries", 100)
+    monkeypatch.setattr(asyncio, "sleep", no_wait)
+    return saved
+
+def fake_client(messages=MESSAGES, flood_wait_rate=0.1):
+    return FakeTelegramClient(GeneratedSource(messages_per_channel=messages), latency=0, page_size=50,
+                              flood_wait_rate=flood_wait_rate, flood_wait_seconds=0, seed=7)
+
+def extract(client, checkpoints, mode, stream=False):
+    return asyncio.run(extract_load_pipeline.extract_telegram_data(
+        client, urls=CHANNELS, concurrency=2, mode=mode, checkpoints=checkpoints, stream=stream))
+
+def assert_delivered_once(delivered, first_id, last_id):
+    for url in CHANNELS:
+        title = url.rsplit("/", 1)[-1]
+        ids = sorted(message_id for channel, message_id in delivered if channel == title)
+        assert ids == list(range(first_id, last_id + 1))
+    assert set(delivered.values()) == {1}
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_backfill_delivers_every_message_once_through_flood_waits(delivered, tmp_path, stream):
+    client = fake_client()
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    extract(client, checkpoints, "backfill", stream)
+
+    assert client.stats["flood_waits"] > 0
+    assert_delivered_once(delivered, 1, MESSAGES)
+    for url in CHANNELS:
+        assert checkpoints.get(url) == {"last_message_id": MESSAGES, "oldest_message_id": 1,
+                                        "backfill_complete": True}
+
+    # Incremental runs pick up only messages posted since
+    extract(fake_client(messages=MESSAGES + 130), checkpoints, "incremental", stream)
+    assert_delivered_once(delivered, 1, MESSAGES + 130)
+
+def test_interrupted_run_resumes_from_checkpoint(delivered, monkeypatch, tmp_path):
+    save = extract_load_pipeline.save_channel_data
+    chunks = Counter()
+
+    def failing_save(payload, channel_title, stats=None):
+        # The third chunk of every channel fails, as a failed landing or database write does
+        chunks[channel_title] += 1
+        if chunks[channel_title] == 3:
+            raise RuntimeError(f"Landing write failed for {channel_title}")
+        save(payload, channel_title, stats)
+
+    monkeypatch.setattr(extract_load_pipeline, "save_channel_data", failing_save)
+    path = str(tmp_path / "checkpoints.json")
+    extract(fake_client(), CheckpointStore(path), "backfill")
+
+    # Two chunks per channel, newest first, were written and checkpointed before the failure
+    assert_delivered_once(delivered, MESSAGES - 2 * 120 + 1, MESSAGES)
+    interrupted = CheckpointStore(path)
+    for url in CHANNELS:
+        assert interrupted.get(url) == {"last_message_id": MESSAGES, "oldest_message_id": MESSAGES - 2 * 120 + 1}
+
+    monkeypatch.setattr(extract_load_pipeline, "save_channel_data", save)
+    extract(fake_client(), CheckpointStore(path), "backfill")
+    assert_delivered_once(delivered, 1, MESSAGES)
+    assert all(CheckpointStore(path).get(url)["backfill_complete"] for url in CHANNELS)
+
+class IndexCursor:
+    """Cursor answering the pg_index query of _natural_key with the given column lists."""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return [(columns,) for columns in self.indexes]
+
+def test_natural_key_uses_the_unique_index_that_exists():
+    # Partitioned, or created by the API's create_all
+    cursor = IndexCursor([["id", "timestamp"], ["channel", "message_id", "timestamp"]])
+    assert extract_load_pipeline._natural_key(cursor, "telegram_messages") == ["channel", "message_id", "timestamp"]
+    # Created before partitioning; the narrowest key wins
+    cursor = IndexCursor([["id"], ["channel", "message_id"], ["channel", "message_id", "timestamp"]])
+    assert extract_load_pipeline._natural_key(cursor, "telegram_messages") == ["channel", "message_id"]
+    with pytest.raises(RuntimeError):
+        extract_load_pipeline._natural_key(IndexCursor([["id"], ["channel", "views"]]), "telegram_messages")
+
+def message_row(message_id, timestamp, views=1.0, channel="api_first"):
+    return (channel, message_id, f"message {message_id}", timestamp, views, f"https://t.me/api_first/{message_id}")
+
+def test_load_into_table_created_by_the_api(postgres):
+    sys.path.append(FASTAPI_DIR)
+    from sqlalchemy import create_engine
+    import database
+    import models
+
+    # The API starts first: create_all makes a plain telegram_messages with its own natural-key index
+    engine = create_engine(database.SQLALCHEMY_DATABASE_URL)
+    models.Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    posted = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    rows = [message_row(1, posted), message_row(2, posted)]
+    save = extract_load_pipeline.save_rows_to_database
+    assert save(rows, "telegram_messages") == {"inserted": 2, "updated": 0, "rejected": 0}
+    assert extract_load_pipeline._created_tables["telegram_messages"] == ["channel", "message_id", "timestamp"]
+    assert save(rows, "telegram_messages") == {"inserted": 0, "updated": 2, "rejected": 0}
+
+def render(query):
+    """SQL text of a psycopg2 sql object, without the connection as_string needs."""
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return ".".join('"' + name.replace('"', '""') + '"' for name in query.strings)
+    if isinstance(query, sql.Literal):
+        return repr(query.wrapped)
+    return query
+
+class UpsertCursor:
+    """Cursor recording what _bulk_upsert sends, answering the merge with (inserted, updated)."""
+
+    def __init__(self, merged, moved=0):
+        self.merged = merged
+        self.moved = moved
+        self.statements = []
+        self.copied = None
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        statement = " ".join(render(query).split())
+        self.statements.append(statement)
+        self.rowcount = self.moved if statement.startswith("DELETE") else -1
+
+    def copy_expert(self, query, file, size=8192):
+        self.statements.append(render(query))
+        self.copied = file.read()
+
+    def fetchone(self):
+        return self.merged
+
+def bulk_upsert(monkeypatch, cursor, conflict_columns, rows):
+    monkeypatch.setattr(extract_load_pipeline, "_created_tables", {"telegram_messages": conflict_columns})
+    return extract_load_pipeline._bulk_upsert(cursor, "telegram_messages", rows)
+
+def test_bulk_upsert_splits_inserts_and_updates_on_xmax(monkeypatch):
+    posted = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    rows = [message_row(1, posted), ("api_first", 2, "tab\there\nnewline \\ end", posted, None, None)]
+    cursor = UpsertCursor(merged=(3, 2))
+    assert bulk_upsert(monkeypatch, cursor, ["channel", "message_id"], rows) == (3, 2)
+
+    create, copy, merge = cursor.statements
+    assert create.startswith('CREATE TEMP TABLE IF NOT EXISTS "telegram_messages_stage"')
+    assert copy == ('COPY "telegram_messages_stage" ("channel", "message_id", "content", "timestamp", '
+                    '"views", "message_link") FROM STDIN')
+    assert cursor.copied.splitlines()[1] == f"api_first\t2\ttab\\there\\nnewline \\\\ end\t{posted}\t\\N\t\\N"
+    # Duplicates within the batch collapse to the latest copy before ON CONFLICT sees them
+    assert "SELECT DISTINCT ON (channel, message_id)" in merge
+    assert "ORDER BY channel, message_id, timestamp DESC" in merge
+    assert 'ON CONFLICT ("channel", "message_id") DO UPDATE' in merge
+    assert "RETURNING (xmax = 0) AS inserted" in merge
+
+def test_bulk_upsert_replaces_re_dated_messages_when_timestamp_is_in_the_key(monkeypatch):
+    posted = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    # Two messages came back with a new timestamp: re-inserted by the merge, counted as updates
+    cursor = UpsertCursor(merged=(3, 1), moved=2)
+    rows = [message_row(message_id, posted) for message_id in range(1, 5)]
+    assert bulk_upsert(monkeypatch, cursor, ["channel", "message_id", "timestamp"], rows) == (1, 3)
+
+    delete, merge = cursor.statements[2:]
+    assert delete.startswith('DELETE FROM "telegram_messages" AS target USING "telegram_messages_stage" AS stage')
+    assert "AND target.timestamp <> stage.timestamp" in delete
+    assert 'ON CONFLICT ("channel", "message_id", "timestamp") DO UPDATE' in merge
+
+def test_bulk_upsert_deletes_nothing_without_timestamp_in_the_key(monkeypatch):
+    posted = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    cursor = UpsertCursor(merged=(0, 1), moved=5)
+    assert bulk_upsert(monkeypatch, cursor, ["channel", "message_id"], [message_row(1, posted)]) == (0, 1)
+    assert not any(statement.startswith("DELETE") for statement in cursor.statements)
+
+def stored_messages(table_name):
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT message_id, timestamp, views FROM {} ORDER BY message_id, timestamp")
+                        .format(sql.Identifier(table_name)))
+            return cur.fetchall()
+
+def test_bulk_upsert_on_postgres(postgres):
+    first = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    re_dated = datetime(2024, 6, 2, tzinfo=timezone.utc)
+    save = extract_load_pipeline.save_rows_to_database
+    assert save([message_row(1, first), message_row(2, first)], "messages", mode="bulk") == \
+        {"inserted": 2, "updated": 0, "rejected": 0}
+
+    # Message 1 twice in the batch, the later copy re-dated into another month; message 3 is new
+    rows = [message_row(1, first, views=5.0), message_row(1, re_dated, views=7.0), message_row(3, first)]
+    assert save(rows, "messages", mode="bulk") == {"inserted": 1, "updated": 1, "rejected": 0}
+    assert stored_messages("messages") == [(1, re_dated, 7.0), (2, first, 1.0), (3, first, 1.0)]
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+import partitions
+
+UTC = timezone.utc
+ADDIS_ABABA = timezone(timedelta(hours=3))
+
+def month(year, number):
+    return datetime(year, number, 1, tzinfo=UTC)
+
+def test_month_start_is_the_utc_month():
+    assert partitions.month_start(datetime(2024, 3, 31, 23, 59)) == month(2024, 3)
+    # Midnight on New Year's Day in Addis Ababa is still December in UTC
+    assert partitions.month_start(datetime(2024, 1, 1, 0, 30, tzinfo=ADDIS_ABABA)) == month(2023, 12)
+    assert partitions.month_start(pd.Timestamp("2024-02-29T22:00:00-05:00")) == month(2024, 3)
+
+@pytest.mark.parametrize("count, expected", [(0, month(2024, 1)), (1, month(2024, 2)), (11, month(2024, 12)),
+                                             (12, month(2025, 1)), (-1, month(2023, 12)), (-13, month(2022, 12))])
+def test_add_months_crosses_years(count, expected):
+    assert partitions.add_months(month(2024, 1), count) == expected
+
+def test_months_spanned_fills_the_gaps_across_a_year_boundary():
+    values = [datetime(2024, 2, 10, tzinfo=UTC), datetime(2023, 11, 30, 23, 0, tzinfo=UTC)]
+    assert partitions.months_spanned(values) == [month(2023, 11), month(2023, 12), month(2024, 1), month(2024, 2)]
+
+def test_months_spanned_converts_to_utc_and_ignores_missing_values():
+    values = [None, pd.NaT, float("nan"), datetime(2024, 1, 1, 1, 0, tzinfo=ADDIS_ABABA),
+              pd.Timestamp("2024-01-15", tz="UTC"), datetime(2024, 1, 31, 23, 0, tzinfo=UTC)]
+    assert partitions.months_spanned(values) == [month(2023, 12), month(2024, 1)]
+    # Naive timestamps are taken as UTC
+    assert partitions.months_spanned([datetime(2024, 12, 31, 23, 0), datetime(2025, 1, 1)]) == [
+        month(2024, 12), month(2025, 1)]
+    assert partitions.months_spanned([None, pd.NaT]) == []
+    assert partitions.months_spanned([]) == []
+
+def test_partition_names_round_trip():
+    assert partitions.partition_name("telegram_messages", month(2024, 1)) == "telegram_messages_p2024_01"
+    assert partitions.partition_month("telegram_messages", "telegram_messages_p2024_01") == month(2024, 1)
+    assert partitions.partition_month("yolo_detection_results", "yolo_detection_results_p1999_12") == month(1999, 12)
+
+@pytest.mark.parametrize("name", ["telegram_messages_default", "telegram_messages_p2024_1",
+                                  "telegram_messages_p2024_01_old", "telegram_messages_clean_p2024_01",
+                                  "telegram_messagesXp2024_01"])
+def test_partition_month_rejects_other_tables(name):
+    assert partitions.partition_month("telegram_messages", name) is None
+
+class ArchiveCursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, query, params=None):
+        # Composed of SQL and Identifier parts
+        text = "".join(part.string if hasattr(part, "string") else ".".join(part.strings) for part in query.seq)
+        self.statements.append(" ".join(text.split()))
+
+    def close(self):
+        pass
+
+class ArchiveConnection:
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return ArchiveCursor(self.statements)
+
+    def commit(self):
+        pass
+
+@pytest.fixture
+def archive(monkeypatch):
+    """Run archive_partitions over the given {name: attached} partitions; returns (archived, statements)."""
+    def run(existing, now, retention):
+        conn = ArchiveConnection()
+        monkeypatch.setattr(partitions, "list_partitions", lambda cursor, table: existing)
+        monkeypatch.setattr(partitions, "export_partition",
+                            lambda conn, table, name, month, directory: (10, f"{directory}/{name}.parquet"))
+        archived = partitions.archive_partitions(conn, "telegram_messages", retention=retention,
+                                                 directory="archive", now=now)
+        return [entry["partition"] for entry in archived], conn.statements
+    return run
+
+def test_archive_keeps_the_retention_window_across_a_year_boundary(archive):
+    existing = {"telegram_messages_p2023_11": False, "telegram_messages_p2023_12": True,
+                "telegram_messages_p2024_01": True, "telegram_messages_p2025_01": True}
+    archived, statements = archive(existing, now=datetime(2025, 1, 15, tzinfo=UTC), retention=12)
+    assert archived == ["telegram_messages_p2023_11", "telegram_messages_p2023_12"]
+    # Oldest first; only the attached partition is detached, and both are dropped after export
+    assert statements == [
+        "DROP TABLE telegram_messages_p2023_11",
+        "ALTER TABLE telegram_messages DETACH PARTITION telegram_messages_p2023_12",
+        "DROP TABLE telegram_messages_p2023_12",
+    ]
+
+def test_archive_cutoff_uses_the_utc_month_of_now(archive):
+    existing = {"telegram_messages_p2024_12": True, "telegram_messages_p2025_01": True}
+    # 1 February in Addis Ababa is still 31 January in UTC: January is the current month
+    archived, _ = archive(existing, now=datetime(2025, 2, 1, 1, 0, tzinfo=ADDIS_ABABA), retention=1)
+    assert archived == []
+    archived, _ = archive(existing, now=datetime(2025, 2, 1, 1, 0, tzinfo=UTC), retention=1)
+    assert archived == ["telegram_messages_p2024_12"]
@@ -0,0 +1,100 @@
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+import save_yolo_lable_to_db as loader
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+def test_parse_label_file_skips_lines_without_six_fields(tmp_path):
+    path = write(tmp_path / "101.txt", "0 0.5 0.5 0.1 0.2 0.9\n"
+                                       "1 0.5 0.5 0.1 0.2\n"
+                                       "\n"
+                                       "2 0.5 0.5 0.1 0.2 0.8 extra\n"
+                                       "  3 0.25 0.75 0.5 0.5 0.6  \n")
+    labels = loader.parse_label_file(path)
+    assert labels.shape == (2, len(loader.LABEL_COLUMNS))
+    np.testing.assert_array_equal(labels, [[0, 0.5, 0.5, 0.1, 0.2, 0.9], [3, 0.25, 0.75, 0.5, 0.5, 0.6]])
+
+@pytest.mark.parametrize("text", ["", "\n\n", "0 0.5 0.5\n"])
+def test_parse_label_file_without_detections_is_empty(tmp_path, text):
+    labels = loader.parse_label_file(write(tmp_path / "102.txt", text))
+    assert labels.shape == (0, len(loader.LABEL_COLUMNS))
+
+def test_copy_text_escapes_copy_delimiters():
+    assert loader._copy_text(None) == "\\N"
+    assert loader._copy_text(42) == "42"
+    assert loader._copy_text("a\tb\nc\rd\\e") == "a\\tb\\nc\\rd\\\\e"
+
+def test_source_identity_takes_the_message_id_from_numeric_names():
+    assert loader.source_identity("labels/4521.txt", "chemed", "run13") == "chemed\t4521\t4521\trun13"
+    assert loader.source_identity("/images/4521.jpg", None, None) == "\\N\t4521\t4521\t\\N"
+
+@pytest.mark.parametrize("file_name, image_name", [
+    ("photo_4521.txt", "photo_4521"),
+    ("4521_1.jpg", "4521_1"),
+    ("-12.txt", "-12"),
+    # Digits to str.isdigit, but not to PostgreSQL's integer input
+    ("١٢.txt", "١٢"),
+    ("4521².txt", "4521²"),
+    ("a\tb.txt", "a\\tb"),
+])
+def test_source_identity_without_a_numeric_name_has_no_message_id(file_name, image_name):
+    assert loader.source_identity(file_name, "chemed", "run13") == f"chemed\t\\N\t{image_name}\trun13"
+
+class LoadedFilesCursor:
+    """Cursor answering the loaded_files query from (label_dir, file_name) pairs."""
+
+    def __init__(self, loaded):
+        self.loaded = loaded
+
+    def execute(self, query, params=None):
+        self.label_dirs = params[0]
+
+    def fetchall(self):
+        return [(file_name,) for label_dir, file_name in self.loaded if label_dir in self.label_dirs]
+
+    def close(self):
+        pass
+
+class LoadedFilesConnection:
+    def __init__(self, loaded):
+        self.loaded = loaded
+
+    def cursor(self):
+        return LoadedFilesCursor(self.loaded)
+
+    def commit(self):
+        pass
+
+def test_loaded_files_matches_any_alias():
+    cursor = LoadedFilesCursor([("/data/run1/labels", "a.txt"), ("run1/labels", "b.txt"), ("other", "c.txt")])
+    assert loader.loaded_files(cursor, "/data/run1/labels") == {"a.txt"}
+    assert loader.loaded_files(cursor, "/data/run1/labels", "run1/labels") == {"a.txt", "b.txt"}
+
+def test_load_label_dir_resumes_past_files_recorded_under_either_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("1.txt", "2.txt", "3.txt"):
+        write(tmp_path / "run1" / "labels" / name, "0 0.5 0.5 0.1 0.2 0.9\n")
+    absolute_dir = str(tmp_path / "run1" / "labels")
+    # 1.txt was recorded by an earlier version under the relative path, 2.txt under the absolute one
+    connection = LoadedFilesConnection([("run1/labels", "1.txt"), (absolute_dir, "2.txt")])
+    loads = []
+
+    def copy_detections(conn, label_dir, parsed, channel=None, run_id=None):
+        loads.append((label_dir, [file_name for file_name, _ in parsed], run_id))
+        return sum(len(array) for _, array in parsed)
+
+    monkeypatch.setattr(loader.db_pool, "connection", contextmanager(lambda: (yield connection)))
+    monkeypatch.setattr(loader, "ensure_tables", lambda cur: None)
+    monkeypatch.setattr(loader.partitions, "ensure_current_partitions", lambda conn, table_name: None)
+    monkeypatch.setattr(loader, "copy_detections", copy_detections)
+
+    totals = loader.load_label_dir("./run1/labels/", workers=1)
+    assert loads == [(absolute_dir, ["3.txt"], "run1")]
+    assert (totals["files"], totals["detections"]) == (1, 1)
@@ -0,0 +1,225 @@
+import os
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+import db_pool
+import metrics
+import partitions
+import profiling
+from image_manifest import ImageManifest
+from save_yolo_lable_to_db import ensure_tables, copy_detection_arrays, source_identity
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Model and batching; YOLO_THREADS sets both the torch intra-op threads and the image decoders
+YOLO_WEIGHTS = os.getenv('YOLO_WEIGHTS', 'yolov5s.pt')
+YOLO_BATCH_SIZE = int(os.getenv('YOLO_BATCH_SIZE', '16'))
+YOLO_THREADS = int(os.getenv('YOLO_THREADS', str(os.cpu_count() or 1)))
+YOLO_IMAGE_SIZE = int(os.getenv('YOLO_IMAGE_SIZE', '640'))
+YOLO_CONF_THRESHOLD = float(os.getenv('YOLO_CONF_THRESHOLD', '0.25'))
+
+IMAGE_SAVE_DIR = os.getenv('IMAGE_SAVE_DIR', 'telegram_images')
+IMAGE_MANIFEST = os.getenv('IMAGE_MANIFEST', os.path.join(IMAGE_SAVE_DIR, 'manifest.jsonl'))
+
+
+def load_model(weights=YOLO_WEIGHTS, threads=YOLO_THREADS, conf_threshold=YOLO_CONF_THRESHOLD):
+    """Load a YOLOv5 model for CPU inference."""
+    import torch
+    import yolov5
+
+    torch.set_num_threads(threads)
+    model = yolov5.load(weights, device='cpu')
+    model.conf = conf_threshold
+    return model
+
+
+def load_image(path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return image.convert('RGB')
+
+
+def predict(model, images, image_size=YOLO_IMAGE_SIZE):
+    """
+    Run one batch through the model.
+
+    Returns one (n, 6) array per image in label-file column order
+    (class, x_center, y_center, width, height, confidence), normalised like --save-txt.
+    """
+    results = model(images, size=image_size)
+    # xywhn rows are (x, y, w, h, confidence, class)
+    return [r.cpu().numpy()[:, [5, 0, 1, 2, 3, 4]] for r in results.xywhn]
+
+
+def ensure_scored_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS yolo_scored_images (
+            sha256 TEXT NOT NULL,
+            run_id TEXT NOT NULL,
+            detections INTEGER NOT NULL,
+            scored_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (sha256, run_id)
+        )
+    """)
+
+
+def scored_images(cur, run_id):
+    """Return the content hashes already scored under run_id."""
+    cur.execute("SELECT sha256 FROM yolo_scored_images WHERE run_id = %s", (run_id,))
+    return {row[0] for row in cur.fetchall()}
+
+
+def pending_images(manifest, scored, channels=None):
+    """
+    Group manifest entries by content hash, skipping hashes in scored.
+
+    Returns a list of (sha256, relative path, [(channel_title, message_id), ...]); an
+    image posted in several messages is scored once and its detections are written
+    for every message.
+    """
+    images = {}
+    for entry in manifest.entries():
+        if entry['sha256'] in scored or (channels and entry['channel'] not in channels):
+            continue
+        _, _, messages = images.setdefault(entry['sha256'], (entry['sha256'], entry['path'], []))
+        messages.append((entry.get('channel_title', entry['channel']), entry['message_id']))
+    return list(images.values())
+
+
+def write_batch(conn, batch, predictions, run_id):
+    """COPY one batch of detections and mark its images scored, in one transaction."""
+    started = time.perf_counter()
+    arrays, sources = [], []
+    for (_, _, messages), prediction in zip(batch, predictions):
+        for channel, message_id in messages:
+            arrays.append(prediction)
+            sources.append(source_identity(str(message_id), channel, run_id))
+    cur = conn.cursor()
+    detections = copy_detection_arrays(cur, arrays, sources)
+    execute_values(
+        cur,
+        "INSERT INTO yolo_scored_images (sha256, run_id, detections) VALUES %s "
+        "ON CONFLICT (sha256, run_id) DO NOTHING",
+        [(sha256, run_id, len(prediction)) for (sha256, _, _), prediction in zip(batch, predictions)]
+    )
+    conn.commit()
+    cur.close()
+    metrics.yolo_transaction_seconds.labels('inference').observe(time.perf_counter() - started)
+    metrics.yolo_detections_loaded.labels('inference').inc(detections)
+    return detections
+
+
+def score_images(manifest_file=IMAGE_MANIFEST, save_dir=IMAGE_SAVE_DIR, batch_size=YOLO_BATCH_SIZE,
+                 threads=YOLO_THREADS, weights=YOLO_WEIGHTS, run_id=None, channels=None, model=None):
+    """
+    Run YOLO on every downloaded image that has not been scored under run_id and
+    write the detections straight to yolo_detection_results.
+
+    Images are decoded by a thread pool one batch ahead of inference, and each batch
+    is written with COPY by a single writer thread while the next batch is scored.
+    yolo_scored_images records the content hashes done, so reruns skip them.
+    run_id defaults to the weights file name.
+
+    Returns:
+        dict: Images, detections, elapsed seconds, images/s, detections/s and seconds
+        spent per stage (decode, inference, db).
+    """
+    run_id = run_id or os.path.splitext(os.path.basename(weights))[0]
+    started = time.perf_counter()
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        ensure_tables(cur)
+        ensure_scored_table(cur)
+        conn.commit()
+        scored = scored_images(cur, run_id)
+        cur.close()
+        partitions.ensure_current_partitions(conn, 'yolo_detection_results')
+
+        pending = pending_images(ImageManifest(manifest_file), scored, channels)
+        logger.info(f"{len(pending)} images to score under run {run_id} ({len(scored)} already scored)")
+        totals = {'images': 0, 'detections': 0}
+        stage_seconds = {'decode': 0.0, 'inference': 0.0, 'db': 0.0}
+        if pending:
+            model = model or load_model(weights, threads)
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+        def decode(batch):
+            return [decoder.submit(load_image, os.path.join(save_dir, path)) for _, path, _ in batch]
+
+        def write(batch, predictions):
+            write_started = time.perf_counter()
+            detections = write_batch(conn, batch, predictions, run_id)
+            stage_seconds['db'] += time.perf_counter() - write_started
+            return detections
+
+        with ThreadPoolExecutor(max_workers=threads) as decoder, ThreadPoolExecutor(max_workers=1) as writer:
+            next_images = decode(batches[0]) if batches else None
+            pending_write = None
+            for i, batch in enumerate(batches):
+                stage_started = time.perf_counter()
+                images = [future.result() for future in next_images]
+                stage_seconds['decode'] += time.perf_counter() - stage_started
+                if i + 1 < len(batches):
+                    next_images = decode(batches[i + 1])
+
+                stage_started = time.perf_counter()
+                predictions = predict(model, images)
+                stage_seconds['inference'] += time.perf_counter() - stage_started
+
+                # Keep at most one batch in flight to the database
+                if pending_write is not None:
+                    totals['detections'] += pending_write.result()
+                pending_write = writer.submit(write, batch, predictions)
+                totals['images'] += len(batch)
+            if pending_write is not None:
+                totals['detections'] += pending_write.result()
+
+    elapsed = time.perf_counter() - started
+    totals['seconds'] = round(elapsed, 3)
+    totals['images_per_second'] = round(totals['images'] / elapsed, 1) if elapsed else 0.0
+    totals['detections_per_second'] = round(totals['detections'] / elapsed, 1) if elapsed else 0.0
+    totals['stage_seconds'] = {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()}
+    logger.info(
+        f"Scored {totals['images']} images ({totals['images_per_second']} images/s), "
+        f"{totals['detections']} detections ({totals['detections_per_second']} detections/s) "
+        f"in {totals['seconds']}s; stage seconds {totals['stage_seconds']}"
+    )
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score downloaded Telegram images with YOLO and load the detections.')
+    parser.add_argument('--manifest', default=IMAGE_MANIFEST)
+    parser.add_argument('--image-dir', default=IMAGE_SAVE_DIR)
+    parser.add_argument('--weights', default=YOLO_WEIGHTS)
+    parser.add_argument('--batch-size', type=int, default=YOLO_BATCH_SIZE)
+    parser.add_argument('--threads', type=int, default=YOLO_THREADS)
+    parser.add_argument('--run-id', default=None, help='Detection run identifier (default: weights name)')
+    parser.add_argument('--channels', nargs='+', default=None, help='Only score images from these channels')
+    parser.add_argument('--profile', action='store_true', default=profiling.profile_enabled,
+                        help='Profile the run with cProfile (default: PROFILE)')
+    args = parser.parse_args()
+    metrics.register_pool('yolo_inference', db_pool.pool_status)
+    metrics.start_metrics_server()
+
+    try:
+        with profiling.profiled('yolo_inference', args.profile):
+            score_images(args.manifest, args.image_dir, args.batch_size, args.threads, args.weights,
+                         run_id=args.run_id, channels=args.channels)
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+    finally:
+        db_pool.close_pool()
+
+
+if __name__ == '__main__':
+    main()
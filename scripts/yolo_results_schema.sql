@@ -1,9 +1,54 @@
+-- Partitioned by month on detected_at, the time the detection was loaded; see
+-- telegram_messages_schema.sql for how partitions are created and migrated
 CREATE TABLE IF NOT EXISTS yolo_detection_results (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     class_label INTEGER,
     x_center FLOAT,
     y_center FLOAT,
     width FLOAT,
     height FLOAT,
-    confidence FLOAT
+    confidence FLOAT,
+    detected_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+) PARTITION BY RANGE (detected_at);
+CREATE TABLE IF NOT EXISTS yolo_detection_results_default PARTITION OF yolo_detection_results DEFAULT;
+CREATE UNIQUE INDEX IF NOT EXISTS yolo_detection_results_id_detected_at_key
+    ON yolo_detection_results (id, detected_at);
+
+-- Source image of each detection: Telegram channel and message id (the image file
+-- name written by image_scraper), the image name and the YOLO run that produced it
+ALTER TABLE yolo_detection_results ADD COLUMN IF NOT EXISTS channel TEXT;
+ALTER TABLE yolo_detection_results ADD COLUMN IF NOT EXISTS message_id INTEGER;
+ALTER TABLE yolo_detection_results ADD COLUMN IF NOT EXISTS image_name TEXT;
+ALTER TABLE yolo_detection_results ADD COLUMN IF NOT EXISTS run_id TEXT;
+
+-- Keyset pagination by id within a class
+CREATE INDEX IF NOT EXISTS ix_yolo_detection_results_class_label_id
+    ON yolo_detection_results (class_label, id);
+
+-- Confidence thresholds; the included columns answer "messages containing class Y
+-- above confidence Z" from the index alone. Supersedes the plain (class_label, confidence) index.
+DROP INDEX IF EXISTS ix_yolo_detection_results_class_label_confidence;
+CREATE INDEX IF NOT EXISTS ix_yolo_detection_results_class_label_confidence_message
+    ON yolo_detection_results (class_label, confidence) INCLUDE (channel, message_id);
+
+-- Detections for one Telegram message, in id order
+CREATE INDEX IF NOT EXISTS ix_yolo_detection_results_channel_message_id
+    ON yolo_detection_results (channel, message_id, id);
+
+-- Label files already loaded by save_yolo_lable_to_db.py; reruns skip these files
+CREATE TABLE IF NOT EXISTS yolo_loaded_files (
+    label_dir TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    detections INTEGER NOT NULL,
+    loaded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (label_dir, file_name)
+);
+
+-- Image content hashes already scored by yolo_inference.py, per detection run
+CREATE TABLE IF NOT EXISTS yolo_scored_images (
+    sha256 TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    detections INTEGER NOT NULL,
+    scored_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (sha256, run_id)
 );